@@ -0,0 +1,167 @@
+import time
+import numpy as np
+from scipy import fft as sp_fft
+from scipy import signal
+
+MAX_SPECTRA = 4  # reference spectra cached per reference, one per FFT size in use
+
+
+class AlignEngine:
+    """
+    Cross-correlation alignment restricted to a lag window.
+    The reference spectrum is computed once per FFT size and reused for every
+    degraded signal aligned against the same reference, the MAX_SPECTRA most recently
+    used are kept. With decimate > 1 the lag
+    is first searched on block-averaged signals, then refined at full rate around
+    the coarse peak.
+    """
+    def __init__(self, decimate=1, refine_radius=2, max_spectra=MAX_SPECTRA):
+        self.decimate = max(1, int(decimate))
+        self.refine_radius = refine_radius  # in coarse samples
+        self.max_spectra = max_spectra  # reference spectra kept, least recently used dropped first
+        self.ref = None
+        self._ref_coarse = None
+        self._spectra = {}
+
+    def set_reference(self, ref_signal, spectra=None):
+        """
+        Set the reference signal and drop the cached spectra of the previous one.
+        spectra: optional dict of precomputed reference spectra, filled in place with new FFT sizes.
+        """
+        self.ref = np.asarray(ref_signal, dtype=np.float32)
+        self._ref_coarse = self._block_mean(self.ref, self.decimate) if self.decimate > 1 else None
+        self._spectra = spectra if spectra is not None else {}
+
+    @staticmethod
+    def _block_mean(x, factor):
+        n = len(x) // factor * factor
+        return x[:n].reshape(-1, factor).mean(axis=1)
+
+    def _ref_spectrum(self, ref, nfft, coarse):
+        key = (self.decimate if coarse else 1, nfft)
+        spec = self._spectra.pop(key, None)
+        if spec is None:
+            spec = np.conj(sp_fft.rfft(ref, nfft))
+            while len(self._spectra) >= self.max_spectra:
+                del self._spectra[next(iter(self._spectra))]
+        # insertion order is the recency order
+        self._spectra[key] = spec
+        return spec
+
+    @staticmethod
+    def _fft_size(ref_len, deg_len, min_lag, max_lag):
+        """
+        Smallest FFT size without circular wrap inside the lag window.
+        """
+        # only deg[:len(ref) + max_lag] can overlap the reference inside the window
+        deg_len = min(deg_len, max(ref_len + max_lag, 1))
+        return sp_fft.next_fast_len(max(ref_len + max(max_lag, 0), deg_len + max(-min_lag, 0)), real=True)
+
+    def _fft_search(self, ref, deg, min_lag, max_lag, coarse=False):
+        """
+        Best lag k in [min_lag, max_lag] maximizing sum(deg[n + k] * ref[n]).
+        """
+        deg = deg[:max(len(ref) + max_lag, 1)]
+        nfft = self._fft_size(len(ref), len(deg), min_lag, max_lag)
+        corr = sp_fft.irfft(sp_fft.rfft(deg, nfft) * self._ref_spectrum(ref, nfft, coarse), nfft)
+        lags = np.arange(min_lag, max_lag + 1)
+        return int(lags[np.argmax(corr[lags % nfft])])
+
+    def _direct_search(self, ref, deg, min_lag, max_lag):
+        """
+        Exact correlation over a small lag window.
+        """
+        end = len(ref) + max_lag
+        # deg[min_lag:end], zero outside the signal
+        seg = np.zeros(end - min_lag, dtype=np.float32)
+        src_start, src_end = max(min_lag, 0), min(end, len(deg))
+        seg[src_start - min_lag:src_end - min_lag] = deg[src_start:src_end]
+        corr = np.correlate(seg, ref, mode='valid')
+        return min_lag + int(np.argmax(corr))
+
+    def _lag_window(self, deg_len, min_lag, max_lag):
+        min_lag = -(len(self.ref) - 1) if min_lag is None else max(int(min_lag), -(len(self.ref) - 1))
+        max_lag = deg_len - 1 if max_lag is None else min(int(max_lag), deg_len - 1)
+        return min_lag, max_lag
+
+    def precompute(self, deg_len, min_lag=None, max_lag=None):
+        """
+        Compute the reference spectrum find_offset() uses for a degraded signal of deg_len
+        samples, e.g. to share the spectra with worker processes before they search.
+        """
+        min_lag, max_lag = self._lag_window(deg_len, min_lag, max_lag)
+        if min_lag > max_lag:
+            return
+        d = self.decimate
+        if d == 1 or len(self.ref) < 64 * d:
+            self._ref_spectrum(self.ref, self._fft_size(len(self.ref), deg_len, min_lag, max_lag), False)
+        else:
+            nfft = self._fft_size(len(self._ref_coarse), deg_len // d, min_lag // d, max(max_lag // d, min_lag // d))
+            self._ref_spectrum(self._ref_coarse, nfft, True)
+
+    def find_offset(self, deg_signal, min_lag=None, max_lag=None, ref_signal=None):
+        """
+        Offset in samples of the reference inside the degraded signal, searched in
+        [min_lag, max_lag]. Defaults to every lag with some overlap, like a full correlation.
+        """
+        if ref_signal is not None and ref_signal is not self.ref:
+            self.set_reference(ref_signal)
+        ref = self.ref
+        deg = np.asarray(deg_signal, dtype=np.float32)
+        min_lag, max_lag = self._lag_window(len(deg), min_lag, max_lag)
+        if min_lag > max_lag:
+            raise ValueError(f"Empty lag window [{min_lag}, {max_lag}]")
+        d = self.decimate
+        if d == 1 or len(ref) < 64 * d:
+            return self._fft_search(ref, deg, min_lag, max_lag)
+        coarse = self._fft_search(self._ref_coarse, self._block_mean(deg, d),
+                                  min_lag // d, max(max_lag // d, min_lag // d), coarse=True)
+        lo = max(min_lag, (coarse - self.refine_radius) * d)
+        hi = min(max_lag, (coarse + self.refine_radius) * d)
+        return self._direct_search(ref, deg, lo, max(lo, hi))
+
+
+def _legacy_offset(ref_signal, deg_signal):
+    """
+    Full-length correlation as used before the alignment engine, for benchmarking.
+    """
+    corr = signal.correlate(deg_signal, ref_signal, mode='full')
+    return int(np.argmax(corr)) - (len(ref_signal) - 1)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark bounded FFT alignment against full cross-correlation')
+    parser.add_argument("-d", "--durations", type=float, nargs='+', default=[10, 60, 600],
+                        help="Reference durations in seconds")
+    parser.add_argument("-r", "--rate", type=int, default=16000, help="Sample rate")
+    parser.add_argument("-n", "--files", type=int, default=5, help="Degraded signals per reference")
+    parser.add_argument("--decimate", type=int, default=8, help="Decimation factor of the coarse-to-fine search")
+    parser.add_argument("--tor", type=float, default=1.0, help="Alignment tolerance in seconds")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    b, a = signal.butter(4, 3000, fs=args.rate)
+    for dur in args.durations:
+        n = int(dur * args.rate)
+        ref = signal.lfilter(b, a, rng.normal(0, 3000, n)).astype(np.float32)
+        degs = []
+        for _ in range(args.files):
+            delay = int(rng.uniform(0, 3) * args.rate)
+            deg = np.concatenate([rng.normal(0, 30, delay), 0.5 * ref, rng.normal(0, 30, args.rate)])
+            degs.append((delay, (deg + rng.normal(0, 300, len(deg))).astype(np.float32)))
+        tor = int(args.tor * args.rate)
+        results = {}
+        for name, engine in [("full", None), ("bounded", AlignEngine()), ("coarse", AlignEngine(args.decimate))]:
+            t0 = time.perf_counter()
+            ok = True
+            for delay, deg in degs:
+                if engine is None:
+                    offset = _legacy_offset(ref, deg)
+                else:
+                    offset = engine.find_offset(deg, -2 * tor, len(deg) - len(ref) + tor, ref_signal=ref)
+                ok &= offset == delay
+            results[name] = (time.perf_counter() - t0, ok)
+        base = results["full"][0]
+        print(f"[BENCH]: {dur:>5.0f}s x{args.files} files: " + ", ".join(
+            f"{k} {t * 1000:.0f} ms (x{base / t:.1f}, {'ok' if ok else 'MISMATCH'})" for k, (t, ok) in results.items()))
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+try:
+    import fcntl
+except ImportError:  # no advisory file locks (Windows), the merge alone narrows the race
+    fcntl = None
+
+
+def save_manifest_merged(path, manifest, saved):
+    """
+    Write manifest ({section: {key: value}}) as JSON to path, merged with the file's current
+    content under an exclusive lock: only the keys this process changed or removed since
+    saved (what it last read or wrote) replace those of the file, so processes sharing the
+    file keep each other's entries. Returns the merged manifest, the new saved state.
+    """
+    with open(path + ".lock", 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with open(path, 'r', encoding="utf-8") as f:
+                merged = json.load(f)
+        except (FileNotFoundError, ValueError):
+            merged = {}
+        for section, values in manifest.items():
+            old = saved.get(section, {})
+            current = merged.setdefault(section, {})
+            for key, value in values.items():
+                if key not in old or old[key] != value:
+                    current[key] = value
+            for key in old.keys() - values.keys():
+                current.pop(key, None)
+        text = json.dumps(merged)
+        # unique per process, fleet workers share the cache folder
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    return json.loads(text)
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache for analysis results.
+    Entries are keyed by the sha256 of the input files plus the analysis parameters,
+    so a re-recorded file with the same name is always recomputed. A manifest index
+    tracks entry sizes and access times, and the least recently used entries are
+    evicted once the cache grows above max_bytes.
+    """
+    def __init__(self, cache_dir="./cache/", max_bytes=2 * 1024**3):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.manifest = {"entries": {}, "digests": {}}
+        self._saved = {}  # manifest as last read or written, the base of the merge on save
+        self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.manifest["entries"] = manifest.get("entries", {})
+            self.manifest["digests"] = manifest.get("digests", {})
+            self._saved = json.loads(json.dumps(self.manifest))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[WARN]: Cache manifest {self.manifest_path} is unreadable, starting empty: {e}")
+
+    def _save_manifest(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # fleet workers share the cache folder, keep the entries they added meanwhile
+        merged = save_manifest_merged(self.manifest_path, self.manifest, self._saved)
+        self.manifest["entries"] = merged.get("entries", {})
+        self.manifest["digests"] = merged.get("digests", {})
+        self._saved = json.loads(json.dumps(self.manifest))
+
+    def file_digest(self, path):
+        """
+        sha256 of a file's content, memoized by (path, size, mtime).
+        """
+        st = os.stat(path)
+        memo_key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+        with self.lock:
+            digest = self.manifest["digests"].get(memo_key)
+        if digest:
+            return digest
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(block)
+        digest = h.hexdigest()
+        with self.lock:
+            # drop digests of older versions of the same file
+            prefix = os.path.abspath(path) + "|"
+            for k in [k for k in self.manifest["digests"] if k.startswith(prefix)]:
+                del self.manifest["digests"][k]
+            self.manifest["digests"][memo_key] = digest
+            self._save_manifest()
+        return digest
+
+    def make_key(self, kind, inputs=(), **params):
+        """
+        Build a cache key from the analysis kind, the content of the input files
+        and the analysis parameters.
+        """
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        desc = {
+            "kind": kind,
+            "inputs": [self.file_digest(path) for path in inputs],
+            "params": params,
+        }
+        return hashlib.sha256(json.dumps(desc, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _object_path(self, key, suffix=""):
+        return os.path.join(self.objects_dir, key[:2], key + suffix)
+
+    def _touch(self, key):
+        entry = self.manifest["entries"].get(key)
+        if entry is None:
+            return None
+        path = os.path.join(self.cache_dir, entry["path"])
+        if not os.path.exists(path):
+            del self.manifest["entries"][key]
+            self._save_manifest()
+            return None
+        entry["last_access"] = time.time()
+        self._save_manifest()
+        return path
+
+    def _add_entry(self, key, path, kind):
+        self.manifest["entries"][key] = {
+            "path": os.path.relpath(path, self.cache_dir),
+            "kind": kind,
+            "size": os.path.getsize(path),
+            "created": time.time(),
+            "last_access": time.time(),
+        }
+        self._evict()
+        self._save_manifest()
+
+    def get_json(self, key):
+        """
+        Return the cached JSON value for key, or None.
+        """
+        with self.lock:
+            path = self._touch(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'r', encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[WARN]: Failed to read cache entry {key}: {e}")
+            return None
+
+    def put_json(self, key, value):
+        path = self._object_path(key, ".json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding="utf-8") as f:
+            json.dump(value, f)
+        with self.lock:
+            self._add_entry(key, path, "json")
+        return value
+
+    def get_file(self, key):
+        """
+        Return the path of the cached file for key, or None.
+        """
+        with self.lock:
+            return self._touch(key)
+
+    def put_file(self, key, src_path, move=False):
+        """
+        Store a file in the cache and return its cached path.
+        """
+        path = self._object_path(key, os.path.splitext(src_path)[1])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if move:
+            shutil.move(src_path, path)
+        else:
+            shutil.copyfile(src_path, path)
+        with self.lock:
+            self._add_entry(key, path, "file")
+        return path
+
+    def artifact_key(self, key, index):
+        """
+        Key of the index-th output file (plot, csv) of the analysis cached under key.
+        """
+        return hashlib.sha256(f"{key}|artifact|{index}".encode("utf-8")).hexdigest()
+
+    def put_artifacts(self, key, paths):
+        """
+        Store the output files of an analysis, restore_artifacts() copies them back on a hit.
+        """
+        for i, path in enumerate(paths):
+            self.put_file(self.artifact_key(key, i), path)
+
+    def restore_artifacts(self, key, paths):
+        """
+        Copy the cached output files of the analysis under key to paths.
+        Returns False without copying anything if one of them is not cached.
+        """
+        cached = [self.get_file(self.artifact_key(key, i)) for i in range(len(paths))]
+        if not all(cached):
+            return False
+        for src, dst in zip(cached, paths):
+            os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+            shutil.copyfile(src, dst)
+        return True
+
+    def total_size(self):
+        return sum(entry["size"] for entry in self.manifest["entries"].values())
+
+    def _evict(self):
+        total = self.total_size()
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(self.manifest["entries"].items(), key=lambda item: item[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, entry["path"]))
+            except FileNotFoundError:
+                pass
+            total -= entry["size"]
+            del self.manifest["entries"][key]
+            print(f"[INFO]: Evicted cache entry {key[:12]} ({entry['kind']}, {entry['size']} bytes)")
+
+    def clear(self):
+        with self.lock:
+            if os.path.exists(self.objects_dir):
+                shutil.rmtree(self.objects_dir)
+            # the objects of other writers are gone too, reload so the merge drops their entries
+            self._load_manifest()
+            self.manifest = {"entries": {}, "digests": {}}
+            self._save_manifest()
@@ -0,0 +1,236 @@
+import time
+import uuid
+import shlex
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 8            # threads for blocking calls (channel setup, transfers, audio helpers)
+RECV_BYTES = 65536
+
+
+class RemoteProcess:
+    """
+    One remote command on its own exec channel, read from the event loop without a thread.
+    The command is exec'ed behind a shell that reports its pid first, so cancelling or
+    timing out kills it on the device instead of leaving it running.
+    """
+    def __init__(self, executor, channel, marker):
+        self.executor = executor
+        self.channel = channel
+        self.marker = marker
+        self.pid = None
+        self.exit_status = None
+        self._err = b""
+        self._event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(channel.fileno(), self._event.set)
+
+    def _read_stderr(self):
+        while self.channel.recv_stderr_ready():
+            self._err += self.channel.recv_stderr(RECV_BYTES)
+        if self.pid is None:
+            idx = self._err.find(b"\n")
+            if self._err.startswith(self.marker) and idx >= 0:
+                self.pid = int(self._err[len(self.marker):idx])
+                self._err = self._err[idx + 1:]
+
+    async def chunks(self):
+        """
+        Async iterator over stdout data as it arrives, ends at EOF.
+        """
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            self._read_stderr()
+            while self.channel.recv_ready():
+                data = self.channel.recv(RECV_BYTES)
+                if data:
+                    yield data
+            if (self.channel.eof_received or self.channel.closed) and not self.channel.recv_ready():
+                self._read_stderr()
+                return
+
+    @property
+    def stderr(self):
+        return self._err
+
+    async def wait(self):
+        if self.exit_status is None:
+            self.exit_status = await self._loop.run_in_executor(self.executor.pool, self.channel.recv_exit_status)
+        return self.exit_status
+
+    def close(self, kill=False):
+        """
+        Release the channel, kill the remote command first if it may still be running.
+        """
+        self._loop.remove_reader(self.channel.fileno())
+        if kill and self.pid is not None and not self.channel.exit_status_ready():
+            # fire and forget, the caller is being cancelled
+            self._loop.run_in_executor(self.executor.pool, self.executor.ssh_client.execute_command,
+                                       f"pkill -TERM -P {self.pid}; kill -TERM {self.pid}")
+        self.channel.close()
+
+
+class AsyncSSH:
+    """
+    asyncio front end for one SSHClient connection.
+    execute/stream run each command on its own channel read by the event loop, so any
+    number of them overlap on the shared transport and can be cancelled or timed out
+    (the remote command is killed). upload/download and other blocking helpers
+    (AudioModule play/record...) run in a thread pool behind awaitables.
+    Synchronous callers (UI, test scripts) can start() a background loop and submit()
+    coroutines to get concurrent.futures.Future objects.
+    """
+    def __init__(self, ssh_client, max_workers=MAX_WORKERS):
+        self.ssh_client = ssh_client
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="async_ssh")
+        # scp client of the connection is not safe to share between threads
+        self._scp_lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    async def call(self, func, *args, timeout=None, **kwargs):
+        """
+        Run a blocking function in the pool. On timeout or cancellation the awaiting
+        task stops waiting, the call itself runs to completion in its thread.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.pool, lambda: func(*args, **kwargs))
+        return await asyncio.wait_for(future, timeout)
+
+    async def _open(self, command):
+        marker = f"__pid_{uuid.uuid4().hex}__".encode()
+        wrapped = f"echo {marker.decode()}$$ >&2; exec sh -c {shlex.quote(command)}"
+
+        def open_channel():
+            channel = self.ssh_client.client.get_transport().open_session()
+            channel.exec_command(wrapped)
+            return channel
+        channel = await asyncio.get_running_loop().run_in_executor(self.pool, open_channel)
+        return RemoteProcess(self, channel, marker)
+
+    async def execute(self, command, timeout=None):
+        """
+        Run a remote command, returns (output, error, exit_status) with decoded output/error.
+        Raises asyncio.TimeoutError after timeout seconds, the remote command is killed.
+        """
+        return await asyncio.wait_for(self._execute(command), timeout)
+
+    async def _execute(self, command):
+        proc = await self._open(command)
+        finished = False
+        try:
+            output = b"".join([data async for data in proc.chunks()])
+            status = await proc.wait()
+            finished = True
+        finally:
+            proc.close(kill=not finished)
+        return output.decode("utf-8", "replace"), proc.stderr.decode("utf-8", "replace"), status
+
+    async def stream(self, command, timeout=None):
+        """
+        Async iterator over the stdout lines of a long running command (e.g. `tail -f`).
+        Leaving the loop, cancelling the consumer or reaching timeout (asyncio.TimeoutError)
+        kills the command.
+        """
+        proc = await self._open(command)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pending = b""
+        chunks = proc.chunks()
+        try:
+            while True:
+                remaining = None if deadline is None else max(0, deadline - time.monotonic())
+                try:
+                    data = await asyncio.wait_for(chunks.__anext__(), remaining)
+                except StopAsyncIteration:
+                    break
+                pending += data
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    yield line.decode("utf-8", "replace")
+            if pending:
+                yield pending.decode("utf-8", "replace")
+        finally:
+            await chunks.aclose()
+            proc.close(kill=True)
+
+    def _locked_transfer(self, func, *args):
+        with self._scp_lock:
+            return func(*args)
+
+    async def upload(self, local_path, remote_path, timeout=None):
+        """
+        SSHClient.upload_file in the pool, transfers are serialized on the connection's scp client.
+        """
+        return await self.call(self._locked_transfer, self.ssh_client.upload_file, local_path, remote_path,
+                               timeout=timeout)
+
+    async def download(self, remote_path, local_path, compress=None, timeout=None):
+        """
+        SSHClient.download_file in the pool, transfers are serialized on the connection's scp client.
+        """
+        return await self.call(self._locked_transfer, self.ssh_client.download_file, remote_path, local_path,
+                               compress, timeout=timeout)
+
+    def start(self):
+        """
+        Run an event loop in a background thread for submit().
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine (e.g. self.execute(...)) on the background loop from any thread,
+        returns a concurrent.futures.Future; Future.cancel() cancels the coroutine.
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+        # lets pending kills of cancelled commands reach the device
+        self.pool.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    import argparse
+    from ssh_client import SSHClient
+    parser = argparse.ArgumentParser(description='Overlap remote commands on one connection')
+    parser.add_argument("--host", type=str, default="192.168.50.140", help="Remote host")
+    parser.add_argument("-u", "--user", type=str, default="root", help="SSH user name")
+    parser.add_argument("-p", "--password", type=str, default="test0000", help="SSH password")
+    parser.add_argument("-n", "--count", type=int, default=8, help="Concurrent commands")
+    parser.add_argument("-s", "--sleep", type=float, default=1.0, help="Seconds each command sleeps")
+    args = parser.parse_args()
+
+    ssh_client = SSHClient(hostname=args.host, username=args.user, password=args.password)
+    if ssh_client.connect():
+        executor = AsyncSSH(ssh_client)
+
+        async def bench():
+            command = f"sleep {args.sleep}; echo done"
+            t0 = time.perf_counter()
+            for _ in range(args.count):
+                ssh_client.run_command(command)
+            t_serial = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            await asyncio.gather(*[executor.execute(command) for _ in range(args.count)])
+            t_async = time.perf_counter() - t0
+            print(f"[BENCH]: {args.count} x '{command}': blocking {t_serial:.2f}s, async {t_async:.2f}s")
+            t0 = time.perf_counter()
+            try:
+                await executor.execute("sleep 30", timeout=0.5)
+            except asyncio.TimeoutError:
+                print(f"[BENCH]: timeout of 'sleep 30' returned after {time.perf_counter() - t0:.2f}s")
+        asyncio.run(bench())
+        executor.close()
+        ssh_client.close()
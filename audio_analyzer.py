@@ -2,11 +2,13 @@ from ssh_client import SSHClient
 import re
 import os
 import numpy as np
-import wave
 import matplotlib.pyplot as plt
-import soundfile as sf
 from pesq_score import PesqScore
-from pydub import AudioSegment
+from tabulate import tabulate
+from wav_io import WavReader
+from analysis_cache import AnalysisCache
+from spectrum_engine import welch_file, DEFAULT_RESOLUTION_HZ
+from doa_engine import decode_ssl_angles, summarize_doa_stream, DoaPlotTrace, DoaRecordWriter, BLOCK_DIVIDE_THRESH, BLOCK_MIN_SIZE
 
 
 class AudioAnalyzer:
@@ -14,7 +16,12 @@ class AudioAnalyzer:
         self.audio_module = audio_module
         self.ssh_client = None
         self.pesq_analyzer = PesqScore()  
+        self.cache = AnalysisCache(self.pesq_analyzer.cache_dir)
         self.default_analyze_sec = 10 # Default analyze duration in seconds
+        self.spectrum_resolution_hz = DEFAULT_RESOLUTION_HZ  # PSD bin width of spectrum analysis
+        self.spectrogram_sec = None  # spectrogram column length in seconds, None to skip the spectrogram
+        self.output_dir = "./records/"  # where DOA records and plots are written
+        self.doa_records = []  # DOA blocks of the last DOA analysis
 
     def set_ssh_connect(self, ssh_client: SSHClient):
         """
@@ -88,13 +95,7 @@ class AudioAnalyzer:
             print("[ERR]: SSH client is not connected.")
             return False
         src_base_name = os.path.basename(src_audio)
-        # Check if the SSL file already exists locally
-        local_ssl_file_name = f"./cache/ssl_{src_base_name}"
-        if os.path.exists(local_ssl_file_name):
-            print(f"[INFO]: SSL file {local_ssl_file_name} already exists. Skipping analysis.")
-            return self.doa_file_analyzing(local_ssl_file_name)
-        
-        # Not exists, proceed on remote server
+        ssl_name = f"ssl_{src_base_name}"
         remote_audio_path, local_audio_path = self.audio_module.check_and_sync_file(src_audio)
         if remote_audio_path is None:
             print(f"[ERR]: Audio file {src_base_name} does not exist on the remote server.")
@@ -103,10 +104,21 @@ class AudioAnalyzer:
         try:
             remote_config_file_path = "/etc/vibe/dsp/cras_audio_bot.cfg"
             remote_config_file_test_path = "/tmp/cras_audio_bot_test.cfg"
-            if not self.ssh_client.file_exists(remote_config_file_path):
+            # existence of both config files and the hash of the current one in one round trip
+            config_stats = self.ssh_client.stat_many([remote_config_file_path, remote_config_file_test_path],
+                                                     with_hash=True)
+            if not config_stats[remote_config_file_path]["is_file"]:
                 print(f"[ERR]: Configuration file {remote_config_file_path} does not exist on the remote server.")
                 return False
-            if not self.ssh_client.file_exists(remote_config_file_test_path):
+            # Reuse the SSL file if the same source content was analyzed with the same remote config
+            remote_config_hash = config_stats[remote_config_file_path]["sha256"]
+            ssl_key = self.cache.make_key("ssl", [local_audio_path], channels=self.audio_module.channels,
+                                          remote_config=remote_config_hash, host=self.ssh_client.hostname)
+            cached_ssl_file = self.cache.get_file(ssl_key)
+            if cached_ssl_file:
+                print(f"[INFO]: SSL file of {src_base_name} found in cache. Skipping remote analysis.")
+                return self.doa_file_analyzing(cached_ssl_file, name=ssl_name)
+            if not config_stats[remote_config_file_test_path]["is_file"]:
                 # Download the configuration file from the remote server
                 config_file_path = "/tmp/cras_audio_bot.cfg"
                 self.ssh_client.download_file(remote_config_file_path, config_file_path)
@@ -139,129 +151,76 @@ class AudioAnalyzer:
                 print(f"[ERR]: No SSL file found in /tmp after cras_api_file_test.")
                 return False
             
+            local_ssl_file_name = os.path.join(self.cache.cache_dir, f"{self.ssh_client.hostname}_{ssl_name}")
             self.ssh_client.download_file(remote_ssl_file_path, local_ssl_file_name)
+            local_ssl_file_name = self.cache.put_file(ssl_key, local_ssl_file_name, move=True)
             print(f"[INFO]: DOA analysis Stage1 completed. SSL file saved at {local_ssl_file_name}.")
-            return self.doa_file_analyzing(local_ssl_file_name)
+            return self.doa_file_analyzing(local_ssl_file_name, name=ssl_name)
             
         except Exception as e:
             print(f"[ERR]: Failed to analyze audio file {src_audio}: {e}")
             return False
         
-    def doa_file_analyzing(self, ssl_file):
+    def doa_file_analyzing(self, ssl_file, name=None):
         if not os.path.exists(ssl_file):
             print(f"[ERR]: SSL file {ssl_file} does not exist.")
             return False
-        # Step 1: extract the 7th channel from the SSL file
-        ssl_base_name = os.path.basename(ssl_file)
-        ssl_channel_file = f"./cache/chn_{ssl_base_name}"
+        # Step 1: extract the last channel from the SSL file
+        ssl_base_name = name if name else os.path.basename(ssl_file)
         chns = self.audio_module.channels
         ssl_chn = chns - 1  # Last channel as SSL channel
-
-        if os.path.exists(ssl_channel_file):
-            print(f"[INFO]: SSL channel file {ssl_channel_file} already exists. Skipping extraction.")
+        doa_record_file = os.path.join(self.output_dir, f"doa_blocks_{os.path.splitext(ssl_base_name)[0]}.csv")
+        waveform_file = os.path.join(self.output_dir, f"waveform_{ssl_base_name}.png")
+        doa_key = self.cache.make_key("doa", [ssl_file], ssl_chn=ssl_chn, rate=16000,
+                                      block_divide_thresh=BLOCK_DIVIDE_THRESH, block_min_size=BLOCK_MIN_SIZE,
+                                      fields=DoaRecordWriter.fields)
+        cached = self.cache.get_json(doa_key)
+        # outputs are named after the file, restore this content's copies over any same-named leftovers
+        if cached and self.cache.restore_artifacts(doa_key, [doa_record_file, waveform_file]):
+            print(f"[INFO]: DOA results of {ssl_base_name} found in cache, records at {doa_record_file}.")
+            self.doa_records = cached["records"]
+            for record in cached["records"]:
+                print(f"[INFO]: DOA Position {record['block']}: Dur: {record['duration']:.2f}s, AVE: {record['average']:.2f}, STD: {record['std']:.2f}, Pol-Diff: {record['pole_diff']:.2f}")
             return True
-            
-        try:
-            # 加载多通道音频（必须是 .wav 且格式支持）
-            audio = AudioSegment.from_file(ssl_file)
-            if audio.channels < chns:
-                print(f"[ERR]: File only has {audio.channels} channels, expected at least {chns}")
-                return False
-
-            # 分离出各个通道
-            split_channels = audio.split_to_mono()
-
-            if ssl_chn >= len(split_channels):
-                print(f"[ERR]: Cannot extract channel {ssl_chn}, only {len(split_channels)} available.")
-                return False
-
-            # 获取目标通道并转换采样率
-            target_channel = split_channels[ssl_chn].set_frame_rate(16000)
-
-            # 确保目录存在
-            os.makedirs(os.path.dirname(ssl_channel_file), exist_ok=True)
-
-            # 导出目标通道为 WAV
-            target_channel.export(ssl_channel_file, format="wav")
-
-
-            # Step 2: read the extracted channel audio file and recover the angle
-            audio_np, sample_rate = sf.read(ssl_channel_file, dtype='float32')
-            if len(audio_np) < sample_rate:
-                print(f"[ERR]: Audio too short, less than 1 second.")
-                return False
-            def normalize_angle(angle_f):
-                """
-                Normalize the angle to be within [0, 360) degrees.
-                """
-                angle_f = angle_f / 0.95
-                norm_angle = (angle_f * 180) % 360
-                return norm_angle
-            
-            for i in range(len(audio_np)):
-                if np.abs(audio_np[i]) > 0.95:
-                    audio_np[i] = -50  # <=-50 angle for invalid data
-                else:
-                    audio_np[i] = normalize_angle(audio_np[i])
-
-            # Step 3: process the audio for DOA analysis
-            doa_block = []
-            doa_data = []
-            doa_idx = []
-            valid_cnt = 0
-            invalid_cnt = 0
 
-            
-            block_divide_thresh = 8000  # 0.5 seconds at 16kHz
-            block_min_size = 1600 # 0.1 seconds at 16kHz
-            for i in range(len(audio_np)):
-                if audio_np[i] >= 0.0:
-                    doa_data.append(audio_np[i])
-                    doa_idx.append(i)
-                    valid_cnt += 1
-                    invalid_cnt = 0
-                else:
-                    invalid_cnt += 1
-                    if invalid_cnt > block_divide_thresh or i == len(audio_np) - 1:
-                        if valid_cnt > block_min_size:
-                            doa_block.append(doa_data)
-                        doa_data = []
-                        valid_cnt = 0   
-                        invalid_cnt = 0
-            print(f"[INFO]: DOA analysis Stage2 completed. Found {len(doa_block)} valid blocks.")
-            for i in range(len(doa_block)):
-                duartion = len(doa_block[i]) / sample_rate
-                min_angle = np.min(doa_block[i])
-                max_angle = np.max(doa_block[i])
-                pole_diff = max_angle - min_angle
-                if pole_diff > 180: #crossing circle point
-                    # Adjust angles to avoid crossing the 0/360 degree point
-                    mid = (min_angle + max_angle) / 2
-                    for j in range(len(doa_block[i])):
-                        if doa_block[i][j] > mid:
-                            doa_block[i][j] -= 360
-                    pole_diff = np.max(doa_block[i]) - np.min(doa_block[i])
-                average = np.mean(doa_block[i])
-                std = np.std(doa_block[i])
-                print(f"[INFO]: DOA Position {i}: Dur: {duartion:.2f}s, AVE: {average:.2f}, STD: {std:.2f}, Pol-Diff: {pole_diff:.2f}")
+        try:
+            # Step 2: stream the angle channel at 16kHz, the blocks are summarized and the
+            # plot trace decimated in one pass, 10 seconds at a time
+            sample_rate = 16000
+            os.makedirs(self.output_dir, exist_ok=True)
+            with WavReader(ssl_file) as reader:
+                if reader.channels < chns:
+                    print(f"[ERR]: File only has {reader.channels} channels, expected at least {chns}")
+                    return False
+                total = -(-reader.n_frames * sample_rate // reader.sample_rate)
+                if total < sample_rate:
+                    print(f"[ERR]: Audio too short, less than 1 second.")
+                    return False
+                # Step 3: decode angles and summarize the DOA blocks as they close
+                trace = DoaPlotTrace(total)
+                chunks = (decode_ssl_angles(chunk)
+                          for chunk in reader.iter_channel(ssl_chn, 10 * reader.sample_rate, sample_rate))
+                doa_records = summarize_doa_stream(chunks, sample_rate, doa_record_file, BLOCK_DIVIDE_THRESH,
+                                                   BLOCK_MIN_SIZE, plot_trace=trace)
+            self.doa_records = doa_records
+            print(f"[INFO]: DOA analysis Stage2 completed. Found {len(doa_records)} valid blocks, records saved at {doa_record_file}.")
+            for record in doa_records:
+                print(f"[INFO]: DOA Position {record['block']}: Dur: {record['duration']:.2f}s, AVE: {record['average']:.2f}, STD: {record['std']:.2f}, Pol-Diff: {record['pole_diff']:.2f}")
+            y_time, audio_np = trace.index / sample_rate, trace.angles
 
             # plot the audio waveform with matplotlib
-            offset = 0
-            for i in range(len(doa_block)):
-                for j in range(len(doa_block[i])):
-                    audio_np[doa_idx[offset + j]] = doa_block[i][j]
-                offset += len(doa_block[i])
             plt.figure(figsize=(10, 4))
-            y_time = np.arange(len(audio_np)) / sample_rate
             plt.plot(y_time, audio_np, color='blue')
-            plt.title(f"Audio Waveform - {ssl_channel_file}")
+            plt.title(f"Audio Waveform - {ssl_file}")
             plt.xlabel("Time (seconds)")
             plt.ylabel("Angle (degrees)")
             plt.text(0.5, 0.95, f"Note: <=-50 angle for invalid data", transform=plt.gca().transAxes, fontsize=10, color='red', ha='center')
             plt.grid()
-            plt.savefig(f"./records/waveform_{ssl_base_name}.png")
+            plt.savefig(waveform_file)
             plt.close()
-            
+
+            self.cache.put_artifacts(doa_key, [doa_record_file, waveform_file])
+            self.cache.put_json(doa_key, {"records": doa_records})
             return True
 
         except Exception as e:
@@ -277,8 +236,7 @@ class AudioAnalyzer:
             return False
         
         try:
-            self.pesq_analyzer.pesq_calc(ref_audio, target_audio)
-            return True
+            return self._cached_scores("PESQ", self.pesq_analyzer.pesq_calc, ref_audio, target_audio)
         except Exception as e:
             print(f"[ERR]: Failed to analyze audio file with PESQ: {e}")
             return False
@@ -292,12 +250,39 @@ class AudioAnalyzer:
             return False
         
         try:
-            self.pesq_analyzer.snr_calc(ref_audio, target_audio)
-            return True
+            return self._cached_scores("SNR", self.pesq_analyzer.snr_calc, ref_audio, target_audio)
         except Exception as e:
             print(f"[ERR]: Failed to analyze audio file with SNR: {e}")
             return False
         
+    def _cached_scores(self, method, calc, ref_audio, target_audio):
+        """
+        Run a PesqScore batch calculation, reusing the results of unchanged reference/target files.
+        """
+        deg_list = PesqScore.get_file_list(target_audio)
+        key = self.cache.make_key(method, [ref_audio] + deg_list, bw=self.pesq_analyzer.bw,
+                                  tor_sec=self.pesq_analyzer.tor_sec, mics=self.pesq_analyzer.mics,
+                                  align_decimate=self.pesq_analyzer.align_engine.decimate)
+        cached = self.cache.get_json(key)
+        # entries without headers predate caching them, recompute to print the same table
+        if cached is not None and "headers" in cached:
+            print(f"[INFO]: {method} results of {target_audio} found in cache.")
+            headers = cached["headers"]
+            print(tabulate([row[:len(headers)] for row in cached["results"]], headers=headers, tablefmt="grid"))
+            return True
+        results = calc(ref_audio, target_audio)
+        self.cache.put_json(key, {"results": results, "headers": self.pesq_analyzer.last_headers})
+        return True
+
+    def _spectrum_outputs(self, base_name, channels):
+        """
+        Plot files of a spectrum analysis: the spectra, then the spectrograms if enabled.
+        """
+        outputs = [os.path.join(self.output_dir, f"spectrum_{base_name}_chn_{i+1}.png") for i in range(channels)]
+        if self.spectrogram_sec:
+            outputs += [os.path.join(self.output_dir, f"spectrogram_{base_name}_chn_{i+1}.png") for i in range(channels)]
+        return outputs
+
     def spectrum_analyzing(self, audio_file):
         """
         Analyze the audio file using spectrum analysis.
@@ -306,30 +291,47 @@ class AudioAnalyzer:
             print(f"[ERR]: Audio file {audio_file} is not a valid file.")
             return False
                 
+        spectrum_key = self.cache.make_key("spectrum", [audio_file], resolution_hz=self.spectrum_resolution_hz,
+                                           spectrogram_sec=self.spectrogram_sec)
+        base_name = os.path.basename(audio_file)
+        cached = self.cache.get_json(spectrum_key)
+        if cached and self.cache.restore_artifacts(spectrum_key, self._spectrum_outputs(base_name, cached["channels"])):
+            print(f"[INFO]: Spectrum analysis of {audio_file} found in cache, results in {self.output_dir}")
+            return True
+
         try:
-            # Read the audio file
-            with wave.open(audio_file, 'rb') as wf:
-                n_channels = wf.getnchannels()
-                sample_rate = wf.getframerate()
-                n_frames = wf.getnframes()
-                audio_data = wf.readframes(n_frames)
-                audio_np = np.frombuffer(audio_data, dtype=np.int16)
-            base_name = os.path.basename(audio_file)
-            for i in range(n_channels):
-                channel_data = audio_np[i::n_channels]
-                # Perform FFT
-                fft_result = np.fft.fft(channel_data)
-                freqs = np.fft.fftfreq(len(fft_result), 1/sample_rate)
+            # One streaming pass over all channels, memory is bounded by the chunk size
+            welch = welch_file(audio_file, self.spectrum_resolution_hz, spectrogram_sec=self.spectrogram_sec,
+                               normalize=False)
+            freqs, psd = welch.finish()
+            psd_db = 10 * np.log10(np.maximum(psd, 1e-12))
+            outputs = self._spectrum_outputs(base_name, welch.channels)
+            os.makedirs(self.output_dir, exist_ok=True)
+            for i in range(welch.channels):
                 # Plot the spectrum
                 plt.figure(figsize=(10, 4))
-                plt.plot(freqs[:len(freqs)//2], np.abs(fft_result)[:len(freqs)//2])
-                plt.title(f"Spectrum Analysis - Channel {i+1}")
+                plt.plot(freqs, psd_db[i])
+                plt.title(f"Spectrum Analysis - Channel {i+1} ({freqs[1]:.1f} Hz resolution)")
                 plt.xlabel("Frequency (Hz)")
-                plt.ylabel("Magnitude")
+                plt.ylabel("PSD (dB/Hz)")
                 plt.grid()
-                plt.savefig(f"./records/spectrum_{base_name}_chn_{i+1}.png")
+                plt.savefig(outputs[i])
                 plt.close()
-            print(f"[INFO]: Spectrum analysis completed, results saved in ./records/")
+            if self.spectrogram_sec:
+                times, freqs, sxx = welch.spectrogram()
+                sxx_db = 10 * np.log10(np.maximum(sxx, 1e-12))
+                for i in range(welch.channels):
+                    plt.figure(figsize=(10, 4))
+                    plt.pcolormesh(times, freqs, sxx_db[i], shading='auto')
+                    plt.colorbar(label="PSD (dB/Hz)")
+                    plt.title(f"Spectrogram - Channel {i+1}")
+                    plt.xlabel("Time (s)")
+                    plt.ylabel("Frequency (Hz)")
+                    plt.savefig(outputs[welch.channels + i])
+                    plt.close()
+            print(f"[INFO]: Spectrum analysis completed, results saved in {self.output_dir}")
+            self.cache.put_artifacts(spectrum_key, outputs)
+            self.cache.put_json(spectrum_key, {"channels": welch.channels})
             return True
         except Exception as e:
             print(f"[ERR]: Failed to analyze audio file with spectrum analysis: {e}")
@@ -1,8 +1,31 @@
 from ssh_client import SSHClient
-from pydub.utils import mediainfo
+from capture_stream import CaptureStream, PCM_FORMATS
+from playback_stream import PlaybackStream, PcmSource, SUBTYPE_FORMATS, open_source
+from wav_io import HEADER_PROBE_BYTES, RAW_FORMATS, RAW_SIDECAR_SUFFIX, parse_audio_header, wav_info, file_digest, \
+    wav_capture_command, read_channel
+from align_engine import AlignEngine
 import os
 import re
 import wave
+import math
+import base64
+import shlex
+import numpy as np
+import soundfile as sf
+from scipy import signal
+
+SESSION_TAIL_SEC = 0.5     # capture kept after the stimulus for the player start-up and path latency
+CHIRP_SEC = 0.1            # sync chirp played ahead of the stimulus
+CHIRP_GAP_SEC = 0.2        # silence between the chirp and the stimulus
+CHIRP_SEARCH_SEC = 0.25    # chirp searched this far around the timestamp estimate
+
+
+def sync_chirp(rate):
+    """
+    Hann windowed linear chirp (500 Hz to 4 kHz) used to mark the start of a session playback.
+    """
+    t = np.arange(int(CHIRP_SEC * rate)) / rate
+    return (signal.chirp(t, 500, CHIRP_SEC, min(4000, 0.4 * rate)) * np.hanning(len(t))).astype(np.float32)
 
 class AudioModule:
     def __init__(self):
@@ -21,6 +44,15 @@ class AudioModule:
         self.device = "speaker"
         self.is_recording = False
         self.is_playing = False
+        self.stream_capture = False  # opt-in: stream wav recordings straight to the local file while they run
+        self.record_streamed = False  # the last record_audio wrote the local file, no download needed
+        self.capture = None  # running CaptureStream, its ring buffer holds the latest samples
+        self.stream_playback = False  # opt-in: play local files by streaming PCM into the remote player
+        self.play_decoder = "auto"  # local decoder for streamed playback: auto, soundfile or ffmpeg
+        self.player = None  # running PlaybackStream
+        self.session = None  # timestamps and capture offset of the last play_and_record
+        self.remote_stats = {}  # remote path -> stat_many entry of the last check_and_sync_file
+        self.remote_infos = {}  # sha256 -> header info of remote files parsed on the device side
 
     def set_ssh_connect(self, ssh_client: SSHClient):
         """
@@ -29,6 +61,9 @@ class AudioModule:
         if not ssh_client.is_connected():
             print("[ERR]: ssh client is not connected.")
         self.ssh_client = ssh_client
+        caps = ssh_client.get_device_caps()
+        if ssh_client.is_connected() and caps.fingerprint is None:
+            caps.prefill()
         return True
 
     def paras_settings(self, rate: int = 44100, channels: int = 2, audio_format: str = "S16_LE", rec_sec: int = 10, file_type: str = "wav", engine: str = "alsa", device: str = "speaker"):
@@ -56,11 +91,19 @@ class AudioModule:
         local_file_path = audio_file
         local_exists = os.path.exists(audio_file)
         file_name = os.path.basename(audio_file)
-        # check if the file exists on the remote server: play/record directory
+        # check if the file exists on the remote server: play/record directory, in one round trip
         remote_file_path_play = os.path.join(self.remote_play_dir, file_name)
-        remote_exists_play = self.ssh_client.file_exists(remote_file_path_play)
         remote_file_path_rec = os.path.join(self.remote_rec_dir, file_name)
-        remote_exists_rec = self.ssh_client.file_exists(remote_file_path_rec)
+        # hashed when there is a local copy, so remote_audio_info can reuse its parsed header
+        try:
+            remote_stats = self.ssh_client.stat_many([remote_file_path_play, remote_file_path_rec],
+                                                     with_hash=local_exists)
+        except Exception as e:
+            print(f"[ERR]: Failed to check file existence: {e}")
+            return None, None
+        self.remote_stats.update(remote_stats)
+        remote_exists_play = remote_stats[remote_file_path_play]["is_file"]
+        remote_exists_rec = remote_stats[remote_file_path_rec]["is_file"]
         remote_exists = remote_exists_play or remote_exists_rec
 
         if not local_exists:
@@ -77,7 +120,9 @@ class AudioModule:
                 self.ssh_client.download_file(remote_file_path, local_file_path)
         else:
             if not remote_exists:
-                self.ssh_client.upload_file(audio_file, self.remote_play_dir)
+                if self.ssh_client.upload_file(audio_file, self.remote_play_dir):
+                    self.remote_stats[remote_file_path_play] = {"is_file": True, "size": os.path.getsize(audio_file),
+                                                                "sha256": file_digest(audio_file)}
                 remote_file_path = remote_file_path_play
             else:
                 if remote_exists_play:
@@ -102,120 +147,132 @@ class AudioModule:
                 return None
        
         try:
-            file_info = mediainfo(local_audio_file)
-            channels =  int(file_info.get('channels', 2))
-            sample_rate = int(file_info.get('sample_rate', 48000))
-            num_frames = file_info.get('duration_ts', 0)
-            duration = float(file_info.get('duration', 0.0))
-            sample_fmt = (file_info.get('sample_fmt', 's16')).upper()
-            sample_fmt = sample_fmt + "_LE"
-            info = {
-                'channels':channels,
-                'sample_rate': sample_rate,
-                'num_frames': num_frames,
-                'duration': int(duration),
-                'sample_fmt': sample_fmt
-            }
-            print(f"[INFO]: WAV file info: {info}")
-            return info
-        except Exception as e:
+            info = self._info_fields(wav_info(local_audio_file))
+        except ValueError:
+            # not a WAV/RF64 or sidecar-described raw file, e.g. mp3/flac/ogg
+            try:
+                info = self._soundfile_info(local_audio_file)
+            except (OSError, RuntimeError) as e:
+                print(f"[ERR]: Failed to read local audio file {local_audio_file}: {e}")
+                return None
+        except OSError as e:
             print(f"[ERR]: Failed to read local WAV file {local_audio_file}: {e}")
             return None
-        
-        # # get audio file information
-        # command = f"ffprobe -v error -show_format -show_streams {remote_audio_file}"
-        # output = self.ssh_client.execute_command(command)
-        # if output:
-        #     info = {}
-        #     for line in output.splitlines():
-        #         if '=' not in line:
-        #             continue
-        #         if ':' in line:
-        #             continue
-        #         key, value = line.split('=')
-        #         info[key] = value
-        #     return info
-        # else:
-        #     print("[ERR]: Failed to retrieve audio file information.")
-        #     return None
-    
-    def check_avaliable_paras(self, dev_type) -> bool:
+        print(f"[INFO]: WAV file info: {info}")
+        return info
+
+    @staticmethod
+    def _info_fields(header):
+        return {
+            'channels': header['channels'],
+            'sample_rate': header['sample_rate'],
+            'num_frames': header['num_frames'],
+            'duration': int(header['duration']),
+            'sample_fmt': header['sample_fmt'],
+            'bits_per_sample': header['bits_per_sample'],
+            'container': header['container'],
+        }
+
+    @staticmethod
+    def _soundfile_info(path):
+        """
+        get_wav_info fields of any file soundfile can read, sample_fmt is the format it is streamed in.
+        """
+        info = sf.info(path)
+        bits = re.search(r'(\d+)$', info.subtype)
+        return {
+            'channels': info.channels,
+            'sample_rate': info.samplerate,
+            'num_frames': info.frames,
+            'duration': int(info.duration),
+            'sample_fmt': SUBTYPE_FORMATS.get(info.subtype, ("S16_LE",))[0],
+            'bits_per_sample': int(bits.group(1)) if bits else 0,
+            'container': info.format,
+        }
+
+    def remote_audio_info(self, remote_audio_file, local_audio_file=None) -> dict:
+        """
+        Header information (as get_wav_info) of an audio file on the device, None if it is
+        not a WAV/RF64 or sidecar-described raw file.
+        A local copy with the same sha256 is parsed locally, otherwise only the first
+        HEADER_PROBE_BYTES of the file are read from the device and parsed here.
+        """
+        stat = self.remote_stats.pop(remote_audio_file, None)
+        if stat is None or (local_audio_file and stat.get("sha256") is None):
+            stat = self.ssh_client.stat_many([remote_audio_file], with_hash=True)[remote_audio_file]
+        if not stat["is_file"]:
+            return None
+        digest = stat.get("sha256")
+        try:
+            if local_audio_file and os.path.isfile(local_audio_file) and digest == file_digest(local_audio_file):
+                return self._info_fields(wav_info(local_audio_file))
+            if digest in self.remote_infos:
+                return self.remote_infos[digest]
+            path = shlex.quote(remote_audio_file)
+            command = (f"head -c {HEADER_PROBE_BYTES} {path} | base64; echo '@@sidecar'; "
+                       f"cat {shlex.quote(remote_audio_file + RAW_SIDECAR_SUFFIX)} 2>/dev/null")
+            output, _, _ = self.ssh_client.run_command(command, retry=True)
+            header, _, sidecar = output.partition("@@sidecar")
+            info = self._info_fields(parse_audio_header(base64.b64decode("".join(header.split())), stat["size"],
+                                                        sidecar.strip() or None))
+        except ValueError as e:
+            print(f"[ERR]: File {remote_audio_file} is not a valid audio file: {e}")
+            return None
+        if digest is not None:
+            self.remote_infos[digest] = info
+        return info
+
+    def check_avaliable_paras(self, dev_type, rate: int = None, channels: int = None, audio_format: str = None) -> bool:
         """
-        Check if the current audio parameters are valid for device
+        Check if the audio parameters (the current settings by default) are valid for device
         """
         if 'speaker' in dev_type.lower():
-           command = f"aplay -D {self.device} --dump-hw-params /dev/zero"
+            direction = "playback"
         elif 'mic' in dev_type.lower():
             # free device vibemicarray from vibe-dsp-server
-           if self.device == "hw:vibemicarray,0":
+            if self.device == "hw:vibemicarray,0":
                 self.ssh_client.execute_command("stop vibe-dsp-server")
-           elif self.device == "hw:Loopback,0":
+            elif self.device == "hw:Loopback,0":
                 self.ssh_client.execute_command("vibe-dsp-client -c start")
-           command = f"arecord -D {self.device} --dump-hw-params /dev/zero"
+            direction = "capture"
         else:
             print(f"[ERR]: Unsupported device type: {dev_type}")
-            return False  
-        hw_output = self.ssh_client.execute_command(command)
-        if hw_output is None:
-            print(f"[ERR]: Failed to check audio parameters for device {self.device}.")
             return False
-        
-        result = {}
-        # extract audio format
-        format_match = re.search(r'FORMAT:\s+([A-Z0-9_ ]+)', hw_output)
-        if format_match:
-            formats = format_match.group(1).split()
-            result['FORMAT'] = formats
-
-        # extract audio channel count
-        channels_match = re.search(r'CHANNELS:\s+(\[?\d+(?:\s+\d+)?\]?)', hw_output)
-        if channels_match:
-            nums = list(map(int, re.findall(r'\d+', channels_match.group(1))))
-            if len(nums) == 2:
-                result['CHANNELS'] = {'min': nums[0], 'max': nums[1]}
-            elif len(nums) == 1:
-                result['CHANNELS'] = {'min': nums[0], 'max': nums[0]}
+        # answered from the device capability cache, probed on the device only once
+        ok, message = self.ssh_client.get_device_caps().check(self.device, direction, rate or self.rate,
+                                                              channels or self.channels,
+                                                              audio_format or self.audio_format)
+        if not ok:
+            print(f"[ERR]: {message}")
+        return ok
 
-        # extract sample rate
-        rate_match = re.search(r'RATE:\s+(\[?\d+(?:\s+\d+)?\]?)', hw_output)
-        if rate_match:
-            nums = list(map(int, re.findall(r'\d+', rate_match.group(1))))
-            if len(nums) == 2:
-                result['RATE'] = {'min': nums[0], 'max': nums[1]}
-            elif len(nums) == 1:
-                result['RATE'] = {'min': nums[0], 'max': nums[0]}
-        
-        if self.audio_format.upper() not in result.get('FORMAT', []):
-            print(f"[ERR]: Unsupported audio format: {self.audio_format}. Supported formats: {result.get('FORMAT', [])}")
-            return False
-        if self.channels < result.get('CHANNELS', {}).get('min', 1) or self.channels > result.get('CHANNELS', {}).get('max', 2):
-            print(f"[ERR]: Unsupported number of channels: {self.channels}. Supported range: {result.get('CHANNELS', {}).get('min', 1)} - {result.get('CHANNELS', {}).get('max', 2)}")
-            return False
-        if self.rate < result.get('RATE', {}).get('min', 8000) or self.rate > result.get('RATE', {}).get('max', 192000):
-            print(f"[ERR]: Unsupported sample rate: {self.rate}. Supported range: {result.get('RATE', {}).get('min', 8000)} - {result.get('RATE', {}).get('max', 192000)}")
-            return False
-        return True  # all parameters are valid
-        
-    def play_audio(self, audio_file) -> bool:
+    def play_audio(self, audio_file, stream: bool = None) -> bool:
         """
         Play an audio file on the remote server.
+        stream: decode a local file on the host and stream it into the player without storing
+        it on the device, defaults to self.stream_playback. Remote-only files are always staged.
         """
         # check if ssh client is connected
         if self.ssh_client is None:
             print("[ERR]: SSH client is not connected.")
             return False
+        stream = self.stream_playback if stream is None else stream
+        if stream and os.path.isfile(audio_file):
+            try:
+                source = open_source(audio_file, self.play_decoder, self.rate, self.channels)
+            except RuntimeError as e:
+                print(f"[ERR]: Failed to decode {audio_file}: {e}")
+                return False
+            print(f"[INFO]: Playing audio: {audio_file}")
+            return self.play_source(source)
         # check if the audio file exists on the remote server
         remote_audio_file, local_audio_file = self.check_and_sync_file(audio_file)
         if remote_audio_file is None or local_audio_file is None:
             print(f"[ERR]: Audio file {audio_file} does not exist on the remote server.")
             return False
         # check if the audio file is a valid audio file
-        command = f"ffmpeg -i {remote_audio_file}"
-        output = self.ssh_client.execute_command(command)
-        if "Audio:" not in output:
-            print(f"[ERR]: File {remote_audio_file} is not a valid audio file.")
+        if self.remote_audio_info(remote_audio_file, local_audio_file) is None:
             return False
-        # print(f"[INFO]: {output}")
     
         if self.engine == "alsa":
             if not self.check_avaliable_paras('speaker'):
@@ -246,32 +303,107 @@ class AudioModule:
             print("[ERR]: Failed to play audio.")
             return False
         
+    def playback_command(self, rate: int = None, channels: int = None, audio_format: str = None) -> str:
+        """
+        Device command playing raw PCM from stdin, None if not usable.
+        The PCM format defaults to the current settings, which are left unchanged.
+        """
+        rate, channels = rate or self.rate, channels or self.channels
+        audio_format = audio_format or self.audio_format
+        if self.engine == "alsa":
+            if not self.check_avaliable_paras('speaker', rate, channels, audio_format):
+                return None
+            return (f"aplay -q -D {self.device} -t raw -f {audio_format} "
+                    f"-r {rate} -c {channels} -")
+        elif self.engine == "cras":
+            cras_node = self.get_cras_node(self.device)
+            if cras_node is None:
+                print(f"[ERR]: CRAS node for device {self.device} not found.")
+                return None
+            return (f"cras_test_client --select_output {cras_node} "
+                    f"--format {audio_format} "
+                    f"--rate {rate} "
+                    f"--num_channels {channels} "
+                    f"--playback_file /dev/stdin")
+        print(f"[ERR]: Unsupported engine: {self.engine}")
+        return None
+
+    def play_source(self, source: PcmSource, max_frames: int = None) -> bool:
+        """
+        Stream a PcmSource into the remote player in the source format, the module settings
+        (shared with recording) are left unchanged.
+        max_frames: exact length of the playback, defaults to self.play_dur_sec if set.
+        """
+        command = self.playback_command(source.rate, source.channels, source.audio_format)
+        if command is None:
+            source.close()
+            return False
+        if max_frames is None and self.play_dur_sec:
+            max_frames = self.play_dur_sec * source.rate
+        self.player = PlaybackStream(self.ssh_client, command, source, max_frames).start()
+        self.is_playing = True
+        ret = self.player.wait()
+        self.is_playing = False
+        return ret
+
+    def play_playlist(self, audio_files, duration_sec: float = None, loop: bool = None) -> bool:
+        """
+        Play one or more files back to back through a single remote player, without gaps
+        between files or loop passes and without per-file checks on the device.
+        duration_sec: total playback time, cut at the exact frame; the playlist is looped
+        to fill it (loop defaults to True when a duration is given). None plays it once,
+        or when looping until stop_playing() or the end of self.play_dur_sec.
+        Remote-only files are downloaded first.
+        """
+        if self.ssh_client is None:
+            print("[ERR]: SSH client is not connected.")
+            return False
+        if isinstance(audio_files, str):
+            audio_files = [audio_files]
+        local_files = []
+        for audio_file in audio_files:
+            if not os.path.isfile(audio_file):
+                _, audio_file = self.check_and_sync_file(audio_file)
+                if audio_file is None or not os.path.isfile(audio_file):
+                    return False
+            local_files.append(audio_file)
+        loop = duration_sec is not None if loop is None else loop
+        try:
+            source = PcmSource.from_playlist(local_files, loop)
+        except (RuntimeError, ValueError) as e:
+            print(f"[ERR]: Failed to open playlist: {e}")
+            return False
+        max_frames = round(duration_sec * source.rate) if duration_sec else source.frames
+        length = f"{max_frames / source.rate:.3f}s" if max_frames else "until stopped"
+        print(f"[INFO]: Playing {len(local_files)} file(s){' looped' if loop else ''}, {length}: "
+              f"{', '.join(local_files)}")
+        return self.play_source(source, max_frames)
+
+    def play_array(self, data, rate: int) -> bool:
+        """
+        Play generated samples, (n,) or (n, channels) int16, int32 or float arrays.
+        """
+        if self.ssh_client is None:
+            print("[ERR]: SSH client is not connected.")
+            return False
+        try:
+            source = PcmSource.from_array(data, rate)
+        except ValueError as e:
+            print(f"[ERR]: {e}")
+            return False
+        return self.play_source(source)
+
     def get_cras_node(self, device: str, direction: str = "Output") -> str:
         """
         Get the CRAS node for the specified device.
         """
         device_name = device.split(":")[1].split(",")[0]
-        command = "cras_test_client"
-        cras_info = self.ssh_client.execute_command(command)
-        device_pattern =  re.compile(r"\s+(\d+)[^\n]*" + re.escape(device_name) + r"[^\n]*")
-        cras_card_node = ""
-
-        if(direction == "Output"):
-            output_section = cras_info.split("Output Devices:")[1].split("Output Nodes:")[0]
-            node_id = re.findall(device_pattern, output_section)
-            if not node_id:
+        cras_card_node = self.ssh_client.get_device_caps().cras_node(device_name, direction)
+        if cras_card_node is None:
+            if direction == "Output":
                 print(f"[ERR]: No Speaker found with name {device_name}")
-                return None
             else:
-                cras_card_node = node_id[0] + ":0"   
-        else:
-            input_section = cras_info.split("Input Devices:")[1].split("Input Nodes:")[0]
-            node_id = re.findall(device_pattern, input_section)
-            if not node_id:
                 print(f"[ERR]: No Micphones found with name {device_name}")
-                return None
-            else:
-                cras_card_node = node_id[0] + ":0"
         return cras_card_node
     
     def stop_playing(self):
@@ -282,6 +414,8 @@ class AudioModule:
             print("[ERR]: No playback is in progress.")
             return False
         print(f"[INFO]: Stopping playback for device {self.device}...")
+        if self.player is not None:
+            self.player.stop()
         if self.is_loopback_device(self.device):
             # stop loopback mode if it is enabled
             ret = self.loopback_file_mode_stop()
@@ -311,6 +445,8 @@ class AudioModule:
             print("[ERR]: No recording is in progress.")
             return False
         print(f"[INFO]: Stopping recording for device {self.device}...")
+        if self.capture is not None:
+            self.capture.stop()
         command = "pkill -f 'arecord|cras_test_client'"
         output = self.ssh_client.execute_command(command)
         if output is not None:
@@ -321,13 +457,27 @@ class AudioModule:
             print("[ERR]: Failed to stop recording.")
             return False
     
-    def record_audio(self, output_file: str):
+    def record_audio(self, output_file: str, stream: bool = None):
         """
         Record audio from the specified device and save it to the output file.
+        stream: write the capture to the local output_file while recording, defaults to self.stream_capture.
+        Only wav recordings are streamed. Otherwise, or if the stream cannot start, the file is
+        recorded in the remote record directory and left there (see self.record_streamed).
         """
         if not self.ssh_client:
             print("[ERR]: SSH client is not connected.")
             return False    
+        stream = self.stream_capture if stream is None else stream
+        self.record_streamed = False
+        if stream and self.file_type != "wav":
+            print(f"[WARN]: Streamed recordings are WAV files, recording the {self.file_type} file on the device.")
+            stream = False
+        if stream:
+            ret = self.record_audio_stream(output_file)
+            if ret is not None:
+                self.record_streamed = True
+                return ret
+            print("[WARN]: Capture stream did not start, recording on the device instead.")
         # check if the output file exists on the remote server
         remote_output_file = os.path.join(self.remote_rec_dir, os.path.basename(output_file))
         # check if the output file already exists
@@ -339,36 +489,25 @@ class AudioModule:
                 return False
             command = f"arecord -D {self.device} -f {self.audio_format} -r {self.rate} -t {self.file_type} -c {self.channels} -d {self.rec_dur_sec} {remote_output_file}"
         elif self.engine == "cras":
-            cras_node = self.get_cras_node(self.device, direction="Input")
-            if cras_node is None:
-                print(f"[ERR]: CRAS node for device {self.device} not found.")
+            capture_command = self.capture_command()
+            if capture_command is None:
                 return False
-            tmp_pcm_file = os.path.join("/tmp/", "tmp_record.pcm")
-            convert_cmd = (f"sox -t raw -r {self.rate} -e signed -b 16 -c {self.channels} "
-                              f"{tmp_pcm_file} {remote_output_file} && "
-                              f"rm {tmp_pcm_file}"
-            )
-            command = (f"cras_test_client --select_input {cras_node} "
-                       f"--format {self.audio_format} "
-                       f"--duration_seconds {self.rec_dur_sec} " 
-                       f"--rate {self.rate} " 
-                       f"--num_channels {self.channels} "
-                       f"--capture_file {tmp_pcm_file} && "
-                       f"{convert_cmd} "
-            )
+            if self.file_type == "wav":
+                if self.audio_format.upper() not in RAW_FORMATS:
+                    print(f"[ERR]: Unsupported WAV sample format: {self.audio_format}")
+                    return False
+                # header written around the streamed PCM on the device, no conversion pass
+                command = wav_capture_command(capture_command, remote_output_file, self.rate, self.channels,
+                                              self.audio_format)
+            else:
+                command = f"({capture_command}) > {shlex.quote(remote_output_file)}"
         else:
             print(f"[ERR]: Unsupported engine: {self.engine}")
             return False
         
         # device vibemicarray has conflict with device Loopback,0 because of vibe-dsp-server
-        if self.device == "hw:vibemicarray,0":
-            output = self.ssh_client.execute_command(command)
-            self.ssh_client.execute_command("start vibe-dsp-server")
-        elif self.device == "hw:Loopback,0":
-            output = self.ssh_client.execute_command(command)
-            self.ssh_client.execute_command("vibe-dsp-client -c start")
-        else:
-            output = self.ssh_client.execute_command(command)
+        output = self.ssh_client.execute_command(command)
+        self.restore_mic_service()
 
         if output is not None:
             print(f"[INFO]: Recording audio to: {output_file}")
@@ -376,7 +515,190 @@ class AudioModule:
         else:
             print("[ERR]: Failed to record audio.")
             return False
+
+    def restore_mic_service(self):
+        """
+        Restart the service a capture on a shared mic device had to take over.
+        """
+        if self.device == "hw:vibemicarray,0":
+            self.ssh_client.execute_command("start vibe-dsp-server")
+        elif self.device == "hw:Loopback,0":
+            self.ssh_client.execute_command("vibe-dsp-client -c start")
+
+    def capture_command(self, frames: int = None, gain=None) -> str:
+        """
+        Device command writing the raw PCM capture to stdout, None if the device is not usable.
+        frames: exact capture length, self.rec_dur_sec seconds by default.
+        gain: CRAS capture gain, the current one if None.
+        """
+        if self.engine == "alsa":
+            if not self.check_avaliable_paras('mic'):
+                return None
+            length = f"-s {frames}" if frames else f"-d {self.rec_dur_sec}"
+            return (f"arecord -q -D {self.device} -f {self.audio_format} -r {self.rate} "
+                    f"-c {self.channels} -t raw {length} -")
+        elif self.engine == "cras":
+            cras_node = self.get_cras_node(self.device, direction="Input")
+            if cras_node is None:
+                print(f"[ERR]: CRAS node for device {self.device} not found.")
+                return None
+            # capture data goes to the channel through fd 3, client messages to stderr
+            duration = f"{frames / self.rate:.6f}" if frames else self.rec_dur_sec
+            return (f"cras_test_client --select_input {cras_node} "
+                    f"--format {self.audio_format} "
+                    f"--duration_seconds {duration} "
+                    f"--rate {self.rate} "
+                    f"--num_channels {self.channels} "
+                    f"{'' if gain is None else f'--capture_gain {gain} '}"
+                    f"--capture_file /dev/fd/3 3>&1 1>&2")
+        print(f"[ERR]: Unsupported engine: {self.engine}")
+        return None
+
+    def start_capture_stream(self, output_file: str = None, on_block=None) -> CaptureStream:
+        """
+        Start a live capture streamed into output_file (if given) and self.capture's ring buffer.
+        """
+        command = self.capture_command()
+        if command is None:
+            return None
+        try:
+            self.capture = CaptureStream(self.ssh_client, command, self.rate, self.channels,
+                                         self.audio_format.upper(), output_file, on_block=on_block)
+            return self.capture.start()
+        except Exception as e:
+            print(f"[ERR]: Failed to start capture stream: {e}")
+            self.capture = None
+            return None
+
+    def record_audio_stream(self, output_file: str, on_block=None) -> bool:
+        """
+        Record audio straight into the local output_file, samples are readable from
+        self.capture.ring while the recording runs. Returns None if the stream could not start.
+        """
+        parent_dir = os.path.dirname(output_file)
+        if parent_dir:
+            os.makedirs(parent_dir, exist_ok=True)
+        capture = self.start_capture_stream(output_file, on_block)
+        if capture is None:
+            return None
+        print(f"[INFO]: Streaming recording to: {output_file}")
+        self.is_recording = True
+        ret = capture.wait()
+        self.is_recording = False
+        self.restore_mic_service()
+        return ret
     
+    def _session_stimulus(self, audio_file: str) -> str:
+        """
+        Local copy of audio_file behind the sync chirp, named after its content so it is
+        only generated and uploaded once.
+        """
+        digest = file_digest(audio_file)[:12]
+        path = os.path.join(self.local_play_dir, f"sync_{digest}_{os.path.splitext(os.path.basename(audio_file))[0]}.wav")
+        if not os.path.isfile(path):
+            data, rate = sf.read(audio_file, dtype='float32', always_2d=True)
+            chirp = np.repeat(0.5 * sync_chirp(rate)[:, None], data.shape[1], axis=1)
+            gap = np.zeros((int(CHIRP_GAP_SEC * rate), data.shape[1]), dtype=np.float32)
+            os.makedirs(self.local_play_dir, exist_ok=True)
+            sf.write(path, np.concatenate([chirp, gap, data]), rate, subtype="PCM_16")
+        return path
+
+    def _session_player(self, remote_audio_file: str, info: dict, speaker: str, volume=None) -> str:
+        """
+        Device command playing a staged file on speaker with the current engine, output on stderr.
+        volume: CRAS playback volume, the current one if None.
+        """
+        if self.engine == "alsa":
+            ok, message = self.ssh_client.get_device_caps().check(speaker, "playback", info['sample_rate'],
+                                                                  info['channels'], info['sample_fmt'])
+            if not ok:
+                print(f"[ERR]: {message}")
+                return None
+            return f"aplay -q -D {speaker} {shlex.quote(remote_audio_file)}"
+        cras_node = self.get_cras_node(speaker)
+        if cras_node is None:
+            print(f"[ERR]: CRAS node for device {speaker} not found.")
+            return None
+        # cras plays raw PCM, the header is skipped so the first played frame is the first sample
+        return (f"tail -c +{info['data_offset'] + 1} {shlex.quote(remote_audio_file)} | "
+                f"cras_test_client --select_output {cras_node} --format {info['sample_fmt']} "
+                f"--rate {info['sample_rate']} --num_channels {info['channels']} "
+                f"{'' if volume is None else f'--volume {volume} '}--playback_file /dev/stdin")
+
+    def play_and_record(self, audio_file: str, output_file: str, speaker: str, chirp: bool = False,
+                        capture_gain=None, volume=None) -> float:
+        """
+        Play audio_file on speaker while self.device records into the local output_file, both
+        started by one device command that stamps each start with the device clock. The
+        capture only runs for the stimulus plus SESSION_TAIL_SEC, no sleep or padding.
+        chirp: play a sync chirp ahead of the stimulus and locate it in the recording, which
+        makes the offset exact instead of limited by the tools' start-up jitter.
+        capture_gain, volume: CRAS capture gain and playback volume of the session.
+        Returns the start of audio_file in the recording in seconds (an offset_hint for
+        PesqScore), None on failure. Timestamps are kept in self.session.
+        """
+        if self.ssh_client is None:
+            print("[ERR]: SSH client is not connected.")
+            return None
+        remote_audio_file, local_audio_file = self.check_and_sync_file(audio_file)
+        if remote_audio_file is None or local_audio_file is None:
+            return None
+        lead_sec = 0.0
+        if chirp:
+            remote_audio_file, local_audio_file = self.check_and_sync_file(self._session_stimulus(local_audio_file))
+            if remote_audio_file is None:
+                return None
+            lead_sec = CHIRP_SEC + CHIRP_GAP_SEC
+        if self.remote_audio_info(remote_audio_file, local_audio_file) is None:
+            return None
+        info = wav_info(local_audio_file)
+        player = self._session_player(remote_audio_file, info, speaker, volume)
+        if player is None:
+            return None
+        frames = math.ceil((info['duration'] + SESSION_TAIL_SEC) * self.rate)
+        capture = self.capture_command(frames, capture_gain)
+        if capture is None:
+            return None
+        # the player is released through a fifo once the first captured frame came out of the
+        # capture, so the stimulus can not start before the recording whatever the tools' start-up
+        frame_bytes = PCM_FORMATS[self.audio_format.upper()][0] * self.channels
+        command = (f"p=$(mktemp -u /tmp/session.XXXXXX); mkfifo $p || exit 1; "
+                   f"{{ {capture}; }} | {{ dd bs={frame_bytes} count=1 2>/dev/null; "
+                   f"echo @@rec $(date +%s%N) >&2; echo > $p; cat; }} & c=$!; "
+                   f"read _ < $p; rm -f $p; echo @@play $(date +%s%N) >&2; "
+                   f"{{ {player}; }} >&2 </dev/null || echo @@play_failed >&2; wait $c")
+        parent_dir = os.path.dirname(output_file)
+        if parent_dir:
+            os.makedirs(parent_dir, exist_ok=True)
+        try:
+            self.capture = CaptureStream(self.ssh_client, command, self.rate, self.channels,
+                                         self.audio_format.upper(), output_file)
+        except ValueError as e:
+            print(f"[ERR]: {e}")
+            return None
+        print(f"[INFO]: Playing {audio_file} on {speaker} while recording {self.device} to {output_file}")
+        self.is_recording = self.is_playing = True
+        ret = self.capture.start().wait()
+        self.is_recording = self.is_playing = False
+        self.restore_mic_service()
+        stamps = dict(re.findall(r"@@(rec|play) (\d+)", self.capture.stderr))
+        if not ret or not self.capture.frames or "@@play_failed" in self.capture.stderr or len(stamps) < 2:
+            print(f"[ERR]: Play and record session failed: {self.capture.stderr}")
+            return None
+        start_sec = (int(stamps["play"]) - int(stamps["rec"])) / 1e9
+        offset_sec = start_sec + lead_sec
+        if chirp:
+            recorded, _ = read_channel(output_file, 0)
+            center, radius = int(start_sec * self.rate), int(CHIRP_SEARCH_SEC * self.rate)
+            chirp_frame = AlignEngine().find_offset(recorded, center - radius, center + radius,
+                                                    ref_signal=sync_chirp(self.rate))
+            offset_sec = chirp_frame / self.rate + lead_sec
+        self.session = {"rec_ns": int(stamps["rec"]), "play_ns": int(stamps["play"]), "start_sec": start_sec,
+                        "offset_sec": offset_sec, "chirp": chirp, "frames": self.capture.frames}
+        print(f"[INFO]: Session done, stimulus starts {offset_sec * 1000:.1f} ms into the recording "
+              f"(players started {start_sec * 1000:.1f} ms apart)")
+        return offset_sec
+
     def is_loopback_device(self, device) -> bool:
         """
         Check if the current device is a loopback speaker.
@@ -399,13 +721,15 @@ class AudioModule:
         # check if the audio file exists on the remote server
         audio_file_name = os.path.basename(audio_file)
         remote_audio_file = os.path.join(self.remote_play_dir, audio_file_name)
-        if not self.ssh_client.file_exists(remote_audio_file):
-            self.ssh_client.upload_file(audio_file, self.remote_play_dir)
+        stat = self.ssh_client.stat_many([remote_audio_file], with_hash=True)[remote_audio_file]
+        if os.path.isfile(audio_file) and stat["sha256"] != file_digest(audio_file):
+            # missing or different on the device
+            if not self.ssh_client.upload_file(audio_file, self.remote_play_dir):
+                return False
+            stat = {"is_file": True, "size": os.path.getsize(audio_file), "sha256": file_digest(audio_file)}
+        self.remote_stats[remote_audio_file] = stat
         # check if the audio file is a valid audio file
-        command = f"ffmpeg -i {remote_audio_file}"
-        output = self.ssh_client.execute_command(command)
-        if "Audio:" not in output:
-            print(f"[ERR]: File {remote_audio_file} is not a valid audio file.")
+        if self.remote_audio_info(remote_audio_file, audio_file) is None:
             return False
 
         # prepare loopback mode command
@@ -5,6 +5,7 @@ import librosa.display
 from scipy.signal import correlate
 import matplotlib.pyplot as plt
 from tabulate import tabulate
+from wav_io import read_mono
 
 DR = []
 MZC = []
@@ -86,9 +87,9 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
     procs = []
-    ref, sr = librosa.load(args.ref, sr=None)
+    ref, sr = read_mono(args.ref)
     for proc in args.processed:
-        proc, sr = librosa.load(proc, sr=None)
+        proc, sr = read_mono(proc)
         procs.append(proc)
     #align the length of all audio files
     min_len = min(len(ref), *[len(proc) for proc in procs])
@@ -0,0 +1,183 @@
+import time
+import threading
+import numpy as np
+import soundfile as sf
+
+RING_SEC = 10              # seconds of most recent audio kept for live analysis
+RECV_BYTES = 64 * 1024
+
+# ALSA format -> (bytes per sample, stream dtype, WAV subtype, full scale of the decoded samples)
+PCM_FORMATS = {
+    "S16_LE": (2, "<i2", "PCM_16", 32768.0),
+    "S24_3LE": (3, None, "PCM_24", 2.0 ** 31),
+    "S24_LE": (4, "<i4", "PCM_24", 2.0 ** 31),   # 24 valid bits in a 32-bit container
+    "S32_LE": (4, "<i4", "PCM_32", 2.0 ** 31),
+    "FLOAT_LE": (4, "<f4", "FLOAT", 1.0),
+}
+
+
+class RingBuffer:
+    """
+    Fixed size multichannel float32 buffer holding the most recent frames of a stream.
+    Frames are addressed by their absolute position since the start of the stream.
+    """
+    def __init__(self, frames, channels):
+        self.data = np.zeros((max(1, int(frames)), channels), dtype=np.float32)
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def write(self, block):
+        size = len(self.data)
+        with self.lock:
+            if len(block) >= size:
+                # only the last `size` frames survive, the older ones are skipped
+                self.total += len(block) - size
+                block = block[-size:]
+            pos = self.total % size
+            first = min(len(block), size - pos)
+            self.data[pos:pos + first] = block[:first]
+            self.data[:len(block) - first] = block[first:]
+            self.total += len(block)
+
+    def read(self, start, stop=None):
+        """
+        Returns (start, frames) for [start, stop), start is clamped to the oldest frame still held.
+        """
+        size = len(self.data)
+        with self.lock:
+            stop = self.total if stop is None else min(stop, self.total)
+            start = max(start, self.total - size, 0)
+            if stop <= start:
+                return start, np.zeros((0, self.data.shape[1]), dtype=np.float32)
+            idx = np.arange(start, stop) % size
+            return start, self.data[idx]
+
+    def latest(self, frames):
+        """
+        Up to `frames` most recent frames.
+        """
+        return self.read(self.total - frames)[1]
+
+
+class CaptureStream:
+    """
+    Live capture of raw PCM written to stdout by a device command (arecord, cras_test_client).
+    A reader thread decodes the SSH channel as it arrives into a local WAV file and a ring
+    buffer, so samples can be analysed while the capture is still running and no file is
+    left to convert or download once it ends.
+    on_block(start_frame, block): optional callback with every decoded float32 block.
+    """
+    def __init__(self, ssh_client, command, rate, channels, audio_format="S16_LE", output_file=None,
+                 ring_sec=RING_SEC, on_block=None):
+        if audio_format not in PCM_FORMATS:
+            raise ValueError(f"Unsupported capture format: {audio_format}")
+        self.ssh_client = ssh_client
+        self.command = command
+        self.rate = rate
+        self.channels = channels
+        self.audio_format = audio_format
+        self.output_file = output_file
+        self.on_block = on_block
+        self.sample_bytes, self.dtype, self.subtype, self.full_scale = PCM_FORMATS[audio_format]
+        self.frame_bytes = self.sample_bytes * channels
+        self.ring = RingBuffer(ring_sec * rate, channels)
+        self.channel = None
+        self.thread = None
+        self.stopped = False
+        self.exit_status = None
+        self.error = None
+        self.stderr = ""
+        self.start_time = None
+
+    @property
+    def frames(self):
+        return self.ring.total
+
+    @property
+    def elapsed_sec(self):
+        return self.frames / self.rate
+
+    def _decode(self, raw):
+        """
+        Raw interleaved bytes (whole frames) to (samples for the WAV writer, float32 block).
+        """
+        if self.sample_bytes == 3:
+            packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, self.channels, 3)
+            padded = np.zeros(packed.shape[:-1] + (4,), dtype=np.uint8)
+            padded[..., 1:] = packed
+            samples = padded.view('<i4')[..., 0]
+        else:
+            samples = np.frombuffer(raw, dtype=self.dtype).reshape(-1, self.channels)
+            if self.audio_format == "S24_LE":
+                samples = samples << 8
+        block = samples.astype(np.float32)
+        if self.full_scale != 1.0:
+            block *= np.float32(1.0 / self.full_scale)
+        return samples, block
+
+    def start(self):
+        """
+        Start the device command and the reader thread.
+        """
+        self.channel = self.ssh_client.client.get_transport().open_session()
+        self.channel.exec_command(self.command)
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        writer = None
+        pending = b""
+        try:
+            if self.output_file:
+                writer = sf.SoundFile(self.output_file, 'w', self.rate, self.channels, self.subtype, format="WAV")
+            while True:
+                data = self.channel.recv(RECV_BYTES)
+                if not data:
+                    break
+                pending += data
+                usable = len(pending) - len(pending) % self.frame_bytes
+                if not usable:
+                    continue
+                samples, block = self._decode(pending[:usable])
+                pending = pending[usable:]
+                if writer is not None:
+                    writer.write(samples)
+                start = self.ring.total
+                self.ring.write(block)
+                if self.on_block is not None:
+                    self.on_block(start, block)
+            self.stderr = self.channel.makefile_stderr('rb').read().decode("utf-8", "replace").strip()
+            self.exit_status = self.channel.recv_exit_status()
+        except Exception as e:
+            if not self.stopped:
+                self.error = e
+        finally:
+            if writer is not None:
+                writer.close()
+            self.channel.close()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the capture to end, returns True if it ended normally or was stopped.
+        """
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            return False
+        if self.error is not None:
+            print(f"[ERR]: Capture stream failed: {self.error}")
+            return False
+        if self.exit_status != 0 and not self.stopped:
+            print(f"[ERR]: Capture command exited with {self.exit_status}: {self.stderr}")
+            return False
+        print(f"[INFO]: Captured {self.elapsed_sec:.2f}s of audio in {time.time() - self.start_time:.2f}s")
+        return True
+
+    def stop(self):
+        """
+        End the capture early, frames received so far are kept.
+        """
+        self.stopped = True
+        if self.channel is not None:
+            self.channel.close()
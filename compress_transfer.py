@@ -0,0 +1,224 @@
+import os
+import time
+import zlib
+import shlex
+import shutil
+import subprocess
+import soundfile as sf
+
+CODECS = ("flac", "zstd", "gzip")   # preference order, flac only applies to WAV files
+RECV_BYTES = 1024 * 1024
+DECODE_FRAMES = 1 << 16
+
+NOT_A_FILE_STATUS = 3
+
+# device side commands writing the compressed file to stdout
+REMOTE_COMMANDS = {
+    "flac": "flac -s -c --fast --ignore-chunk-sizes -- {path}",
+    "zstd": "zstd -q -c -1 -- {path}",
+    "gzip": "gzip -c -1 < {path}",
+}
+REMOTE_CHECK = f"[ -f {{path}} ] || exit {NOT_A_FILE_STATUS}; "
+
+
+def local_codecs():
+    """
+    Codecs that can be decoded on this host.
+    """
+    codecs = ["gzip"]
+    if "FLAC" in sf.available_formats():
+        codecs.append("flac")
+    try:
+        import zstandard  # noqa: F401
+        codecs.append("zstd")
+    except ImportError:
+        if shutil.which("zstd"):
+            codecs.append("zstd")
+    return [c for c in CODECS if c in codecs]
+
+
+class CompressedTransfer:
+    """
+    Download files compressed on the device as part of the stream.
+    The codec is negotiated from the tools installed on the device and the decoders
+    available locally: WAV recordings go through FLAC (decoded back to WAV with
+    soundfile, sample exact), other files or devices without flac use a fast
+    generic codec (zstd, then gzip) that is decoded while it is received.
+    """
+    def __init__(self, transport, codecs=None):
+        self.transport = transport
+        # codecs usable with this device, probed on first use unless given
+        self.codecs = codecs
+
+    def _exec(self, command):
+        channel = self.transport.open_session()
+        channel.exec_command(command)
+        return channel
+
+    def remote_codecs(self):
+        """
+        Codecs both the device and this host support, in preference order.
+        """
+        if self.codecs is None:
+            channel = self._exec("for c in " + " ".join(CODECS) +
+                                 "; do command -v $c >/dev/null 2>&1 && echo $c; done; true")
+            found = channel.makefile('rb').read().decode("utf-8", "replace").split()
+            channel.recv_exit_status()
+            channel.close()
+            self.codecs = [c for c in local_codecs() if c in found]
+            print(f"[INFO]: Compressed transfer codecs: {', '.join(self.codecs) or 'none'}")
+        return self.codecs
+
+    def candidates(self, remote_path, compress="auto"):
+        """
+        Codecs to try for remote_path, compress is "auto" or a codec name.
+        """
+        available = self.remote_codecs()
+        if compress not in (None, "auto") and compress not in CODECS:
+            raise ValueError(f"Invalid compression: {compress}")
+        if compress in available:
+            order = [compress] + [c for c in available if c != compress]
+        else:
+            if compress not in (None, "auto"):
+                print(f"[WARN]: {compress} is not available on both sides, negotiating another codec.")
+            order = list(available)
+        if not remote_path.lower().endswith(".wav"):
+            order = [c for c in order if c != "flac"]
+        return order
+
+    def _receive(self, channel, out):
+        """
+        Copy the channel stdout into out.write, returns the number of bytes received.
+        """
+        received = 0
+        while True:
+            data = channel.recv(RECV_BYTES)
+            if not data:
+                break
+            received += len(data)
+            out(data)
+        return received
+
+    def _finish(self, channel):
+        error = channel.makefile_stderr('rb').read().decode("utf-8", "replace").strip()
+        status = channel.recv_exit_status()
+        channel.close()
+        if status == NOT_A_FILE_STATUS:
+            raise FileNotFoundError("not a regular file on the device")
+        if status != 0:
+            raise RuntimeError(f"remote encoder exited with {status}: {error}")
+
+    def _download_flac(self, channel, part_path):
+        spool_path = part_path + ".flac"
+        try:
+            with open(spool_path, 'wb') as f:
+                received = self._receive(channel, f.write)
+            self._finish(channel)
+            with sf.SoundFile(spool_path) as src:
+                with sf.SoundFile(part_path, 'w', src.samplerate, src.channels, src.subtype, format="WAV") as dst:
+                    for block in src.blocks(DECODE_FRAMES, dtype="int32"):
+                        dst.write(block)
+        finally:
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+        return received
+
+    def _download_gzip(self, channel, part_path):
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        with open(part_path, 'wb') as f:
+            received = self._receive(channel, lambda data: f.write(decoder.decompress(data)))
+            f.write(decoder.flush())
+        self._finish(channel)
+        if not decoder.eof:
+            raise EOFError("truncated gzip stream")
+        return received
+
+    def _download_zstd(self, channel, part_path):
+        try:
+            import zstandard
+        except ImportError:
+            zstandard = None
+        with open(part_path, 'wb') as f:
+            if zstandard is not None:
+                decoder = zstandard.ZstdDecompressor().decompressobj()
+                received = self._receive(channel, lambda data: f.write(decoder.decompress(data)))
+                self._finish(channel)
+                if not decoder.eof:
+                    raise EOFError("truncated zstd stream")
+            else:
+                proc = subprocess.Popen(["zstd", "-d", "-q", "-c"], stdin=subprocess.PIPE, stdout=f,
+                                        stderr=subprocess.PIPE)
+                try:
+                    received = self._receive(channel, proc.stdin.write)
+                finally:
+                    proc.stdin.close()
+                    proc.wait()
+                self._finish(channel)
+                if proc.returncode != 0:
+                    error = proc.stderr.read().decode("utf-8", "replace").strip()
+                    raise RuntimeError(f"local zstd exited with {proc.returncode}: {error}")
+        return received
+
+    def download(self, remote_path, local_path, compress="auto", mtime=None):
+        """
+        Download remote_path to local_path (a file or an existing folder), compressed on the wire.
+        mtime: remote modification time applied to the local file, if known.
+        Returns the codec used, or None if no codec could transfer the file.
+        """
+        if os.path.isdir(local_path):
+            local_path = os.path.join(local_path, os.path.basename(remote_path))
+        os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+        part_path = local_path + ".part"
+        for codec in self.candidates(remote_path, compress):
+            t0 = time.time()
+            quoted = shlex.quote(remote_path)
+            channel = self._exec(REMOTE_CHECK.format(path=quoted) + REMOTE_COMMANDS[codec].format(path=quoted))
+            try:
+                received = getattr(self, f"_download_{codec}")(channel, part_path)
+            except FileNotFoundError:
+                # e.g. a folder, left to the caller's plain copy
+                channel.close()
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                return None
+            except Exception as e:
+                print(f"[WARN]: {codec} transfer of {remote_path} failed ({e}), trying the next codec.")
+                channel.close()
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                continue
+            os.replace(part_path, local_path)
+            if mtime is not None:
+                os.utime(local_path, (mtime, mtime))
+            size = os.path.getsize(local_path)
+            elapsed = time.time() - t0
+            print(f"[INFO]: Downloaded {remote_path} via {codec}: {received / 1e6:.2f} MB on the wire for "
+                  f"{size / 1e6:.2f} MB ({size / max(received, 1):.1f}x) in {elapsed:.2f}s")
+            return codec
+        return None
+
+
+if __name__ == '__main__':
+    import argparse
+    from ssh_client import SSHClient
+    parser = argparse.ArgumentParser(description='Compare plain and compressed downloads of a remote file')
+    parser.add_argument("remote_file", type=str, help="Remote file to download")
+    parser.add_argument("--host", type=str, default="192.168.50.140", help="Remote host")
+    parser.add_argument("-u", "--user", type=str, default="root", help="SSH user name")
+    parser.add_argument("-p", "--password", type=str, default="test0000", help="SSH password")
+    parser.add_argument("-o", "--output", type=str, default="./tmp/", help="Local output folder")
+    args = parser.parse_args()
+
+    ssh_client = SSHClient(hostname=args.host, username=args.user, password=args.password)
+    if ssh_client.connect():
+        os.makedirs(args.output, exist_ok=True)
+        local_path = os.path.join(args.output, os.path.basename(args.remote_file))
+        t0 = time.time()
+        ssh_client.scp_client.get(args.remote_file, local_path)
+        print(f"[BENCH]: scp: {time.time() - t0:.2f}s")
+        engine = CompressedTransfer(ssh_client.client.get_transport())
+        for codec in engine.candidates(args.remote_file):
+            t0 = time.time()
+            engine.download(args.remote_file, local_path, codec)
+            print(f"[BENCH]: {codec}: {time.time() - t0:.2f}s")
+        ssh_client.close()
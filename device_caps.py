@@ -0,0 +1,251 @@
+import re
+import time
+import shlex
+import threading
+
+CAPS_TTL_SEC = 300         # age after which the sound card list is checked again for hotplug
+
+TOOLS = {"playback": "aplay", "capture": "arecord"}
+# -c 256 is refused by every card right after the parameters are dumped, so nothing is
+# played or recorded even on devices accepting the default raw U8 format
+HW_DUMP_COMMAND = "{tool} -D {device} --dump-hw-params -c 256 /dev/zero 2>&1"
+FINGERPRINT_COMMAND = "cat /proc/asound/cards 2>/dev/null; ls /dev/snd 2>/dev/null"
+SECTION_MARKER = "@@caps"
+
+# commands after which cached tables no longer describe the device
+INVALIDATE_CRAS = re.compile(r"\brestart\s+(?:vibe-dsp-server|cras)\b|cras_test_client\s+--(?:plug|unplug)")
+INVALIDATE_ALL = re.compile(r"\b(?:modprobe|rmmod|insmod|reboot)\b")
+
+CARD_LINE = re.compile(r"^card\s+(\d+):\s+(\S+)\s+\[([^\]]*)\],\s+device\s+(\d+):\s*(.*)$")
+
+
+def parse_alsa_cards(output):
+    """
+    Cards of `aplay -l`/`arecord -l` output, one dict per card device.
+    """
+    cards = []
+    for line in (output or "").splitlines():
+        m = CARD_LINE.match(line.strip())
+        if m:
+            card, card_id, card_name, device, name = m.groups()
+            cards.append({"card": int(card), "id": card_id, "name": card_name, "device": int(device),
+                          "device_name": name, "line": line.strip(), "hw": f"hw:{card},{device}",
+                          "hw_id": f"hw:{card_id},{device}"})
+    return cards
+
+
+def parse_hw_params(output):
+    """
+    FORMAT list and CHANNELS/RATE/SAMPLE_BITS ranges ({'min', 'max'}) of a --dump-hw-params output.
+    """
+    result = {}
+    format_match = re.search(r'FORMAT:\s+([A-Z0-9_ ]+)', output)
+    if format_match:
+        result['FORMAT'] = format_match.group(1).split()
+    for key in ("CHANNELS", "RATE", "SAMPLE_BITS"):
+        m = re.search(key + r':\s+[\[(]?(\d+)(?:\s+(\d+))?[\])]?', output)
+        if m:
+            low = int(m.group(1))
+            result[key] = {'min': low, 'max': int(m.group(2)) if m.group(2) else low}
+    return result
+
+
+def cras_node_id(cras_info, device_name, direction="Output"):
+    """
+    "<device id>:0" of the first CRAS device of direction ("Output"/"Input") matching device_name.
+    """
+    try:
+        section = cras_info.split(f"{direction} Devices:")[1].split(f"{direction} Nodes:")[0]
+    except (AttributeError, IndexError):
+        return None
+    node_id = re.findall(r"\s+(\d+)[^\n]*" + re.escape(device_name) + r"[^\n]*", section)
+    return node_id[0] + ":0" if node_id else None
+
+
+class DeviceCaps:
+    """
+    Audio capabilities of one device: ALSA card lists, --dump-hw-params results and the
+    CRAS device table, probed once and answered locally afterwards.
+    run(command) -> str runs a device command and returns its stdout and stderr.
+    Everything is dropped when a command that reloads the audio stack goes through
+    observe(), the CRAS table on a CRAS/vibe-dsp-server restart. Once ttl has passed the
+    card list is compared with the device (one round trip) to catch hotplugged cards.
+    """
+    def __init__(self, run, ttl=CAPS_TTL_SEC):
+        self.run = run
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.stats = {"probes": 0, "hits": 0, "invalidations": 0}
+        self.cards = {}  # direction -> card devices
+        self.hw_dumps = {}  # (direction, device) -> --dump-hw-params output
+        self.cras_info = None
+        self.fingerprint = None  # sound card list the tables were built from
+        self.checked_at = 0
+
+    def invalidate(self, cras_only=False):
+        with self.lock:
+            self.cras_info = None
+            if not cras_only:
+                self.cards = {}
+                self.hw_dumps = {}
+                self.fingerprint = None
+                self.checked_at = 0
+            self.stats["invalidations"] += 1
+
+    def observe(self, command):
+        """
+        Drop what a command about to run on the device makes stale.
+        """
+        if INVALIDATE_ALL.search(command):
+            self.invalidate()
+        elif INVALIDATE_CRAS.search(command):
+            self.invalidate(cras_only=True)
+
+    def _probe(self, command):
+        self.stats["probes"] += 1
+        return self.run(command) or ""
+
+    def _revalidate(self):
+        """
+        After ttl, keep the tables if the sound cards did not change, reload them otherwise.
+        """
+        if self.fingerprint is None:
+            # first probe since the last reload, remember the cards it describes
+            self.fingerprint = self._probe(FINGERPRINT_COMMAND)
+            self.checked_at = time.time()
+            return
+        if time.time() - self.checked_at < self.ttl:
+            return
+        fingerprint = self._probe(FINGERPRINT_COMMAND)
+        if fingerprint != self.fingerprint:
+            print("[INFO]: Sound cards changed on the device, reloading capabilities.")
+            self.invalidate()
+        else:
+            # node ids may move without a card change
+            self.cras_info = None
+            self.checked_at = time.time()
+
+    @staticmethod
+    def _sections(output):
+        sections = {}
+        key = None
+        for line in output.splitlines(keepends=True):
+            if line.startswith(SECTION_MARKER + " "):
+                key = line[len(SECTION_MARKER) + 1:].strip()
+                sections[key] = ""
+            elif key is not None:
+                sections[key] += line
+        return sections
+
+    def prefill(self, cras=True):
+        """
+        Probe card lists, playback hw params of every card (captures are often held by a
+        service and are probed on first use) and the CRAS table in one round trip.
+        """
+        dump = HW_DUMP_COMMAND.format(tool="aplay", device="hw:$n,$d")
+        script = (
+            f"echo '{SECTION_MARKER} fingerprint'; {FINGERPRINT_COMMAND}; "
+            f"echo '{SECTION_MARKER} cards playback'; aplay -l 2>&1; "
+            f"echo '{SECTION_MARKER} cards capture'; arecord -l 2>&1; "
+            f"aplay -l 2>/dev/null | sed -n 's/^card \\([0-9]*\\): \\([^ ]*\\) .*device \\([0-9]*\\):.*/\\1 \\2 \\3/p' | "
+            f"while read n id d; do echo \"{SECTION_MARKER} hw playback hw:$n,$d hw:$id,$d\"; {dump} </dev/null; done"
+        )
+        if cras:
+            script += f"; echo '{SECTION_MARKER} cras'; cras_test_client 2>&1"
+        with self.lock:
+            sections = self._sections(self._probe(script))
+            self.fingerprint = sections.get("fingerprint")
+            self.checked_at = time.time()
+            for direction in TOOLS:
+                self.cards[direction] = parse_alsa_cards(sections.get(f"cards {direction}"))
+            for key, text in sections.items():
+                if key.startswith("hw ") and "FORMAT:" in text:
+                    _, direction, *devices = key.split()
+                    for device in devices:
+                        self.hw_dumps[(direction, device)] = text
+            if cras and "Devices:" in sections.get("cras", ""):
+                self.cras_info = sections["cras"]
+            print(f"[INFO]: Audio capabilities loaded: {len(self.cards['playback'])} playback, "
+                  f"{len(self.cards['capture'])} capture device(s), "
+                  f"{len(self.hw_dumps)} hw params, CRAS {'yes' if self.cras_info else 'no'}")
+        return self
+
+    def alsa_cards(self, direction):
+        """
+        Card devices of direction ("playback" or "capture").
+        """
+        with self.lock:
+            self._revalidate()
+            if direction not in self.cards:
+                self.cards[direction] = parse_alsa_cards(self._probe(f"{TOOLS[direction]} -l 2>&1"))
+            else:
+                self.stats["hits"] += 1
+            return self.cards[direction]
+
+    def find_alsa_card(self, name, direction):
+        """
+        First card device of direction whose `-l` line contains name (case-insensitive).
+        """
+        for card in self.alsa_cards(direction):
+            if name.lower() in card["line"].lower():
+                return card
+        return None
+
+    def hw_dump(self, device, direction):
+        """
+        Raw --dump-hw-params output of device, cached once it holds the parameters
+        (a busy device only returns an error, which is not cached).
+        """
+        with self.lock:
+            self._revalidate()
+            text = self.hw_dumps.get((direction, device))
+            if text is not None:
+                self.stats["hits"] += 1
+                return text
+            text = self._probe(HW_DUMP_COMMAND.format(tool=TOOLS[direction], device=shlex.quote(device)))
+            if "FORMAT:" in text:
+                self.hw_dumps[(direction, device)] = text
+            return text
+
+    def hw_params(self, device, direction):
+        """
+        Parsed hardware parameters of device, None if the device did not report them.
+        """
+        text = self.hw_dump(device, direction)
+        return parse_hw_params(text) if "FORMAT:" in text else None
+
+    def check(self, device, direction, rate, channels, audio_format):
+        """
+        Validate a stream configuration against the cached parameters, returns (ok, message).
+        """
+        params = self.hw_params(device, direction)
+        if params is None:
+            return False, f"Failed to check audio parameters for device {device}."
+        formats = params.get('FORMAT', [])
+        if audio_format.upper() not in formats:
+            return False, f"Unsupported audio format: {audio_format}. Supported formats: {formats}"
+        c_min, c_max = params.get('CHANNELS', {}).get('min', 1), params.get('CHANNELS', {}).get('max', 2)
+        if channels < c_min or channels > c_max:
+            return False, f"Unsupported number of channels: {channels}. Supported range: {c_min} - {c_max}"
+        r_min, r_max = params.get('RATE', {}).get('min', 8000), params.get('RATE', {}).get('max', 192000)
+        if rate < r_min or rate > r_max:
+            return False, f"Unsupported sample rate: {rate}. Supported range: {r_min} - {r_max}"
+        return True, ""
+
+    def cras_dump(self):
+        """
+        Output of `cras_test_client` (device and node tables).
+        """
+        with self.lock:
+            self._revalidate()
+            if self.cras_info is None:
+                text = self._probe("cras_test_client 2>&1")
+                if "Devices:" not in text:
+                    return text
+                self.cras_info = text
+            else:
+                self.stats["hits"] += 1
+            return self.cras_info
+
+    def cras_node(self, device_name, direction="Output"):
+        return cras_node_id(self.cras_dump(), device_name, direction)
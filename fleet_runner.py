@@ -0,0 +1,217 @@
+import os
+import csv
+import time
+import contextlib
+import configparser
+import numpy as np
+from multiprocessing import Pool
+from tabulate import tabulate
+from ssh_client import SSHClient
+from audio_module import AudioModule
+from audio_analyzer import AudioAnalyzer
+from pesq_score import PesqScore, wavfile_rate
+
+STEPS = ("record", "pesq", "doa", "spectrum")
+DEFAULT_CONCURRENCY = 8       # devices tested at the same time
+
+REPORT_FIELDS = ["device", "hostname", "status", "elapsed", "record", "pesq", "doa_blocks", "spectrum",
+                 "rtt_ms", "reconnects", "error"]
+
+
+def load_inventory(inventory_file):
+    """
+    Devices of an inventory ini file: one section per device with its hostname, shared
+    settings (username, password, port, engine, mic, speaker, rate, channels, audio_format)
+    in [DEFAULT] and overridable per device.
+    """
+    config = configparser.ConfigParser()
+    if not config.read(inventory_file):
+        raise FileNotFoundError(f"Inventory {inventory_file} not found")
+    devices = []
+    for name in config.sections():
+        section = config[name]
+        devices.append({
+            "name": name,
+            "hostname": section.get("hostname", name),
+            "port": section.getint("port", 22),
+            "username": section.get("username", "root"),
+            "password": section.get("password", "test0000"),
+            "engine": section.get("engine", "alsa"),
+            "mic": section.get("mic", "hw:vibemicarray,0"),
+            "speaker": section.get("speaker", "default"),
+            "rate": section.getint("rate", 16000),
+            "channels": section.getint("channels", 8),
+            "audio_format": section.get("audio_format", "S16_LE"),
+        })
+    return devices
+
+
+class DeviceRun:
+    """
+    The test sequence of one device over its own connection: record the reference played
+    on the device speaker, then score and analyse the recording locally.
+    Every step records its result in self.result, a failed step stops the sequence.
+    """
+    def __init__(self, device, steps, ref_audio, output_dir):
+        self.device = device
+        self.steps = steps
+        self.ref_audio = ref_audio
+        self.output_dir = output_dir
+        self.record_file = os.path.join(output_dir, f"record_{device['name']}.wav")
+        self.ssh_client = None
+        self.offset_sec = None  # start of the reference in the recording, measured by step_record
+        self.result = {"device": device["name"], "hostname": device["hostname"], "status": "OK"}
+
+    def _audio_module(self, device):
+        audio_module = AudioModule()
+        audio_module.set_ssh_connect(self.ssh_client)
+        audio_module.paras_settings(rate=self.device["rate"], channels=self.device["channels"],
+                                    audio_format=self.device["audio_format"], engine=self.device["engine"],
+                                    device=device)
+        return audio_module
+
+    def step_record(self):
+        # one device command plays the reference and records it, and measures where it starts
+        recorder = self._audio_module(self.device["mic"])
+        self.offset_sec = recorder.play_and_record(self.ref_audio, self.record_file, self.device["speaker"])
+        self.result["record"] = self.record_file
+        return self.offset_sec is not None
+
+    def step_pesq(self):
+        rows = PesqScore().pesq_calc(self.ref_audio, [self.record_file],
+                                     output_csv=os.path.join(self.output_dir, "pesq.csv"), jobs=1,
+                                     offset_hint=self.offset_sec)
+        self.result["pesq"] = rows[0][2] if rows else None
+        return bool(rows) and rows[0][1] == "OK"
+
+    def _analyzer(self):
+        audio_module = AudioModule()
+        audio_module.set_ssh_connect(self.ssh_client)
+        analyzer = AudioAnalyzer(audio_module)
+        analyzer.set_ssh_connect(self.ssh_client)
+        analyzer.output_dir = self.output_dir
+        return analyzer
+
+    def step_doa(self):
+        analyzer = self._analyzer()
+        ret = analyzer.audio_analyzing(self.ref_audio, self.record_file, method="DOA")
+        self.result["doa_blocks"] = len(analyzer.doa_records)
+        return ret
+
+    def step_spectrum(self):
+        ret = self._analyzer().audio_analyzing(self.ref_audio, self.record_file, method="Spectrum")
+        self.result["spectrum"] = self.output_dir
+        return ret
+
+    def run(self):
+        t0 = time.time()
+        self.ssh_client = SSHClient(hostname=self.device["hostname"], username=self.device["username"],
+                                    password=self.device["password"], port=self.device["port"])
+        try:
+            if not self.ssh_client.connect():
+                self.result["status"] = "UNREACHABLE"
+                return self.result
+            for step in self.steps:
+                print(f"[INFO]: Running step {step} on {self.device['name']}.")
+                try:
+                    ok = getattr(self, f"step_{step}")()
+                except Exception as e:
+                    self.result["error"] = f"{step}: {e}"
+                    ok = False
+                if not ok:
+                    self.result["status"] = f"FAILED ({step})"
+                    break
+        finally:
+            health = self.ssh_client.health()
+            self.result["rtt_ms"] = health["rtt_avg_ms"]
+            self.result["reconnects"] = health["reconnects"]
+            self.ssh_client.close()
+            self.result["elapsed"] = round(time.time() - t0, 2)
+        return self.result
+
+
+def run_device(task):
+    """
+    Pool worker: run one device, its console output goes to run.log in its output folder.
+    """
+    device, steps, ref_audio, output_dir = task
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "run.log"), 'w', encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log):
+        try:
+            return DeviceRun(device, steps, ref_audio, output_dir).run()
+        except Exception as e:
+            print(f"[ERR]: Device run failed: {e}")
+            return {"device": device["name"], "hostname": device["hostname"], "status": "ERROR", "error": str(e)}
+
+
+class FleetRunner:
+    """
+    Runs the same test sequence on every device of an inventory.
+    Each device gets its own worker process and connection (the analysis steps hold the
+    GIL and pyplot is not thread safe), at most `concurrency` devices at a time, so the
+    total time grows with the number of devices divided by the concurrency instead of
+    with the number of devices. Results are gathered into one report.
+    """
+    def __init__(self, devices, steps=STEPS, ref_audio="./plays/p257_023_women.wav", output_dir="./records/fleet/", concurrency=DEFAULT_CONCURRENCY):
+        self.devices = devices
+        self.steps = [s for s in steps if s in STEPS]
+        self.ref_audio = os.path.abspath(ref_audio)
+        self.output_dir = os.path.join(output_dir, time.strftime("%Y%m%d_%H%M%S"))
+        self.concurrency = max(1, min(concurrency, len(devices)))
+
+    def run(self):
+        """
+        Run all devices, returns the report rows in inventory order.
+        """
+        if not self.devices:
+            print("[ERR]: No device in the inventory.")
+            return []
+        t0 = time.time()
+        if "pesq" in self.steps:
+            # built once here, the workers load it from the shared cache
+            scorer = PesqScore()
+            rate = 16000 if wavfile_rate(self.ref_audio) > 8000 else 8000
+            scorer.get_reference_profile(self.ref_audio, rate).save(scorer.cache_dir)
+        tasks = [(device, self.steps, self.ref_audio, os.path.join(self.output_dir, device["name"]))
+                 for device in self.devices]
+        print(f"[INFO]: Running {', '.join(self.steps)} on {len(tasks)} device(s), {self.concurrency} at a time.")
+        results = {}
+        with Pool(self.concurrency) as pool:
+            for result in pool.imap_unordered(run_device, tasks):
+                results[result["device"]] = result
+                print(f"[{len(results)}/{len(tasks)}]: {result['device']} {result['status']} "
+                      f"in {result.get('elapsed', 0)}s")
+        rows = [results[device["name"]] for device in self.devices]
+        self.write_report(rows)
+        print(f"[INFO]: Fleet run finished in {time.time() - t0:.1f}s")
+        return rows
+
+    def write_report(self, rows):
+        os.makedirs(self.output_dir, exist_ok=True)
+        report_file = os.path.join(self.output_dir, "report.csv")
+        with open(report_file, 'w', encoding="utf-8", newline="") as f:
+            f.write(f"# Timestamp: {np.datetime64('now')}\n")
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        print(tabulate([[row.get(k, "") for k in REPORT_FIELDS] for row in rows], headers=REPORT_FIELDS,
+                       tablefmt="grid"))
+        print(f"\nResults have been saved to {report_file}, device logs in {self.output_dir}")
+        return report_file
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Run the same audio test on many devices in parallel')
+    parser.add_argument("-i", "--inventory", type=str, default="./fleet_default.ini", help="Device inventory ini file")
+    parser.add_argument("-j", "--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Devices tested at once")
+    parser.add_argument("-s", "--steps", type=str, nargs='+', choices=STEPS, default=["record", "pesq", "doa"],
+                        help="Steps run on each device, in order")
+    parser.add_argument("-r", "--ref", type=str, default="./plays/p257_023_women.wav", help="Reference audio")
+    parser.add_argument("-o", "--output", type=str, default="./records/fleet/", help="Report folder")
+    args = parser.parse_args()
+
+    runner = FleetRunner(load_inventory(args.inventory), args.steps, args.ref, args.output,
+                         args.concurrency)
+    runner.run()
@@ -1,34 +1,213 @@
 import os
+import csv
+import multiprocessing
+from math import gcd
+from multiprocessing import shared_memory
 import numpy as np
 from scipy.io import wavfile
 from scipy import signal
 from pesq import pesq
 from tabulate import tabulate
+from align_engine import AlignEngine
+from analysis_cache import AnalysisCache
+from wav_io import WavReader, read_channel, wav_info
+
+def wavfile_rate(path):
+    """
+    Sample rate from the WAV header, without reading the samples.
+    """
+    with WavReader(path) as reader:
+        return reader.sample_rate
+
+
+SEG_SNR_CLAMP_DB = (-10.0, 35.0)  # usual segmental SNR per-frame range
+
+
+def segmental_snr(ref_data, deg_data, frame_size, ref_energy=None, clamp_db=None, vad_db=None):
+    """
+    Segmental SNR over non-overlapping frames, computed on all frames at once.
+    ref_energy: precomputed reference frame energies, see ReferenceProfile.frame_energies.
+    clamp_db: (low, high) range each frame SNR is clipped to before averaging.
+    vad_db: only average frames whose reference energy is within vad_db of the loudest frame.
+    Returns (mean_snr, frame_snr, active) where active marks the averaged frames.
+    """
+    n_frames = min(len(ref_data), len(deg_data)) // frame_size
+    if n_frames == 0:
+        return 0.0, np.zeros(0), np.zeros(0, dtype=bool)
+    n = n_frames * frame_size
+    ref_frames = np.asarray(ref_data[:n], dtype=np.float64).reshape(n_frames, frame_size)
+    noise = np.asarray(deg_data[:n], dtype=np.float64).reshape(n_frames, frame_size) - ref_frames
+    if ref_energy is None:
+        ref_energy = np.einsum('ij,ij->i', ref_frames, ref_frames)
+    ref_energy = ref_energy[:n_frames]
+    noise_energy = np.einsum('ij,ij->i', noise, noise)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frame_snr = 10 * np.log10(ref_energy / noise_energy)
+    # silent noise is a perfect frame even over a silent reference
+    frame_snr[noise_energy == 0] = np.inf
+    if clamp_db is not None:
+        frame_snr = np.clip(frame_snr, clamp_db[0], clamp_db[1])
+    active = np.ones(n_frames, dtype=bool)
+    if vad_db is not None and ref_energy.max() > 0:
+        active = ref_energy >= ref_energy.max() * 10 ** (-vad_db / 10)
+    if not active.any():
+        return 0.0, frame_snr, active
+    return float(np.mean(frame_snr[active])), frame_snr, active
+
+
+class ReferenceProfile:
+    """
+    Everything derived from a reference file that every degraded file is scored against:
+    the signal resampled to the scoring rate, its RMS, the reference spectra used by the
+    alignment engine and the frame energies used by segmental SNR.
+    Profiles are persisted as .npz under the cache directory, keyed by content hash and rate.
+    The spectra are not persisted: one per FFT size adds up to several times the samples,
+    they are rebuilt on first use and the alignment engine keeps the recent ones.
+    """
+    def __init__(self, ref_file, rate, data, digest, rms=None):
+        self.ref_file = ref_file
+        self.rate = rate
+        self.data = data
+        self.digest = digest
+        if rms is None:
+            rms = float(np.sqrt(np.mean(data.astype(np.float64)**2))) if len(data) else 0.0
+        self.rms = rms
+        self.spectra = {}        # (decimate, nfft) -> conj(rfft(ref, nfft)), filled and bounded by AlignEngine
+        self.frame_energy = {}   # frame_size -> sum of squares of each full frame
+        self._saved_keys = set()
+
+    @staticmethod
+    def profile_path(cache_dir, digest, rate):
+        return os.path.join(cache_dir, "ref_profiles", f"{digest}_{rate}.npz")
+
+    @classmethod
+    def load_or_build(cls, ref_file, rate=None, cache_dir="./cache/", cache=None):
+        """
+        Load the profile of ref_file at rate (native rate if None) from the cache directory,
+        or build it from the WAV file.
+        """
+        cache = cache if cache is not None else AnalysisCache(cache_dir)
+        digest = cache.file_digest(ref_file)
+        rate = rate if rate is not None else wavfile_rate(ref_file)
+        path = cls.profile_path(cache_dir, digest, rate)
+        if os.path.exists(path):
+            try:
+                return cls._load(ref_file, path, digest)
+            except Exception as e:
+                print(f"[WARN]: Failed to load reference profile {path}, rebuilding: {e}")
+        # scores are computed on the integer sample scale, like the aligned files written out
+        ref_data, _ = read_channel(ref_file, 0, rate, normalize=False)
+        profile = cls(ref_file, rate, ref_data, digest)
+        profile.save(cache_dir)
+        return profile
+
+    @classmethod
+    def _load(cls, ref_file, path, digest):
+        with np.load(path) as npz:
+            arrays = {name: npz[name] for name in npz.files if not name.startswith("spec_")}
+            # profiles saved with spectra are rewritten without them on the next save
+            legacy = len(arrays) < len(npz.files)
+        profile = cls.from_arrays(ref_file, int(arrays["rate"]), digest, arrays)
+        profile._saved_keys = None if legacy else set(profile.frame_energy)
+        return profile
+
+    @classmethod
+    def from_arrays(cls, ref_file, rate, digest, arrays, rms=None):
+        """
+        Rebuild a profile from the named arrays of arrays().
+        """
+        profile = cls(ref_file, rate, arrays["data"], digest, rms=rms)
+        for name, value in arrays.items():
+            if name.startswith("spec_"):
+                _, decimate, nfft = name.split("_")
+                profile.spectra[(int(decimate), int(nfft))] = value
+            elif name.startswith("frame_"):
+                profile.frame_energy[int(name.split("_")[1])] = value
+        return profile
+
+    def arrays(self, spectra=True):
+        """
+        The samples, spectra (if set) and frame energies as named arrays.
+        """
+        arrays = {"data": self.data}
+        for (decimate, nfft), spec in (self.spectra.items() if spectra else ()):
+            arrays[f"spec_{decimate}_{nfft}"] = spec
+        for frame_size, energy in self.frame_energy.items():
+            arrays[f"frame_{frame_size}"] = energy
+        return arrays
+
+    def frame_energies(self, frame_size):
+        """
+        Energy of each full frame of frame_size samples.
+        """
+        energy = self.frame_energy.get(frame_size)
+        if energy is None:
+            n_frames = len(self.data) // frame_size
+            frames = self.data[:n_frames * frame_size].astype(np.float64).reshape(n_frames, frame_size)
+            energy = np.einsum('ij,ij->i', frames, frames)
+            self.frame_energy[frame_size] = energy
+        return energy
+
+    def save(self, cache_dir="./cache/"):
+        """
+        Persist the profile if new frame energies were computed since the last save.
+        """
+        keys = set(self.frame_energy)
+        path = self.profile_path(cache_dir, self.digest, self.rate)
+        if os.path.exists(path) and self._saved_keys is not None and keys <= self._saved_keys:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = dict(self.arrays(spectra=False), rate=np.array(self.rate))
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        self._saved_keys = keys
+
 
 class PesqScore:
-    def __init__(self, bw="auto"):
+    def __init__(self, bw="auto", align_decimate=1, jobs=1):
         """
         bw: "nb" is narrowband (8kHz), "wb" is wideband (16kHz), "auto" decides based on sample rate.
+        align_decimate: > 1 enables the coarse-to-fine alignment search with this decimation factor.
+        jobs: worker processes for batch scoring, 0 for one per CPU.
         """
         self.bw = bw
+        self.jobs = jobs if jobs > 0 else os.cpu_count()
         self.tor_sec = 1  # tolerance in seconds for alignment
+        # a known capture offset is only ever early by the clock jitter: capture periods and the
+        # player/DSP latency delay the real start, so the search mostly extends after the hint
+        self.hint_early_sec = 0.02
+        self.align_engine = AlignEngine(decimate=align_decimate)
         self.mics = 6
         self.cache_dir = "./cache/"
         self.pesq_def_path = self.cache_dir + "pesq_results.csv"
         self.snr_def_path = self.cache_dir + "snr_results.csv"
+        self.ref_profiles = {}  # (ref_file, rate) -> ReferenceProfile shared by pesq_calc and snr_calc
+        self.last_headers = None  # table headers of the last batch, e.g. the PESQ mode picked from the reference
+        self.cache = AnalysisCache(self.cache_dir)
 
-    def _find_best_offset(self, ref_signal, deg_signal):
+    def _find_best_offset(self, ref_signal, deg_signal, min_lag=None, max_lag=None):
         """
         Calculate the best offset between reference and degraded audio signals.
-        Uses cross-correlation to find the optimal alignment.
+        Uses FFT cross-correlation restricted to [min_lag, max_lag] to find the optimal alignment.
         ref_signal: Reference audio signal (numpy array).
         deg_signal: Degraded audio signal (numpy array).
         Returns the offset in samples.
         """
-        corr = signal.correlate(deg_signal, ref_signal, mode='full')
-        max_idx = np.argmax(corr)
-        offset = max_idx - (len(ref_signal) - 1)
-        return offset
+        return self.align_engine.find_offset(deg_signal, min_lag, max_lag, ref_signal=ref_signal)
+
+    def get_reference_profile(self, ref_file, rate=None):
+        """
+        Reference profile of ref_file at rate, built once and reused while the file is unchanged.
+        """
+        digest = self.cache.file_digest(ref_file)
+        rate = rate if rate is not None else wavfile_rate(ref_file)
+        profile = self.ref_profiles.get((ref_file, rate))
+        if profile is None or profile.digest != digest:
+            profile = ReferenceProfile.load_or_build(ref_file, rate, self.cache_dir, self.cache)
+            self.ref_profiles[(ref_file, rate)] = profile
+        self.align_engine.set_reference(profile.data, spectra=profile.spectra)
+        return profile
 
     def _resample_signal(self, signal_data, orig_rate, target_rate):
         """
@@ -39,7 +218,6 @@ class PesqScore:
         """
         if orig_rate == target_rate:
             return signal_data
-        from math import gcd
         g = gcd(orig_rate, target_rate)
         up = target_rate // g
         down = orig_rate // g
@@ -68,29 +246,44 @@ class PesqScore:
                     file_list.append(path)
         return file_list
     
-    def normalize_audio(self, deg_file, ref_data, ref_rate):
+    def _lag_window(self, deg_len, ref_len, rate, offset_hint=None):
+        """
+        Lag window searched to align deg_len samples against ref_len reference samples.
+        """
+        tor = int(self.tor_sec * rate)
+        if offset_hint is not None:
+            hint, early = int(round(offset_hint * rate)), int(self.hint_early_sec * rate)
+            return hint - early, hint + tor
+        # Offsets below -tor are rejected and above len(deg) - len(ref) leave a short tail,
+        # so search a little beyond both bounds to still report those cases.
+        return -2 * tor, deg_len - ref_len + tor
+
+    def normalize_audio(self, deg_file, ref_data, ref_rate, ref_rms=None, offset_hint=None):
+        """
+        Align a degraded file to the reference: rate, channels, start, length and RMS level.
+        offset_hint: known start of the reference in the degraded file in seconds (e.g. from
+        AudioModule.play_and_record), only [hint - hint_early_sec, hint + tor_sec] is searched.
+        """
         if len(ref_data) == 0:
             raise ValueError("Reference audio data is empty.")
         
         try:
-            deg_rate, deg_data = wavfile.read(deg_file)
+            reader = WavReader(deg_file)
         except Exception as e:
             status = f"Read error: {e}"
             return deg_file, status, []
-        deg_data = deg_data.astype(np.float32)
         # 0. check channel number
-        if deg_data.ndim > 2:
-            status = "Invalid audio file"
-            return deg_file, status, []
-        if deg_data.ndim == 2:
-            if deg_data.shape[1] >= self.mics:
+        with reader:
+            deg_rate = reader.sample_rate
+            if reader.channels >= self.mics:
                 # average fist mics channels
-                deg_data = np.mean(deg_data[:, :self.mics], axis=1)
+                deg_data = reader.mix_float(range(self.mics), normalize=False)
                 print(f"[Warn]: Using first {self.mics} channels for averaging.")
             else:
-                # take the first channel
-                print(f"[Warn]: Using the first channel for {deg_file}.")
-                deg_data = deg_data[:, 0]
+                if reader.channels > 1:
+                    # take the first channel
+                    print(f"[Warn]: Using the first channel for {deg_file}.")
+                deg_data = reader.channel_float(0, normalize=False)
 
         # 1. Algin sample rates based on reference audio
         if deg_rate != ref_rate:
@@ -103,7 +296,8 @@ class PesqScore:
             return deg_file, status, []
 
         # 2. Align lengths(time) of reference and degraded audio
-        offset = self._find_best_offset(ref_data, deg_data)
+        min_lag, max_lag = self._lag_window(len(deg_data), len(ref_data), ref_rate, offset_hint)
+        offset = self._find_best_offset(ref_data, deg_data, min_lag, max_lag)
         if offset > 0:
             # Record too early, need to trim the beginning of deg_data
             deg_data = deg_data[int(offset):]
@@ -122,7 +316,8 @@ class PesqScore:
         # Trim to match reference length
         deg_data = deg_data[:len(ref_data)] 
         if len(ref_data) > 0:
-            cur_ref_rms = np.sqrt(np.mean(ref_data**2))
+            # the precomputed reference RMS only holds if the reference was not trimmed
+            cur_ref_rms = ref_rms if ref_rms is not None and offset >= 0 else np.sqrt(np.mean(ref_data**2))
             deg_rms = np.sqrt(np.mean(deg_data**2))
         else:
             status = "Empty tailored audio"
@@ -147,10 +342,158 @@ class PesqScore:
 
         return aligned_deg_file, "OK", deg_data
 
-    def pesq_calc(self, ref_file, deg_files, output_csv=None):
-        # Read audio file
-        ref_rate, ref_data = wavfile.read(ref_file)
-        ref_data = ref_data.astype(np.float32)
+    def _pesq_file(self, deg_file, profile, mode, offset_hints=None):
+        """
+        Score one degraded file against the reference profile, returns a result row.
+        """
+        # Normalize audio rate, channel, length, and RMS levels
+        offset_hint = (offset_hints or {}).get(os.path.abspath(deg_file))
+        aligned_deg_file, status, deg_data = self.normalize_audio(deg_file, profile.data, profile.rate, profile.rms,
+                                                                  offset_hint)
+        if len(deg_data) <= 1:
+            return [deg_file, status, "N/A"]
+
+        # PESQ calculation
+        pesq_score = "N/A"
+        try:
+            pesq_val = pesq(profile.rate, profile.data, deg_data, mode)
+            pesq_score = f"{pesq_val:.2f}"
+        except Exception as e:
+            status = f"PESQ error: {e}"
+        return [aligned_deg_file, status, pesq_score]
+
+    def _snr_file(self, deg_file, profile, seg_frame_ms, clamp_db=None, vad_db=None, keep_frames=False):
+        """
+        SNR of one degraded file against the reference profile, returns a result row,
+        followed by the per-frame (times, frame_snr, active) arrays if keep_frames is set.
+        """
+        ref_rate, ref_data = profile.rate, profile.data
+        aligned_deg_file, status, deg_data = self.normalize_audio(deg_file, ref_data, ref_rate, profile.rms)
+        if status != "OK":
+            return [deg_file, status, "N/A", f"{seg_frame_ms}"]
+        # a late record trims the head of the reference to the aligned degraded length
+        if len(deg_data) < len(ref_data):
+            ref_data = ref_data[len(ref_data) - len(deg_data):]
+        # calculate SNR
+        frames = None
+        if seg_frame_ms > 0:
+            frame_size = int(ref_rate * seg_frame_ms / 1000)
+            if len(deg_data) < frame_size or len(ref_data) < frame_size:
+                return [deg_file, "Frame size too large", "N/A", f"{seg_frame_ms}"]
+            ref_energy = profile.frame_energies(frame_size) if len(ref_data) == len(profile.data) else None
+            snr_value, frame_snr, active = segmental_snr(ref_data, deg_data, frame_size, ref_energy, clamp_db, vad_db)
+            if keep_frames:
+                times = np.arange(len(frame_snr)) * frame_size / ref_rate
+                frames = (times, frame_snr, active)
+        else:
+            # Calculate SNR for the entire signal
+            noise = deg_data - ref_data[:len(deg_data)]
+            if np.sum(noise**2) == 0:
+                snr_value = float('inf')
+            else:
+                 snr_value = 10 * np.log10(np.sum(ref_data**2) / np.sum(noise**2))
+        row = [aligned_deg_file, "OK", f"{snr_value:.2f}", f"{seg_frame_ms}"]
+        return row + [frames] if keep_frames else row
+
+    def _prepare_profile(self, method, deg_list, profile, extra):
+        """
+        Compute the reference spectra and frame energies the batch needs from the degraded
+        file headers, so pool workers receive them instead of each recomputing them.
+        """
+        offset_hints = (extra[1] or {}) if method == "_pesq_file" else {}
+        for deg_file in deg_list:
+            try:
+                info = wav_info(deg_file)
+            except Exception:
+                continue  # the worker reports the read error
+            deg_len = info["num_frames"]
+            if info["sample_rate"] != profile.rate:
+                g = gcd(info["sample_rate"], profile.rate)
+                deg_len = -(-deg_len * (profile.rate // g) // (info["sample_rate"] // g))  # resample_poly length
+            min_lag, max_lag = self._lag_window(deg_len, len(profile.data), profile.rate,
+                                                offset_hints.get(os.path.abspath(deg_file)))
+            self.align_engine.precompute(deg_len, min_lag, max_lag)
+        if method == "_snr_file" and extra[0] > 0:
+            profile.frame_energies(int(profile.rate * extra[0] / 1000))
+
+    def _iter_scores(self, method, deg_list, profile, extra, jobs):
+        """
+        Yield result rows in input order. With jobs > 1 the files are scored in a process pool,
+        and the reference samples, spectra and frame energies are shared with the workers
+        through shared memory.
+        """
+        jobs = min(jobs, len(deg_list))
+        if jobs <= 1:
+            for deg_file in deg_list:
+                yield getattr(self, method)(deg_file, profile, *extra)
+            return
+
+        self._prepare_profile(method, deg_list, profile, extra)
+        arrays = profile.arrays()
+        layout, size = [], 0
+        for name, value in arrays.items():
+            layout.append((name, value.shape, value.dtype.str, size))
+            size += -(-value.nbytes // 64) * 64  # keep every array 64-byte aligned
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            for name, shape, dtype, offset in layout:
+                np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)[...] = arrays[name]
+            ref_info = (shm.name, layout, profile.rate, profile.rms, profile.digest, profile.ref_file)
+            scorer_info = (self.bw, self.tor_sec, self.hint_early_sec, self.mics, self.align_engine.decimate,
+                           self.cache_dir)
+            with multiprocessing.Pool(jobs, initializer=_init_batch_worker, initargs=(ref_info, scorer_info)) as pool:
+                # imap keeps input order while files are scored concurrently
+                for row in pool.imap(_run_batch_worker, [(method, deg_file, extra) for deg_file in deg_list]):
+                    yield row
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _run_batch(self, method, deg_list, profile, extra, headers, output_path, def_path, jobs):
+        """
+        Score deg_list, streaming each row to the console and the CSV file in input order.
+        """
+        self.last_headers = headers
+        rw_mode = 'w' if output_path != def_path else 'a'
+        csv_file = None
+        try:
+            csv_file = open(output_path, rw_mode, encoding="utf-8", newline="")
+            csv_file.write(f"# Timestamp: {np.datetime64('now')}\n")
+            csv_writer = csv.writer(csv_file)
+            csv_writer.writerow(headers)
+        except Exception as e:
+            print(f"\nWarning: Could not save CSV file due to error: {e}")
+            csv_file = None
+
+        results = []
+        try:
+            for row in self._iter_scores(method, deg_list, profile, extra, jobs):
+                results.append(row)
+                print(f"[{len(results)}/{len(deg_list)}]: {', '.join(map(str, row[:len(headers)]))}")
+                if csv_file:
+                    csv_writer.writerow(row[:len(headers)])
+                    csv_file.flush()
+        finally:
+            if csv_file:
+                csv_file.write("\n")
+                csv_file.close()
+        profile.save(self.cache_dir)
+
+        # print results in a table format
+        print(tabulate([row[:len(headers)] for row in results], headers=headers, tablefmt="grid"))
+        if csv_file:
+            print(f"\nResults have been saved to {output_path}")
+        return results
+
+    def pesq_calc(self, ref_file, deg_files, output_csv=None, jobs=None, offset_hint=None):
+        """
+        Calculate PESQ for degraded audio files against a reference file.
+        jobs: number of worker processes, defaults to self.jobs.
+        offset_hint: start of the reference in the degraded files in seconds, one value for
+        all files or {deg_file: seconds}; narrows the alignment search to the hint window.
+        """
+        # Read audio file header only, the reference profile holds the samples
+        ref_rate = wavfile_rate(ref_file)
         if isinstance(deg_files, str):
             deg_files = [deg_files]
         deg_list = self.get_file_list(*deg_files)
@@ -169,107 +512,70 @@ class PesqScore:
         
         if ref_rate not in [8000, 16000]:
             raise ValueError("Reference audio rate must be either 8000Hz or 16000Hz.")
-        
-        results = []  
-        for deg_file in deg_list:
-            # Normalize audio rate, channel, length, and RMS levels
-            aligned_deg_file, status, deg_data = self.normalize_audio(deg_file, ref_data, ref_rate)
-            if len(deg_data) <= 1:
-                results.append([deg_file, status, "N/A"])
-                continue
-            
-            # PESQ calculation
-            try:
-                pesq_val = pesq(ref_rate, ref_data, deg_data, mode)
-                pesq_score = f"{pesq_val:.2f}"
-            except Exception as e:
-                status = f"PESQ error: {e}"
-
-            results.append([aligned_deg_file, status, pesq_score])
 
-        # print results in a table format
+        profile = self.get_reference_profile(ref_file, ref_rate)
         headers = ["File", "Status", f"PESQ ({mode.upper()})"]
-        print(tabulate(results, headers=headers, tablefmt="grid"))
-
-        # save results to CSV
-        csv_text = tabulate(results, headers=headers, tablefmt="csv")
         output_path = output_csv if output_csv else self.pesq_def_path
-        try:
-            rw_mode = 'w' if output_path != self.pesq_def_path else 'a'
-            with open(output_path, rw_mode, encoding="utf-8", newline="") as f:
-                f.write(f"# Timestamp: {np.datetime64('now')}\n")
-                f.write(csv_text)
-                f.write("\n\n")
-            print(f"\nResults have been saved to {output_path}")
-        except Exception as e:
-            print(f"\nWarning: Could not save CSV file due to error: {e}")
+        if offset_hint is None or isinstance(offset_hint, dict):
+            offset_hints = {os.path.abspath(f): hint for f, hint in (offset_hint or {}).items()}
+        else:
+            offset_hints = {os.path.abspath(f): offset_hint for f in deg_list}
+        return self._run_batch("_pesq_file", deg_list, profile, (mode, offset_hints), headers, output_path,
+                               self.pesq_def_path, jobs or self.jobs)
 
-    def snr_calc(self, ref_file, deg_files, seg_frame_ms=10, output_csv=None):
+    def snr_calc(self, ref_file, deg_files, seg_frame_ms=10, output_csv=None, jobs=None,
+                 clamp_db=None, vad_db=None, return_frames=False):
         """
         Calculate SNR (Signal-to-Noise Ratio) for degraded audio files against a reference file.
         ref_file: Reference audio WAV file.
         deg_files: List of degraded audio files or directory containing them.
         output_csv: Path to save the results in CSV format.
+        jobs: number of worker processes, defaults to self.jobs.
+        clamp_db: (low, high) range each frame SNR is clipped to, SEG_SNR_CLAMP_DB is the usual choice.
+        vad_db: only average frames whose reference energy is within vad_db of the loudest frame.
+        return_frames: also return {file: (times, frame_snr, active)} for plotting.
         """
-        ref_rate, ref_data = wavfile.read(ref_file)
-        ref_data = ref_data.astype(np.float32)
-        
+        profile = self.get_reference_profile(ref_file)
         if isinstance(deg_files, str):
             deg_files = [deg_files]
         deg_list = self.get_file_list(*deg_files)
 
-        results = []
-        for deg_file in deg_list:
-            aligned_deg_file, status, deg_data = self.normalize_audio(deg_file, ref_data, ref_rate)
-            if status != "OK":
-                results.append([deg_file, status, "N/A", f"{seg_frame_ms}"])
-                continue
-            # calculate SNR
-            if seg_frame_ms > 0:
-                frame_size = int(ref_rate * seg_frame_ms / 1000)
-                if len(deg_data) < frame_size or len(ref_data) < frame_size:
-                    results.append([deg_file, "Frame size too large", "N/A", f"{seg_frame_ms}"])
-                    continue
-                # Calculate SNR for each frame
-                snr_values = []
-                for start in range(0, len(deg_data) - frame_size + 1, frame_size):
-                    ref_frame = ref_data[start:start + frame_size]
-                    deg_frame = deg_data[start:start + frame_size]
-                    if len(ref_frame) == 0 or len(deg_frame) == 0:
-                        continue
-                    noise = deg_frame - ref_frame
-                    if np.sum(noise**2) == 0:
-                        snr_value = float('inf')
-                    else:
-                        snr_value = 10 * np.log10(np.sum(ref_frame**2) / np.sum(noise**2))
-                    snr_values.append(snr_value)
-                snr_value = np.mean(snr_values) if snr_values else 0.0
-            else:
-                # Calculate SNR for the entire signal
-                noise = deg_data - ref_data[:len(deg_data)]
-                if np.sum(noise**2) == 0:
-                    snr_value = float('inf')
-                else:
-                     snr_value = 10 * np.log10(np.sum(ref_data**2) / np.sum(noise**2))
-
-            results.append([aligned_deg_file, "OK", f"{snr_value:.2f}", f"{seg_frame_ms}"])
-            
-        # Print results in a table format
         headers = ["File", "Status", "SNR (dB)", "Seg(ms)"]
-        print(tabulate(results, headers=headers, tablefmt="grid"))
-
-        # Save results to CSV
-        csv_text = tabulate(results, headers=headers, tablefmt="csv")
         output_path = output_csv if output_csv else self.snr_def_path
-        try:
-            rw_mode = 'w' if output_path != self.snr_def_path else 'a'
-            with open(output_path, rw_mode, encoding="utf-8", newline="") as f:
-                f.write(f"# Timestamp: {np.datetime64('now')}\n")
-                f.write(csv_text)
-                f.write("\n\n")
-            print(f"\nResults have been saved to {output_path}")
-        except Exception as e:
-            print(f"\nWarning: Could not save CSV file due to error: {e}")
+        results = self._run_batch("_snr_file", deg_list, profile, (seg_frame_ms, clamp_db, vad_db, return_frames),
+                                  headers, output_path, self.snr_def_path, jobs or self.jobs)
+        if not return_frames:
+            return results
+        frames = {row[0]: row[4] for row in results if len(row) > 4 and row[4] is not None}
+        return [row[:4] for row in results], frames
+
+
+_batch_worker = {}
+
+
+def _init_batch_worker(ref_info, scorer_info):
+    """
+    Process pool initializer: attach the shared reference profile and build a worker-local scorer.
+    """
+    shm_name, layout, rate, rms, digest, ref_file = ref_info
+    bw, tor_sec, hint_early_sec, mics, align_decimate, cache_dir = scorer_info
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = {name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+              for name, shape, dtype, offset in layout}
+    scorer = PesqScore(bw=bw, align_decimate=align_decimate)
+    scorer.tor_sec = tor_sec
+    scorer.hint_early_sec = hint_early_sec
+    scorer.mics = mics
+    scorer.cache_dir = cache_dir
+    profile = ReferenceProfile.from_arrays(ref_file, rate, digest, arrays, rms=rms)
+    scorer.align_engine.set_reference(profile.data, spectra=profile.spectra)
+    _batch_worker.update(shm=shm, scorer=scorer, profile=profile)
+
+
+def _run_batch_worker(task):
+    method, deg_file, extra = task
+    scorer = _batch_worker["scorer"]
+    return getattr(scorer, method)(deg_file, _batch_worker["profile"], *extra)
 
 
 if __name__ == '__main__':
@@ -280,6 +586,12 @@ if __name__ == '__main__':
     parser.add_argument("-b", "--band", choices=['nb', 'wb', 'auto'], default="auto",
                         help="PESQ mode: 'nb' for narrowband, 'wb' for wideband, 'auto' to decide by sample rate")
     parser.add_argument("-o", "--output", type=str, help="Output CSV file path")
+    parser.add_argument("--align-decimate", type=int, default=1,
+                        help="Decimation factor for coarse-to-fine alignment, 1 for exact search only")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of worker processes for batch scoring, 0 for one per CPU")
+    parser.add_argument("--offset", type=float, default=None,
+                        help="Known start of the reference in the degraded files in seconds")
     args = parser.parse_args()
-    pesq_tool = PesqScore(bw=args.band)
-    pesq_tool.pesq_calc(args.ref, args.deg, output_csv=args.output)
+    pesq_tool = PesqScore(bw=args.band, align_decimate=args.align_decimate, jobs=args.jobs)
+    pesq_tool.pesq_calc(args.ref, args.deg, output_csv=args.output, offset_hint=args.offset)
@@ -0,0 +1,230 @@
+import time
+import shutil
+import threading
+import subprocess
+import numpy as np
+import soundfile as sf
+from capture_stream import PCM_FORMATS
+
+CHUNK_FRAMES = 4096        # frames sent per channel write
+
+# soundfile subtype -> (ALSA format streamed to the device, numpy dtype read from the file)
+SUBTYPE_FORMATS = {
+    "PCM_U8": ("S16_LE", "int16"),
+    "PCM_S8": ("S16_LE", "int16"),
+    "PCM_16": ("S16_LE", "int16"),
+    "PCM_24": ("S32_LE", "int32"),
+    "PCM_32": ("S32_LE", "int32"),
+    "FLOAT": ("FLOAT_LE", "float32"),
+    "DOUBLE": ("FLOAT_LE", "float32"),
+}
+ARRAY_FORMATS = {np.dtype("int16"): "S16_LE", np.dtype("int32"): "S32_LE", np.dtype("float32"): "FLOAT_LE"}
+
+
+class PcmSource:
+    """
+    Raw interleaved PCM to stream: rate, channels, ALSA format and an iterator of byte chunks.
+    """
+    def __init__(self, rate, channels, audio_format, chunks, frames=None, close=None):
+        self.rate = rate
+        self.channels = channels
+        self.audio_format = audio_format
+        self.chunks = chunks
+        self.frames = frames
+        self._close = close
+
+    @property
+    def frame_bytes(self):
+        return PCM_FORMATS[self.audio_format][0] * self.channels
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+
+    @classmethod
+    def from_array(cls, data, rate, chunk_frames=CHUNK_FRAMES):
+        """
+        Generated samples, (n,) or (n, channels) int16, int32 or float32 (float64 is converted).
+        """
+        data = np.asarray(data)
+        if data.dtype == np.float64:
+            data = data.astype(np.float32)
+        if data.dtype not in ARRAY_FORMATS:
+            raise ValueError(f"Unsupported sample type: {data.dtype}")
+        if data.ndim == 1:
+            data = data[:, None]
+        data = np.ascontiguousarray(data, dtype=data.dtype.newbyteorder('<'))
+        chunks = (data[i:i + chunk_frames].tobytes() for i in range(0, len(data), chunk_frames))
+        return cls(rate, data.shape[1], ARRAY_FORMATS[data.dtype], chunks, len(data))
+
+    @classmethod
+    def from_file(cls, path, chunk_frames=CHUNK_FRAMES):
+        """
+        Any file soundfile can read, decoded block by block at its own rate and channel count.
+        """
+        f = sf.SoundFile(path)
+        audio_format, dtype = SUBTYPE_FORMATS.get(f.subtype, ("S16_LE", "int16"))
+        wire_dtype = np.dtype(dtype).newbyteorder('<')
+        chunks = (np.ascontiguousarray(block, dtype=wire_dtype).tobytes()
+                  for block in f.blocks(chunk_frames, dtype=dtype, always_2d=True))
+        return cls(f.samplerate, f.channels, audio_format, chunks, f.frames, f.close)
+
+    @classmethod
+    def from_ffmpeg(cls, path, rate, channels, chunk_frames=CHUNK_FRAMES):
+        """
+        Any file the local ffmpeg can decode, converted to S16_LE at rate and channels.
+        """
+        proc = subprocess.Popen(["ffmpeg", "-v", "error", "-nostdin", "-i", path, "-f", "s16le",
+                                 "-acodec", "pcm_s16le", "-ar", str(rate), "-ac", str(channels), "-"],
+                                stdout=subprocess.PIPE)
+        chunk_bytes = chunk_frames * channels * 2
+
+        def chunks():
+            for data in iter(lambda: proc.stdout.read(chunk_bytes), b''):
+                yield data
+            if proc.wait() != 0:
+                raise RuntimeError(f"local ffmpeg exited with {proc.returncode} decoding {path}")
+
+        def close():
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
+        return cls(rate, channels, "S16_LE", chunks(), close=close)
+
+    @classmethod
+    def from_playlist(cls, paths, loop=False, chunk_frames=CHUNK_FRAMES):
+        """
+        Files played back to back as one continuous stream, over and over with loop (stop it
+        with max_frames or PlaybackStream.stop). Every file must have the rate and channel
+        count of the first one, samples are converted to its format. Files are reopened for
+        each pass, so memory does not grow with the playlist or the number of loops.
+        """
+        paths = list(paths)
+        if not paths:
+            raise ValueError("Empty playlist")
+        with sf.SoundFile(paths[0]) as first:
+            rate, channels = first.samplerate, first.channels
+            audio_format, dtype = SUBTYPE_FORMATS.get(first.subtype, ("S16_LE", "int16"))
+        for path in paths[1:]:
+            info = sf.info(path)
+            if info.samplerate != rate or info.channels != channels:
+                raise ValueError(f"{path} is {info.samplerate} Hz {info.channels} ch, the playlist is "
+                                 f"{rate} Hz {channels} ch")
+        total_frames = sum(sf.info(path).frames for path in paths)
+        if total_frames == 0:
+            raise ValueError("Playlist has no samples")
+        wire_dtype = np.dtype(dtype).newbyteorder('<')
+
+        def chunks():
+            while True:
+                for path in paths:
+                    with sf.SoundFile(path) as f:
+                        for block in f.blocks(chunk_frames, dtype=dtype, always_2d=True):
+                            yield np.ascontiguousarray(block, dtype=wire_dtype).tobytes()
+                if not loop:
+                    return
+        stream = chunks()
+        # closing the generator closes the file being read
+        return cls(rate, channels, audio_format, stream, None if loop else total_frames, stream.close)
+
+
+def open_source(path, decoder="auto", rate=48000, channels=2, chunk_frames=CHUNK_FRAMES):
+    """
+    PcmSource for a local file. decoder: "soundfile", "ffmpeg" (resampled to rate/channels)
+    or "auto", which uses soundfile and falls back to a local ffmpeg for other formats.
+    """
+    if decoder in ("auto", "soundfile"):
+        try:
+            return PcmSource.from_file(path, chunk_frames)
+        except RuntimeError:
+            if decoder == "soundfile":
+                raise
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError(f"No local decoder for {path}: soundfile cannot read it and ffmpeg is not installed")
+    return PcmSource.from_ffmpeg(path, rate, channels, chunk_frames)
+
+
+class PlaybackStream:
+    """
+    Playback of PCM sent from the host into the stdin of a device player (aplay, cras_test_client).
+    Nothing is stored on the device: chunks are written to the SSH channel as the player
+    consumes them, the channel window blocks the writer while the player is behind, so
+    memory stays bounded whatever the source length.
+    max_frames: stop after this many frames, None to play the whole source.
+    """
+    def __init__(self, ssh_client, command, source, max_frames=None):
+        self.ssh_client = ssh_client
+        self.command = command
+        self.source = source
+        self.max_frames = max_frames
+        self.channel = None
+        self.thread = None
+        self.frames = 0
+        self.stopped = False
+        self.exit_status = None
+        self.error = None
+        self.stderr = ""
+        self.start_time = None
+
+    @property
+    def elapsed_sec(self):
+        return self.frames / self.source.rate
+
+    def start(self):
+        """
+        Start the device player and the writer thread.
+        """
+        self.channel = self.ssh_client.client.get_transport().open_session()
+        self.channel.exec_command(self.command)
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        frame_bytes = self.source.frame_bytes
+        try:
+            for data in self.source.chunks:
+                if self.stopped:
+                    break
+                if self.max_frames is not None:
+                    left = (self.max_frames - self.frames) * frame_bytes
+                    if left <= 0:
+                        break
+                    data = data[:left]
+                self.channel.sendall(data)
+                self.frames += len(data) // frame_bytes
+            self.channel.shutdown_write()
+            self.stderr = self.channel.makefile_stderr('rb').read().decode("utf-8", "replace").strip()
+            self.exit_status = self.channel.recv_exit_status()
+        except Exception as e:
+            if not self.stopped:
+                self.error = e
+        finally:
+            self.source.close()
+            self.channel.close()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the playback to end, returns True if it ended normally or was stopped.
+        """
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            return False
+        if self.error is not None:
+            print(f"[ERR]: Playback stream failed: {self.error}")
+            return False
+        if self.exit_status != 0 and not self.stopped:
+            print(f"[ERR]: Playback command exited with {self.exit_status}: {self.stderr}")
+            return False
+        print(f"[INFO]: Sent {self.elapsed_sec:.2f}s of audio to the player in {time.time() - self.start_time:.2f}s")
+        return True
+
+    def stop(self):
+        """
+        End the playback early.
+        """
+        self.stopped = True
+        if self.channel is not None:
+            self.channel.close()
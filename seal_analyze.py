@@ -1,14 +1,13 @@
 import argparse
 import numpy as np
-import librosa
-import librosa.display
 import matplotlib.pyplot as plt
 from scipy.signal import welch
+from wav_io import WavReader
 
-# Load multi-channel audio
+# Load multi-channel audio, channels are mapped and only converted when used
 def load_multichannel_audio(file_path):
-    y, sr = librosa.load(file_path, sr=None, mono=False)  # Load multi-channel audio
-    return y, sr
+    reader = WavReader(file_path)
+    return reader, reader.sample_rate
 
 # Compute RMS
 def compute_rms(y):
@@ -55,11 +54,10 @@ def audio_analyzing(unsealed_file, sealed_file):
     y1, sr1 = load_multichannel_audio(unsealed_file)
     y2, sr2 = load_multichannel_audio(sealed_file)
 
-    num_channels = min(y1.shape[0], y2.shape[0])  # Use the minimum channel count to avoid mismatches
+    num_channels = min(y1.channels, y2.channels)  # Use the minimum channel count to avoid mismatches
 
     # Use only the first 6 microphone channels, reserve the 8th channel for loopback
-    y1 = y1[:6]
-    y2 = y2[:6]
+    num_channels = min(num_channels, 6)
 
     rms_changes = []
     freqs_fft, fft_unsealed, fft_sealed = [], [], []
@@ -71,8 +69,9 @@ def audio_analyzing(unsealed_file, sealed_file):
         f.write("=" * 40 + "\n")
 
         for ch in range(num_channels):
+            ch1, ch2 = y1.channel_float(ch), y2.channel_float(ch)
             # Compute RMS
-            rms1, rms2 = compute_rms(y1[ch]), compute_rms(y2[ch])
+            rms1, rms2 = compute_rms(ch1), compute_rms(ch2)
             rms_change = (rms1 - rms2) / rms1 * 100  # Compute RMS reduction percentage
             rms_changes.append(rms_change)
 
@@ -81,11 +80,11 @@ def audio_analyzing(unsealed_file, sealed_file):
             f.write(f"  - Unsealed RMS: {rms1:.4f}, Sealed RMS: {rms2:.4f}, Reduction: {rms_change:.2f}%\n")
 
             # Compute PSD and FFT
-            f_psd, p_unsealed = compute_psd(y1[ch], sr1)
-            _, p_sealed = compute_psd(y2[ch], sr2)
+            f_psd, p_unsealed = compute_psd(ch1, sr1)
+            _, p_sealed = compute_psd(ch2, sr2)
 
-            f_fft, f_unsealed = compute_fft(y1[ch], sr1)
-            _, f_sealed = compute_fft(y2[ch], sr2)
+            f_fft, f_unsealed = compute_fft(ch1, sr1)
+            _, f_sealed = compute_fft(ch2, sr2)
 
             # Store data for plotting
             freqs_psd.append(f_psd)
@@ -100,6 +99,8 @@ def audio_analyzing(unsealed_file, sealed_file):
         avg_rms_change = np.mean(rms_changes)
         f.write("\nOverall Analysis:\n")
         f.write(f"  - Average RMS reduction: {avg_rms_change:.2f}% (Higher value indicates better sealing performance)\n")
+    y1.close()
+    y2.close()
 
     print("📄 Analysis results saved to result.txt")
 
@@ -0,0 +1,167 @@
+import time
+import numpy as np
+from scipy import fft as sp_fft
+from scipy import signal
+from wav_io import WavReader
+
+DEFAULT_RESOLUTION_HZ = 2.0   # PSD bin width
+DEFAULT_OVERLAP = 0.5         # segment overlap ratio
+CHUNK_FRAMES = 1 << 18        # frames read from the file per pass
+
+
+def resolution_to_nperseg(sample_rate, resolution_hz):
+    """
+    Smallest power of two segment length whose bin width is at most resolution_hz.
+    """
+    return int(2 ** np.ceil(np.log2(max(sample_rate / resolution_hz, 16))))
+
+
+class StreamingWelch:
+    """
+    Averaged periodogram (Welch) over a stream of multichannel blocks.
+    Blocks of shape (n, channels) are cut into overlapping windowed segments and all
+    channels go through one batched rfft, so memory is bounded by the block size
+    whatever the stream length. The result matches scipy.signal.welch with a
+    constant detrend and density scaling. With spectrogram_sec set, the segments of
+    every spectrogram_sec interval are also averaged into one spectrogram column.
+    """
+    def __init__(self, sample_rate, channels, nperseg=4096, overlap=DEFAULT_OVERLAP, window='hann',
+                 spectrogram_sec=None):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.nperseg = int(nperseg)
+        self.hop = max(1, int(self.nperseg * (1 - overlap)))
+        self.window = signal.get_window(window, self.nperseg).astype(np.float32)
+        self.freqs = sp_fft.rfftfreq(self.nperseg, 1 / sample_rate)
+        # one-sided density scaling, DC and Nyquist are not doubled
+        self.scale = np.full(len(self.freqs), 2.0 / (sample_rate * np.sum(self.window.astype(np.float64)**2)))
+        self.scale[0] /= 2
+        if self.nperseg % 2 == 0:
+            self.scale[-1] /= 2
+        self.psd_sum = np.zeros((channels, len(self.freqs)))
+        self.n_segments = 0
+        self._tail = np.zeros((0, channels), dtype=np.float32)
+        self.spec_segments = None
+        if spectrogram_sec:
+            self.spec_segments = max(1, int(round(spectrogram_sec * sample_rate / self.hop)))
+        self._spec_sum = np.zeros((channels, len(self.freqs)))
+        self._spec_count = 0
+        self.spec_columns = []
+        self.spec_counts = []   # segments averaged into each column, the last one may be partial
+
+    def feed(self, block):
+        """
+        Add a (n, channels) block of samples following the previous one.
+        """
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim == 1:
+            block = block[:, None]
+        data = np.concatenate([self._tail, block]) if len(self._tail) else block
+        n_seg = (len(data) - self.nperseg) // self.hop + 1 if len(data) >= self.nperseg else 0
+        if n_seg > 0:
+            # (n_seg, channels, nperseg) strided view, copied once by the detrend
+            segs = np.lib.stride_tricks.sliding_window_view(data, self.nperseg, axis=0)[::self.hop][:n_seg]
+            segs = segs - segs.mean(axis=-1, keepdims=True)
+            spec = sp_fft.rfft(segs * self.window, axis=-1)
+            power = spec.real**2 + spec.imag**2
+            self.psd_sum += power.sum(axis=0)
+            self.n_segments += n_seg
+            if self.spec_segments:
+                self._add_spectrogram(power)
+        self._tail = data[n_seg * self.hop:].copy()
+
+    def _add_spectrogram(self, power):
+        pos = 0
+        while pos < len(power):
+            take = min(self.spec_segments - self._spec_count, len(power) - pos)
+            self._spec_sum += power[pos:pos + take].sum(axis=0)
+            self._spec_count += take
+            pos += take
+            if self._spec_count == self.spec_segments:
+                self._flush_column()
+
+    def _flush_column(self):
+        if self._spec_count:
+            column = self._spec_sum / self._spec_count * self.scale
+            self.spec_columns.append(column.astype(np.float32))
+            self.spec_counts.append(self._spec_count)
+        self._spec_sum[:] = 0
+        self._spec_count = 0
+
+    def finish(self):
+        """
+        Returns (freqs, psd) with psd of shape (channels, n_freqs) in units^2/Hz.
+        """
+        if self.spec_segments:
+            self._flush_column()
+        if self.n_segments == 0:
+            return self.freqs, np.zeros_like(self.psd_sum)
+        return self.freqs, self.psd_sum / self.n_segments * self.scale
+
+    def spectrogram(self):
+        """
+        Returns (times, freqs, sxx) with sxx of shape (channels, n_freqs, n_columns),
+        times are the column centers in seconds.
+        """
+        n_cols = len(self.spec_columns)
+        seg_count = self.spec_segments or 0
+        # center of the samples covered by the segments of each column
+        span = (np.array(self.spec_counts) - 1) * self.hop + self.nperseg
+        times = (np.arange(n_cols) * seg_count * self.hop + span / 2) / self.sample_rate
+        sxx = np.stack(self.spec_columns, axis=-1) if n_cols else np.zeros((self.channels, len(self.freqs), 0))
+        return times, self.freqs, sxx
+
+
+def welch_file(path, resolution_hz=DEFAULT_RESOLUTION_HZ, overlap=DEFAULT_OVERLAP, channels=None,
+               spectrogram_sec=None, chunk_frames=CHUNK_FRAMES, normalize=True):
+    """
+    Per-channel PSD of a WAV file read chunk by chunk.
+    Returns the finished StreamingWelch, see finish() and spectrogram().
+    """
+    with WavReader(path) as reader:
+        channels = list(range(reader.channels)) if channels is None else list(channels)
+        nperseg = min(resolution_to_nperseg(reader.sample_rate, resolution_hz), max(reader.n_frames, 16))
+        welch = StreamingWelch(reader.sample_rate, len(channels), nperseg, overlap, spectrogram_sec=spectrogram_sec)
+        for _, block in reader.iter_chunks(chunk_frames, channels, normalize):
+            welch.feed(block)
+    return welch
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    import tempfile
+    from scipy.io import wavfile
+    parser = argparse.ArgumentParser(description='Benchmark streaming Welch against whole-file FFT')
+    parser.add_argument("-d", "--durations", type=float, nargs='+', default=[10, 60, 300],
+                        help="Signal durations in seconds")
+    parser.add_argument("-c", "--channels", type=int, default=8, help="Number of channels")
+    parser.add_argument("-r", "--rate", type=int, default=16000, help="Sample rate")
+    parser.add_argument("--resolution", type=float, default=DEFAULT_RESOLUTION_HZ, help="PSD resolution in Hz")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for dur in args.durations:
+        n = int(dur * args.rate)
+        data = rng.normal(0, 3000, (n, args.channels)).astype(np.int16)
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        wavfile.write(path, args.rate, data)
+        try:
+            t0 = time.perf_counter()
+            with WavReader(path) as reader:
+                for ch in range(reader.channels):
+                    spectrum = np.abs(np.fft.fft(reader.channel_float(ch)))[:n // 2]
+                first_channel = reader.channel_float(0)
+            t_fft = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            welch = welch_file(path, args.resolution)
+            freqs, psd = welch.finish()
+            t_welch = time.perf_counter() - t0
+            _, ref_psd = signal.welch(first_channel, fs=args.rate, nperseg=welch.nperseg)
+            err = np.max(np.abs(psd[0] - ref_psd) / np.maximum(ref_psd, 1e-20))
+            print(f"[BENCH]: {dur:>5.0f}s x{args.channels} ch: full fft {t_fft * 1000:.0f} ms, "
+                  f"streaming welch {t_welch * 1000:.0f} ms (x{t_fft / t_welch:.1f}), "
+                  f"{len(freqs)} bins, max rel err vs scipy {err:.1e}")
+        finally:
+            os.remove(path)
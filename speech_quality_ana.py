@@ -5,12 +5,13 @@ import argparse
 import os
 import librosa
 from dtw import dtw  # make sure to install the dtw package
+from wav_io import WavReader, read_mono
 
 
 def align_audio_file(ref_audio_path, recorded_audio_path, algo="cc", save_path=None):
     # we assume the reference audio is the clean audio
-    ref_audio, sr = librosa.load(ref_audio_path, sr=None)
-    rec_audio, _ = librosa.load(recorded_audio_path, sr=sr)
+    ref_audio, sr = read_mono(ref_audio_path)
+    rec_audio, _ = read_mono(recorded_audio_path, sr)
     if algo == "cc":
         # compute the cross-correlation
         corr = np.correlate(rec_audio, ref_audio, mode="valid")
@@ -58,11 +59,11 @@ def align_audio_signal(ref_audio, rec_audio, algo="cc", save_path=None):
 
 def read_wav_file(file_path):
     """读取wav文件并返回采样率和音频数据"""
-    rate, data = wav.read(file_path)
-    print(f"Data type: {data.dtype}")
-    if data.ndim > 1:
+    with WavReader(file_path) as reader:
+        print(f"Data type: {reader.dtype}")
         # read only the first channel
-        data = data[:, 0]
+        data = np.array(reader.channel(0))
+        rate = reader.sample_rate
     return rate, data
 
 
@@ -1,20 +1,126 @@
 import paramiko
 import os
+import time
+import uuid
+import select
+import socket
+import threading
+from collections import deque
 from scp import SCPClient
+from sync_engine import SyncEngine
+from transfer_engine import TransferEngine, LARGE_FILE_BYTES
+from compress_transfer import CompressedTransfer
+from device_caps import DeviceCaps
 import shlex
 
+SHELL_POOL_SIZE = 4  # persistent remote shells per connection, one per concurrent caller
+CONNECT_TIMEOUT_SEC = 10
+KEEPALIVE_SEC = 5  # interval of transport keepalives and health pings, 0 to disable
+PING_TIMEOUT_SEC = 3
+MAX_MISSED_PINGS = 2  # consecutive unanswered pings before the connection is treated as lost
+RECONNECT_ATTEMPTS = 6
+RECONNECT_BACKOFF_SEC = 1  # first reconnect delay, doubled on every failed attempt
+RECONNECT_MAX_DELAY_SEC = 30
+RTT_SAMPLES = 100
+
+
+class ShellSession:
+    """
+    Long-lived remote `sh` on one exec channel, running commands back to back.
+    Each command runs in a subshell reading /dev/null, followed by a unique marker
+    on stdout (with the exit status) and on stderr that frames its output, so a
+    command costs one round trip instead of a new channel setup.
+    """
+    def __init__(self, transport, timeout=10):
+        self.channel = transport.open_session(timeout=timeout)
+        self.channel.exec_command("sh")
+        self._out = b""
+        self._err = b""
+
+    def is_alive(self):
+        return not self.channel.closed and not self.channel.exit_status_ready()
+
+    def _drain(self):
+        while self.channel.recv_ready():
+            self._out += self.channel.recv(65536)
+        while self.channel.recv_stderr_ready():
+            self._err += self.channel.recv_stderr(65536)
+
+    def run(self, command, timeout=None):
+        """
+        Run one command, returns (stdout, stderr, exit_status) with stdout/stderr as bytes.
+        Raises TimeoutError if the command does not finish within timeout seconds,
+        and EOFError if the remote shell went away.
+        """
+        marker = f"__end_{uuid.uuid4().hex}__".encode()
+        script = f"( {command}\n) </dev/null; printf '\\n%s %d\\n' {marker.decode()} $?; " \
+                 f"printf '\\n%s\\n' {marker.decode()} >&2\n"
+        self.channel.sendall(script.encode("utf-8"))
+        deadline = time.monotonic() + timeout if timeout else None
+        output = error = status = None
+        while True:
+            self._drain()
+            if output is None:
+                idx = self._out.find(b"\n" + marker + b" ")
+                end = self._out.find(b"\n", idx + len(marker) + 2) if idx >= 0 else -1
+                if end >= 0:
+                    output = self._out[:idx]
+                    status = int(self._out[idx + len(marker) + 2:end])
+                    self._out = self._out[end + 1:]
+            if error is None:
+                idx = self._err.find(b"\n" + marker + b"\n")
+                if idx >= 0:
+                    error = self._err[:idx]
+                    self._err = self._err[idx + len(marker) + 2:]
+            if output is not None and error is not None:
+                return output, error, status
+            if not self.is_alive() and not self.channel.recv_ready() and not self.channel.recv_stderr_ready():
+                raise EOFError("remote shell closed")
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError(f"command did not finish in {timeout}s")
+            select.select([self.channel], [], [], remaining)
+
+    def close(self):
+        try:
+            self.channel.close()
+        except Exception:
+            pass
 
 
 class SSHClient:
-    def __init__(self, hostname, username, password, platform="Linux"):
+    def __init__(self, hostname, username, password, platform="Linux", port=22):
         self.hostname = hostname
+        self.port = port
         self.username = username
         self.password = password
         self.client = None
         self.ssh_transport = None
         self.scp_client = None
         self.platform = platform
-        self.fastboot = True
+        self.sync_engine = None  # created on the first folder sync
+        self.transfer_engine = None  # created on the first large file transfer
+        self.large_file_bytes = LARGE_FILE_BYTES  # files from this size use parallel resumable SFTP
+        self.compressed_transfer = None  # created on the first compressed download, keeps the negotiated codecs
+        self.device_caps = None  # audio capabilities of the device, created on first use
+        self.remote_digests = {}  # remote path -> (size, mtime, sha256) hashed by stat_many
+        self.persistent_shell = True  # run commands through pooled shell sessions
+        self.shell_pool_size = SHELL_POOL_SIZE
+        self._idle_shells = []
+        self._shell_count = 0
+        self._shell_cond = threading.Condition()
+        self.keepalive_sec = KEEPALIVE_SEC
+        self.auto_reconnect = True  # reconnect with backoff when the connection is lost
+        self.reconnect_attempts = RECONNECT_ATTEMPTS
+        self.command_retries = 1  # reruns of idempotent commands (retry=True) after a reconnect
+        self.transfer_retries = 2  # reruns of transfers after a reconnect, large files resume
+        self.metrics = {"rtt_ms": deque(maxlen=RTT_SAMPLES), "missed_pings": 0, "reconnects": 0,
+                        "failed_reconnects": 0, "command_retries": 0, "transfer_retries": 0,
+                        "connected_since": None}
+        self._reconnect_lock = threading.Lock()
+        self._ping_lock = threading.Lock()
+        self._monitor_stop = threading.Event()
+        self._monitor_thread = None
 
     def connect(self):
         """
@@ -35,7 +141,8 @@ class SSHClient:
                 if not any(self.hostname in line for line in known_hosts):
                     try:
                         self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                        self.client.connect(self.hostname, username=self.username, password=self.password)
+                        self.client.connect(self.hostname, port=self.port, username=self.username,
+                                            password=self.password, timeout=CONNECT_TIMEOUT_SEC)
                         host_key = self.client.get_transport().get_remote_server_key()
                         # write the host key to known_hosts file
                         with open(known_hosts_file, 'a') as f:
@@ -47,11 +154,19 @@ class SSHClient:
                         return
             # Connect to the remote host
             self.client.connect(
-                self.hostname, username=self.username, password=self.password)
+                self.hostname, port=self.port, username=self.username, password=self.password,
+                timeout=CONNECT_TIMEOUT_SEC)
    
             # Create SCP client for file transfer
             self.ssh_transport = self.client.get_transport()
             self.scp_client = SCPClient(self.ssh_transport)
+            # framed shell commands are small writes, do not let Nagle hold them back
+            self.ssh_transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._monitor_stop.clear()
+            if self.keepalive_sec:
+                self.ssh_transport.set_keepalive(self.keepalive_sec)
+                self._start_monitor()
+            self.metrics["connected_since"] = time.time()
 
             print(f"[INFO]: Connected to {self.hostname} as {self.username}")
             return True
@@ -79,15 +194,209 @@ class SSHClient:
 
         return not self.is_connected()
 
-    def execute_command(self, command, force=False, verbose=False):
+    def ping(self, timeout=PING_TIMEOUT_SEC):
+        """
+        Round trip of a global request answered by the SSH server itself, independent of
+        the channels in use. Returns the RTT in ms, or None if there was no answer in time.
+        """
+        transport = self.client.get_transport() if self.client else None
+        if transport is None or not transport.is_active():
+            return None
+        with self._ping_lock:
+            answered = threading.Event()
+
+            def request():
+                transport.global_request("keepalive@openssh.com", wait=True)
+                if transport.is_active():
+                    answered.set()
+            t0 = time.perf_counter()
+            threading.Thread(target=request, daemon=True).start()
+            if not answered.wait(timeout):
+                self.metrics["missed_pings"] += 1
+                return None
+            rtt_ms = (time.perf_counter() - t0) * 1000
+            self.metrics["rtt_ms"].append(rtt_ms)
+            return rtt_ms
+
+    def health(self):
+        """
+        Connection metrics: state, RTT statistics (ms) and reconnect/retry counters.
+        """
+        rtt = list(self.metrics["rtt_ms"])
+        since = self.metrics["connected_since"]
+        return {
+            "connected": self.is_connected(),
+            "uptime_sec": round(time.time() - since, 1) if since and self.is_connected() else 0,
+            "rtt_last_ms": round(rtt[-1], 2) if rtt else None,
+            "rtt_avg_ms": round(sum(rtt) / len(rtt), 2) if rtt else None,
+            "rtt_max_ms": round(max(rtt), 2) if rtt else None,
+            **{k: v for k, v in self.metrics.items() if k not in ("rtt_ms", "connected_since")},
+        }
+
+    def _start_monitor(self):
+        if self._monitor_thread is None or not self._monitor_thread.is_alive():
+            self._monitor_thread = threading.Thread(target=self._monitor, daemon=True)
+            self._monitor_thread.start()
+
+    def _monitor(self):
+        """
+        Ping the server every keepalive_sec. A connection that misses MAX_MISSED_PINGS pings
+        in a row is closed, so calls blocked on it fail instead of hanging, and reconnected.
+        """
+        missed = 0
+        while not self._monitor_stop.wait(self.keepalive_sec):
+            if not self.is_connected():
+                missed = MAX_MISSED_PINGS
+            elif self.ping() is None:
+                missed += 1
+            else:
+                missed = 0
+            if missed < MAX_MISSED_PINGS:
+                continue
+            print(f"[WARN]: Connection to {self.hostname} lost.")
+            self._drop_connection()
+            if not self.auto_reconnect or not self.reconnect():
+                return
+            missed = 0
+
+    def _drop_connection(self):
+        """
+        Close the transport and everything bound to it, keeping the settings and caches.
+        """
+        self._close_shells()
+        try:
+            if self.scp_client:
+                self.scp_client.close()
+            if self.client:
+                self.client.close()
+        except Exception:
+            pass
+
+    def reconnect(self):
+        """
+        Re-establish a lost connection with exponential backoff between attempts.
+        Concurrent callers wait for the same reconnect. Returns True when connected.
+        """
+        with self._reconnect_lock:
+            if self._monitor_stop.is_set():
+                return False
+            if self.is_connected() and self.ping() is not None:
+                return True
+            self._drop_connection()
+            delay = RECONNECT_BACKOFF_SEC
+            for attempt in range(1, self.reconnect_attempts + 1):
+                print(f"[INFO]: Reconnecting to {self.hostname} (attempt {attempt}/{self.reconnect_attempts})")
+                if self.connect():
+                    self.metrics["reconnects"] += 1
+                    if self.device_caps is not None:
+                        # the device may have rebooted
+                        self.device_caps.invalidate()
+                    return True
+                if attempt < self.reconnect_attempts and self._monitor_stop.wait(delay):
+                    break
+                delay = min(delay * 2, RECONNECT_MAX_DELAY_SEC)
+            self.metrics["failed_reconnects"] += 1
+            print(f"[ERR]: Could not reconnect to {self.hostname}.")
+            return False
+
+    def _recover(self):
+        """
+        After a failed call: True if the connection was lost and is back, so the call can
+        be repeated. False if the connection is fine (the call itself failed) or is gone.
+        """
+        if self.client is None or not self.auto_reconnect:
+            return False
+        if self.is_connected() and self.ping() is not None:
+            return False
+        return self.reconnect()
+
+    def _acquire_shell(self):
+        """
+        Take an idle shell session from the pool, open a new one if the pool is not full,
+        or wait for another caller to release one.
+        """
+        with self._shell_cond:
+            while True:
+                while self._idle_shells:
+                    shell = self._idle_shells.pop()
+                    if shell.is_alive():
+                        return shell
+                    self._shell_count -= 1
+                if self._shell_count < self.shell_pool_size:
+                    self._shell_count += 1
+                    break
+                self._shell_cond.wait()
+        try:
+            return ShellSession(self.client.get_transport())
+        except Exception:
+            with self._shell_cond:
+                self._shell_count -= 1
+                self._shell_cond.notify()
+            raise
+
+    def _release_shell(self, shell, broken=False):
+        with self._shell_cond:
+            if broken or not shell.is_alive():
+                shell.close()
+                self._shell_count -= 1
+            else:
+                self._idle_shells.append(shell)
+            self._shell_cond.notify()
+
+    def _close_shells(self):
+        with self._shell_cond:
+            for shell in self._idle_shells:
+                shell.close()
+            self._shell_count -= len(self._idle_shells)
+            self._idle_shells = []
+            self._shell_cond.notify_all()
+
+    def run_command(self, command, timeout=None, retry=False):
+        """
+        Run a remote command, returns (output, error, exit_status) with decoded output/error.
+        Uses a pooled persistent shell, or a new exec channel if persistent_shell is off.
+        A lost connection is re-established; retry: the command is idempotent and is run
+        again on the new connection, otherwise the error is raised to the caller.
+        """
+        if self.device_caps is not None:
+            self.device_caps.observe(command)
+        attempt = 0
+        while True:
+            try:
+                return self._run_command_once(command, timeout)
+            except Exception:
+                if not self._recover() or not retry or attempt >= self.command_retries:
+                    raise
+                attempt += 1
+                self.metrics["command_retries"] += 1
+                print(f"[WARN]: Connection was lost, running {command} again.")
+
+    def _run_command_once(self, command, timeout=None):
+        if not self.persistent_shell:
+            stdin, stdout, stderr = self.client.exec_command(command, timeout=timeout)
+            output = stdout.read().decode("utf-8")
+            error = stderr.read().decode("utf-8")
+            return output, error, stdout.channel.recv_exit_status()
+        shell = self._acquire_shell()
+        try:
+            output, error, status = shell.run(command, timeout)
+        except Exception:
+            # the session state is unknown after a timeout or a lost channel
+            self._release_shell(shell, broken=True)
+            raise
+        self._release_shell(shell)
+        return output.decode("utf-8"), error.decode("utf-8"), status
+
+    def execute_command(self, command, force=False, verbose=False, timeout=None, retry=False):
         """
         Execute a remote command and return the output as a string.
+        retry: the command is idempotent (e.g. a query) and may be rerun after a reconnect.
         """
         try:
-            stdin, stdout, stderr = self.client.exec_command(command)
+            output, error, _ = self.run_command(command, timeout, retry)
             # Get the output and error (if any)
-            output = stdout.read().decode("utf-8").strip()
-            error = stderr.read().decode("utf-8").strip()
+            output = output.strip()
+            error = error.strip()
             if verbose:
                 print(f"[CMD]: {command}")
                 if output:
@@ -112,122 +421,199 @@ class SSHClient:
         
     def sync_files(self, local_path, remote_path, mode="merge"):
         """
-        Synchronize a local folder with a remote folder using rsync.
-        Only support Linux platform
+        Synchronize local folders with remote folders, transferring only changed files.
+        local_path/remote_path: folder paths, or dicts of folder paths with the same keys.
+        mode: "merge", "upload" (local to remote) or "download" (remote to local).
         """
         try:
-            if self.is_connected():
-                print(f"[sync]: Syncing {local_path} with {remote_path} in {mode} mode on {self.platform}...")
-                if "linux" in self.platform:
-                    if mode == "merge":
-                        command = f"rsync -avz {local_path} {self.username}@{self.hostname}:{remote_path}"
-                        self.execute_command(command)
-                        command = f"rsync -avz {self.username}@{self.hostname}:{remote_path} {local_path}"
-                    elif mode == "upload":
-                        command = f"rsync -avz --delete {local_path} {self.username}@{self.hostname}:{remote_path}"
-                    elif mode == "download":
-                        command = f"rsync -avz --delete {self.username}@{self.hostname}:{remote_path} {local_path}"
-                    else:
-                        print("[ERR]: Invalid sync mode.")
-                        return None
-                    return self.execute_command(command)
-                elif "win" in self.platform:
-                    if self.fastboot:
-                        print("[sync]: Using fastboot mode for Windows.")
-                        return
-                    if mode == "merge":
-                        for key in local_path:
-                            print(f"[sync]: Uploading {key}...")
-                            self.ssh_client.upload_file(local_path[key], remote_path[key])
-                        for key in local_path:
-                            print(f"[sync]: Downloading {key}...")
-                            self.ssh_client.download_file(remote_path[key], local_path[key])
-                    elif mode == "upload":
-                        for key in local_path:
-                            print(f"[sync]: Uploading {key}...")
-                            self.ssh_client.upload_file(local_path[key], remote_path[key])
-                    elif mode == "download":
-                        for key in local_path:
-                            print(f"[sync]: Downloading {key}...")
-                            self.ssh_client.download_file(remote_path[key], local_path[key])
-                    else:
-                        print("[ERR]: Invalid sync mode.")
-                return
-            else:
+            if not self.is_connected():
                 print("[ERR]: SSH client is not connected.")
                 return None
+            if mode not in ("merge", "upload", "download"):
+                print("[ERR]: Invalid sync mode.")
+                return None
+            if isinstance(local_path, dict):
+                pairs = [(local_path[key], remote_path[key]) for key in local_path]
+            else:
+                pairs = [(local_path, remote_path)]
+            results = {}
+            for local_dir, remote_dir in pairs:
+                print(f"[sync]: Syncing {local_dir} with {remote_dir} in {mode} mode...")
+                results[local_dir] = self._get_sync_engine().sync(local_dir, remote_dir, mode)
+            return results
         except Exception as e:
-            print(f"[ERR]: Failed to rsync folder: {e}")
+            print(f"[ERR]: Failed to sync folder: {e}")
             return None
 
+    def stat_many(self, paths, with_hash=False):
+        """
+        Stat several remote paths in one round trip.
+        Returns {path: {"exists", "is_file", "is_dir", "size", "mtime", "sha256"}},
+        sha256 is only filled for regular files when with_hash is set. Digests are remembered
+        by (path, size, mtime), the device only hashes files that changed since.
+        """
+        paths = list(paths)
+        result = {path: {"exists": False, "is_file": False, "is_dir": False, "size": None, "mtime": None,
+                         "sha256": None} for path in paths}
+        if not paths:
+            return result
+        # each path is followed by the "size mtime" its remembered digest was taken at
+        args = []
+        for path in paths:
+            known = self.remote_digests.get(path)
+            args += [path, f"{known[0]} {known[1]}" if known and with_hash else "-"]
+        hash_cmd = '[ "$s" != "$k" ] && h=$(sha256sum "$p" | cut -d" " -f1)' if with_hash else 'h=-'
+        command = (
+            f"i=0; set -- {' '.join(shlex.quote(arg) for arg in args)}; while [ $# -gt 0 ]; do p=$1; k=$2; shift 2; "
+            f'if [ -d "$p" ]; then t=d; elif [ -f "$p" ]; then t=f; elif [ -e "$p" ]; then t=o; else t=-; fi; '
+            f'if [ "$t" = - ]; then echo "$i -"; else h=-; s=$(stat -c \'%s %Y\' "$p"); [ "$t" = f ] && {hash_cmd}; '
+            f'echo "$i $t $s $h"; fi; i=$((i+1)); done'
+        )
+        output, error, _ = self.run_command(command, retry=True)
+        for line in output.splitlines():
+            fields = line.split()
+            if len(fields) < 2 or not fields[0].isdigit() or int(fields[0]) >= len(paths):
+                continue
+            path = paths[int(fields[0])]
+            entry = result[path]
+            if fields[1] == "-":
+                continue
+            entry.update(exists=True, is_file=fields[1] == "f", is_dir=fields[1] == "d")
+            if len(fields) >= 5:
+                size, mtime = int(fields[2]), int(fields[3])
+                digest = fields[4] if fields[4] != "-" else None
+                if with_hash and entry["is_file"]:
+                    if digest is not None:
+                        self.remote_digests[path] = (size, mtime, digest)
+                    else:
+                        known = self.remote_digests.get(path)
+                        digest = known[2] if known and known[:2] == (size, mtime) else None
+                entry.update(size=size, mtime=mtime, sha256=digest)
+        return result
+
+    def _get_transfer_engine(self):
+        if self.transfer_engine is None:
+            self.transfer_engine = TransferEngine(self)
+        return self.transfer_engine
+
+    def _get_sync_engine(self):
+        if self.sync_engine is None:
+            self.sync_engine = SyncEngine(self)
+        return self.sync_engine
+
+    def _get_compressed_transfer(self):
+        if self.compressed_transfer is None:
+            self.compressed_transfer = CompressedTransfer(self.client.get_transport())
+        elif self.compressed_transfer.transport is not self.client.get_transport():
+            # reconnected, the device and its codecs are the same
+            self.compressed_transfer.transport = self.client.get_transport()
+        return self.compressed_transfer
+
+    def _retry_transfer(self, name, transfer, *args):
+        """
+        Run an upload/download, repeating it on a new connection if the connection was lost.
+        Transfers are idempotent: small files are copied again, large ones resume.
+        """
+        for attempt in range(self.transfer_retries + 1):
+            try:
+                transfer(*args)
+                return True
+            except Exception as e:
+                print(f"[ERR]: Failed to {name} file: {e}")
+                if attempt == self.transfer_retries or not self._recover():
+                    return False
+                self.metrics["transfer_retries"] += 1
+                print(f"[INFO]: Connection restored, retrying the {name} of {args[0]}.")
+
+    def get_device_caps(self):
+        """
+        Capability registry of the device, shared by every AudioModule on this connection.
+        """
+        if self.device_caps is None:
+            self.device_caps = DeviceCaps(self._run_merged)
+        return self.device_caps
+
+    def _run_merged(self, command):
+        output, error, _ = self.run_command(command, retry=True)
+        return output + error
+
     def upload_file(self, local_path, remote_path):
         """
         Upload a file to the remote server using SCP.
+        Returns True on success, the upload is retried if the connection drops.
         """
-        try:
-            if self.scp_client:
-                if os.path.isdir(local_path):
-                    # Folder update uses strategy: check file name list and download only new files
-                    remote_basename_files = []
-                    for file in self.get_file_name_list(remote_path):
-                        remote_basename_files.append(os.path.basename(file.replace("\\", '/')))
-                    # print(f"[INFO]: Uploading local files in {local_path} to remote folder {remote_path}")
-                    for root, dirs, files in os.walk(local_path):
-                        for file in files:
-                            # TODO: check if files content is changed
-                            if os.path.basename(file) not in remote_basename_files:
-                                local_file_path = os.path.join(root, file).replace("\\", '/')
-                                print(f"[INFO]: Uploading file {local_file_path} to remote {remote_path}")
-                                self.scp_client.put(local_file_path, remote_path)
-                else:
-                    # Single file upload uses strategy: force replace
-                    print(f"[INFO]: Uploading file {local_path} to remtoe {remote_path}")
-                    self.scp_client.put(local_path, remote_path)
-                print(f"[INFO]: File uploaded successfully: {local_path} to {remote_path}")
-            else:
-                print("SCP client not initialized. Ensure SSH connection is established.")
-        except Exception as e:
-            print(f"[ERR]: Failed to upload file: {e}")
-    
+        if not self.scp_client:
+            print("SCP client not initialized. Ensure SSH connection is established.")
+            return False
+        return self._retry_transfer("upload", self._upload_file, local_path, remote_path)
+
+    def _upload_file(self, local_path, remote_path):
+        if os.path.isdir(local_path):
+            # Folder update uses strategy: upload the files whose content differs remotely (SyncEngine)
+            print(f"[INFO]: Uploading local files in {local_path} to remote folder {remote_path}")
+            self._get_sync_engine().sync(local_path, remote_path, mode="upload")
+        elif os.path.getsize(local_path) >= self.large_file_bytes:
+            # Large file upload uses strategy: parallel ranges with resume and hash check
+            if remote_path.endswith('/') or self.is_dir(remote_path):
+                remote_path = remote_path.rstrip('/') + '/' + os.path.basename(local_path)
+            print(f"[INFO]: Uploading large file {local_path} to remote {remote_path}")
+            if not self._get_transfer_engine().upload(local_path, remote_path):
+                raise ConnectionError(f"upload of {local_path} did not complete")
+        else:
+            # Single file upload uses strategy: force replace
+            print(f"[INFO]: Uploading file {local_path} to remtoe {remote_path}")
+            self.scp_client.put(local_path, remote_path)
+        print(f"[INFO]: File uploaded successfully: {local_path} to {remote_path}")
 
-    def download_file(self, remote_path, local_path):
+    def download_file(self, remote_path, local_path, compress=None):
         """
         Download a file from the remote server using SCP.
+        compress: None for a plain copy, "auto" or a codec name ("flac", "zstd", "gzip")
+        to compress on the device while streaming, the local copy is decoded back.
+        Returns True on success, the download is retried if the connection drops.
         """
-        try:
-            if self.scp_client:
-                if remote_path.endswith('/'):
-                    # Folder download uses strategy: check file name list and download only new files
-                    # print(f"[INFO]: Downloading remote files in {remote_path} to local folder {local_path}")
-                    remote_files = set(self.get_file_name_list(remote_path))
-                    local_basename_files = []
-                    for file in os.listdir(local_path):
-                        local_basename_files.append(os.path.basename(file))
-                    for file in remote_files:
-                        # TODO: check if files content is changed
-                        if os.path.basename(file) not in local_basename_files:
-                            remote_file_path = os.path.join(remote_path, file)
-                            remote_file_path = remote_file_path.replace("\\", '/')
-                            print(f"[INFO]: Downloading file {remote_file_path} to local {local_path}")
-                            self.scp_client.get(remote_file_path, local_path)   
-                else:
-                    # Signle file download uses strategy: force replace
-                    parent_dir = os.path.dirname(local_path)
-                    if parent_dir and not os.path.exists(parent_dir):
-                        os.makedirs(parent_dir, exist_ok=True)
-                    print(f"[INFO]: Downloading file {remote_path} to local {local_path}")
-                    self.scp_client.get(remote_path, local_path)
-                print(f"[INFO]: File downloaded successfully: {remote_path} to {local_path}")
-            else:
-                print("SCP client not initialized. Ensure SSH connection is established.")
-        except Exception as e:
-            print(f"[ERR]: Failed to download file: {e}")
+        if not self.scp_client:
+            print("SCP client not initialized. Ensure SSH connection is established.")
+            return False
+        return self._retry_transfer("download", self._download_file, remote_path, local_path, compress)
+
+    def _download_file(self, remote_path, local_path, compress=None):
+        if remote_path.endswith('/'):
+            # Folder download uses strategy: download the files whose content differs locally (SyncEngine),
+            # compressed on the device if asked
+            print(f"[INFO]: Downloading remote files in {remote_path} to local folder {local_path}")
+            self._get_sync_engine().sync(local_path, remote_path, mode="download", compress=compress)
+        else:
+            # Signle file download uses strategy: force replace
+            parent_dir = os.path.dirname(local_path)
+            if parent_dir and not os.path.exists(parent_dir):
+                os.makedirs(parent_dir, exist_ok=True)
+            remote_stat = self.stat_many([remote_path])[remote_path]
+            codec = None
+            if compress and remote_stat["is_file"]:
+                # Compressed download uses strategy: encode on the device, decode while receiving
+                print(f"[INFO]: Downloading file {remote_path} compressed to local {local_path}")
+                codec = self._get_compressed_transfer().download(remote_path, local_path, compress,
+                                                                 remote_stat["mtime"])
+            if codec is None and remote_stat["is_file"] and remote_stat["size"] >= self.large_file_bytes:
+                # Large file download uses strategy: parallel ranges with resume and hash check
+                if os.path.isdir(local_path):
+                    local_path = os.path.join(local_path, os.path.basename(remote_path))
+                print(f"[INFO]: Downloading large file {remote_path} to local {local_path}")
+                if not self._get_transfer_engine().download(remote_path, local_path):
+                    raise ConnectionError(f"download of {remote_path} did not complete")
+            elif codec is None:
+                print(f"[INFO]: Downloading file {remote_path} to local {local_path}")
+                self.scp_client.get(remote_path, local_path)
+        print(f"[INFO]: File downloaded successfully: {remote_path} to {local_path}")
 
     def close(self):
         """
         Close the SSH connection and SCP client.
         """
         try:
+            self._monitor_stop.set()
+            self._close_shells()
             if self.scp_client:
                 self.scp_client.close()
             if self.client:
@@ -242,7 +628,7 @@ class SSHClient:
         """
         try:
             command = f"test -f {remote_file} && echo 'File exists' || echo 'File does not exist'"
-            output = self.execute_command(command)
+            output = self.execute_command(command, retry=True)
             return "File exists" in output
         except Exception as e:
             print(f"[ERR]: Failed to check file existence: {e}")
@@ -254,7 +640,7 @@ class SSHClient:
         """
         try:
             command = f"test -d {remote_path} && echo 'Directory exists' || echo 'Directory does not exist'"
-            output = self.execute_command(command)
+            output = self.execute_command(command, retry=True)
             return "Directory exists" in output
         except Exception as e:
             print(f"[ERR]: Failed to check directory existence: {e}")
@@ -287,7 +673,7 @@ class SSHClient:
                 )
 
 
-            output = self.execute_command(command)
+            output = self.execute_command(command, retry=True)
             if output:
                 file_list = output.split()
                 for i in range(len(file_list)):
@@ -333,7 +719,7 @@ class SSHClient:
         Get the list of available speakers on the remote system.
         """
         command = "aplay -l"
-        output = self.execute_command(command)
+        output = self.execute_command(command, retry=True)
         if output:
             # print("[INFO]: Available speakers:")
             # print(output)
@@ -365,7 +751,7 @@ class SSHClient:
         Get the list of available microphones on the remote system.
         """
         command = "arecord -l"
-        output = self.execute_command(command)
+        output = self.execute_command(command, retry=True)
         if output:
             # print("[INFO]: Available microphones:")
             # print(output)
@@ -377,25 +763,50 @@ class SSHClient:
 
 # Example Usage
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='SSH client example and command latency benchmark')
+    parser.add_argument("--host", type=str, default="192.168.50.140", help="Remote host")
+    parser.add_argument("-u", "--user", type=str, default="root", help="SSH user name")
+    parser.add_argument("-p", "--password", type=str, default="test0000", help="SSH password")
+    parser.add_argument("-n", "--count", type=int, default=20, help="Commands per benchmark run")
+    parser.add_argument("--bench", action="store_true", help="Compare exec channel and persistent shell latency")
+    parser.add_argument("--monitor", type=int, default=0, help="Print connection health for this many seconds")
+    args = parser.parse_args()
+
     # Initialize the SSH client
-    ssh_client = SSHClient(hostname="192.168.50.140",
-                           username="root", password="test0000")
+    ssh_client = SSHClient(hostname=args.host, username=args.user, password=args.password)
 
     # Connect to the remote host
     if ssh_client.connect():
-        # Execute a remote command
-        output = ssh_client.execute_command("ls -l /tmp")
-        if output:
-            print("[INFO]: Command output:", output)
+        if args.bench:
+            for persistent in (False, True):
+                ssh_client.persistent_shell = persistent
+                ssh_client.execute_command("true")  # warm up the pool
+                t0 = time.perf_counter()
+                for i in range(args.count):
+                    ssh_client.file_exists("/tmp")
+                per_cmd = (time.perf_counter() - t0) / args.count * 1000
+                name = "persistent shell" if persistent else "exec channel"
+                print(f"[BENCH]: {name:>16}: {per_cmd:.1f} ms per command ({args.count} commands)")
+        elif args.monitor:
+            t_end = time.time() + args.monitor
+            while time.time() < t_end:
+                time.sleep(ssh_client.keepalive_sec or 1)
+                print(f"[HEALTH]: {ssh_client.health()}")
+        else:
+            # Execute a remote command
+            output = ssh_client.execute_command("ls -l /tmp")
+            if output:
+                print("[INFO]: Command output:", output)
 
-        # # Upload a file (example)
-        # ssh_client.upload_file("local_file.txt", "/tmp/remote_file.txt")
-        output = ssh_client.get_mic_list()
-        if output:
-            print("[INFO]: Available speakers:", output)
+            # # Upload a file (example)
+            # ssh_client.upload_file("local_file.txt", "/tmp/remote_file.txt")
+            output = ssh_client.get_mic_list()
+            if output:
+                print("[INFO]: Available speakers:", output)
 
-        # # Download a file (example)
-        # ssh_client.download_file("/tmp/remote_file.txt", "downloaded_file.txt")
+            # # Download a file (example)
+            # ssh_client.download_file("/tmp/remote_file.txt", "downloaded_file.txt")
 
         # Close the SSH connection
         ssh_client.close()
@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import shlex
+import hashlib
+import tarfile
+import threading
+from analysis_cache import save_manifest_merged
+
+
+class _ChannelWriter:
+    """
+    Minimal write-only file object over a paramiko channel, for streaming tar output.
+    """
+    def __init__(self, channel):
+        self.channel = channel
+
+    def write(self, data):
+        self.channel.sendall(data)
+        return len(data)
+
+
+class SyncEngine:
+    """
+    Manifest-based folder sync between a local and a remote directory.
+    The remote manifest (relative path, size, mtime, sha256) is built by one remote
+    command, and files whose size and mtime match the cached manifest are not hashed
+    again on the device. Local hashes are memoized the same way. Both sides are diffed
+    against the hashes recorded at the last sync, and only changed files are moved,
+    in a single tar stream per direction.
+    """
+    def __init__(self, ssh_client, cache_dir="./cache/"):
+        self.ssh_client = ssh_client
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, "sync_manifest.json")
+        self.lock = threading.Lock()
+        # remote: {host:dir -> {rel: [size, mtime, sha256]}}
+        # local: {abs path -> [size, mtime_ns, sha256]}
+        # synced: {host:dir|local dir -> {rel: sha256}} as of the last sync
+        self.manifest = {"remote": {}, "local": {}, "synced": {}}
+        self._saved = {}  # manifest as last read or written, the base of the merge on save
+        try:
+            with open(self.manifest_path, 'r', encoding="utf-8") as f:
+                self.manifest.update(json.load(f))
+            self._saved = json.loads(json.dumps(self.manifest))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[WARN]: Sync manifest {self.manifest_path} is unreadable, starting empty: {e}")
+
+    def _save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # devices synced from other processes share the manifest, keep their entries
+        merged = save_manifest_merged(self.manifest_path, self.manifest, self._saved)
+        self.manifest.update(merged)
+        self._saved = json.loads(json.dumps(self.manifest))
+
+    def _remote_key(self, remote_dir):
+        return f"{self.ssh_client.hostname}:{remote_dir.rstrip('/')}"
+
+    def _pair_key(self, local_dir, remote_dir):
+        return f"{self._remote_key(remote_dir)}|{os.path.abspath(local_dir)}"
+
+    def remote_manifest(self, remote_dir):
+        """
+        {rel: {"size", "mtime", "sha256"}} of the regular files under remote_dir, in one round trip.
+        """
+        cached = self.manifest["remote"].get(self._remote_key(remote_dir), {})
+        # files whose "size mtime path" is unchanged keep their cached hash
+        patterns = "|".join(shlex.quote(f"{size} {mtime} {rel}") for rel, (size, mtime, _) in cached.items())
+        patterns = patterns or "''"
+        command = (
+            f"cd {shlex.quote(remote_dir)} 2>/dev/null && find . -type f | while IFS= read -r p; do "
+            f'p=${{p#./}}; st=$(stat -c \'%s %Y\' "$p"); '
+            f'case "$st $p" in {patterns}) h=-;; *) h=$(sha256sum "$p" | cut -d" " -f1);; esac; '
+            f'echo "$st $h $p"; done; true'
+        )
+        output, error, _ = self.ssh_client.run_command(command)
+        manifest = {}
+        for line in output.splitlines():
+            fields = line.split(" ", 3)
+            if len(fields) != 4 or not fields[0].isdigit():
+                continue
+            size, mtime, digest, rel = int(fields[0]), int(fields[1]), fields[2], fields[3]
+            if digest == "-":
+                digest = cached[rel][2]
+            manifest[rel] = {"size": size, "mtime": mtime, "sha256": digest}
+        with self.lock:
+            self.manifest["remote"][self._remote_key(remote_dir)] = \
+                {rel: [e["size"], e["mtime"], e["sha256"]] for rel, e in manifest.items()}
+        return manifest
+
+    def _local_digest(self, path, st):
+        abs_path = os.path.abspath(path)
+        memo = self.manifest["local"].get(abs_path)
+        if memo and memo[0] == st.st_size and memo[1] == st.st_mtime_ns:
+            return memo[2]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(block)
+        digest = h.hexdigest()
+        self.manifest["local"][abs_path] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def local_manifest(self, local_dir):
+        """
+        {rel: {"size", "mtime", "sha256"}} of the regular files under local_dir.
+        """
+        manifest = {}
+        for root, dirs, files in os.walk(local_dir):
+            for file in files:
+                path = os.path.join(root, file)
+                rel = os.path.relpath(path, local_dir).replace("\\", "/")
+                st = os.stat(path)
+                manifest[rel] = {"size": st.st_size, "mtime": int(st.st_mtime),
+                                 "sha256": self._local_digest(path, st)}
+        return manifest
+
+    def diff(self, local, remote, synced, mode="merge"):
+        """
+        Returns (to_upload, to_download) lists of relative paths.
+        A side changed if its hash differs from the last synced one; when both changed,
+        or there is no sync record, the newer file wins.
+        """
+        to_upload, to_download = [], []
+        for rel in sorted(set(local) | set(remote)):
+            loc, rem = local.get(rel), remote.get(rel)
+            if loc and rem and loc["sha256"] == rem["sha256"]:
+                continue
+            if mode == "upload":
+                if loc:
+                    to_upload.append(rel)
+            elif mode == "download":
+                if rem:
+                    to_download.append(rel)
+            elif loc is None:
+                to_download.append(rel)
+            elif rem is None:
+                to_upload.append(rel)
+            else:
+                base = synced.get(rel)
+                local_changed, remote_changed = loc["sha256"] != base, rem["sha256"] != base
+                if local_changed and not remote_changed:
+                    to_upload.append(rel)
+                elif remote_changed and not local_changed:
+                    to_download.append(rel)
+                elif loc["mtime"] >= rem["mtime"]:
+                    to_upload.append(rel)
+                else:
+                    to_download.append(rel)
+        return to_upload, to_download
+
+    def _open_exec(self, command):
+        channel = self.ssh_client.client.get_transport().open_session()
+        channel.exec_command(command)
+        return channel
+
+    def upload_tar(self, local_dir, remote_dir, names):
+        """
+        Upload names (relative to local_dir) as one tar stream extracted in remote_dir.
+        """
+        quoted_dir = shlex.quote(remote_dir)
+        channel = self._open_exec(f"mkdir -p {quoted_dir} && tar -xf - -C {quoted_dir}")
+        with tarfile.open(fileobj=_ChannelWriter(channel), mode="w|") as tar:
+            for rel in names:
+                tar.add(os.path.join(local_dir, rel), arcname=rel, recursive=False)
+        channel.shutdown_write()
+        error = channel.makefile_stderr('rb').read().decode("utf-8", "replace").strip()
+        status = channel.recv_exit_status()
+        channel.close()
+        if status != 0:
+            raise RuntimeError(f"remote tar exited with {status}: {error}")
+
+    def download_tar(self, remote_dir, local_dir, names):
+        """
+        Download names (relative to remote_dir) as one tar stream extracted in local_dir.
+        """
+        files = " ".join(shlex.quote(rel) for rel in names)
+        channel = self._open_exec(f"cd {shlex.quote(remote_dir)} && tar -cf - -- {files}")
+        wanted = set(names)
+        with tarfile.open(fileobj=channel.makefile('rb'), mode="r|") as tar:
+            for member in tar:
+                # only extract the regular files that were asked for
+                if not member.isfile() or member.name not in wanted:
+                    continue
+                path = os.path.join(local_dir, *member.name.split("/"))
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                tmp_path = path + ".part"
+                with tar.extractfile(member) as src, open(tmp_path, 'wb') as dst:
+                    for block in iter(lambda: src.read(1024 * 1024), b''):
+                        dst.write(block)
+                os.replace(tmp_path, path)
+                os.utime(path, (member.mtime, member.mtime))
+                wanted.discard(member.name)
+        error = channel.makefile_stderr('rb').read().decode("utf-8", "replace").strip()
+        status = channel.recv_exit_status()
+        channel.close()
+        if status != 0 or wanted:
+            raise RuntimeError(f"remote tar exited with {status}: {error}, missing {len(wanted)} files")
+
+    def _transfer(self, direction, local_dir, remote_dir, names):
+        try:
+            if direction == "upload":
+                self.upload_tar(local_dir, remote_dir, names)
+            else:
+                self.download_tar(remote_dir, local_dir, names)
+        except Exception as e:
+            # e.g. no tar on the device, fall back to one scp per file
+            print(f"[WARN]: Tar {direction} failed ({e}), falling back to per-file copy.")
+            scp = self.ssh_client.scp_client
+            for rel in names:
+                local_path = os.path.join(local_dir, rel)
+                remote_path = remote_dir.rstrip('/') + '/' + rel
+                if direction == "upload":
+                    self.ssh_client.execute_command(f"mkdir -p {shlex.quote(os.path.dirname(remote_path))}")
+                    scp.put(local_path, remote_path, preserve_times=True)
+                else:
+                    os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+                    scp.get(remote_path, local_path, preserve_times=True)
+
+    def _download_compressed(self, local_dir, remote_dir, names, remote, compress):
+        """
+        Download names one by one compressed on the device (see CompressedTransfer).
+        Returns the names no codec could transfer, left to the tar stream.
+        """
+        engine = self.ssh_client._get_compressed_transfer()
+        left = []
+        for rel in names:
+            remote_path = remote_dir.rstrip('/') + '/' + rel
+            if not engine.download(remote_path, os.path.join(local_dir, rel), compress, remote[rel]["mtime"]):
+                left.append(rel)
+        return left
+
+    def sync(self, local_dir, remote_dir, mode="merge", compress=None):
+        """
+        Sync local_dir and remote_dir, mode is "merge", "upload" or "download".
+        compress: None, "auto" or a codec name to compress downloads on the device.
+        Decoded copies are recorded with the remote hash, so they are not fetched again.
+        Returns {"uploaded": [...], "downloaded": [...]} relative paths.
+        """
+        if mode not in ("merge", "upload", "download"):
+            raise ValueError(f"Invalid sync mode: {mode}")
+        os.makedirs(local_dir, exist_ok=True)
+        t0 = time.time()
+        local = self.local_manifest(local_dir)
+        remote = self.remote_manifest(remote_dir)
+        pair_key = self._pair_key(local_dir, remote_dir)
+        synced = self.manifest["synced"].get(pair_key, {})
+        to_upload, to_download = self.diff(local, remote, synced, mode)
+        if to_upload:
+            print(f"[sync]: Uploading {len(to_upload)} file(s) to {remote_dir}")
+            self._transfer("upload", local_dir, remote_dir, to_upload)
+            remote_cache = self.manifest["remote"].setdefault(self._remote_key(remote_dir), {})
+            for rel in to_upload:
+                # tar keeps the local mtime (whole seconds) on the device
+                remote[rel] = dict(local[rel])
+                remote_cache[rel] = [local[rel]["size"], local[rel]["mtime"], local[rel]["sha256"]]
+        if to_download:
+            print(f"[sync]: Downloading {len(to_download)} file(s) from {remote_dir}")
+            left = self._download_compressed(local_dir, remote_dir, to_download, remote, compress) \
+                if compress else to_download
+            if left:
+                self._transfer("download", local_dir, remote_dir, left)
+            for rel in to_download:
+                path = os.path.join(local_dir, rel)
+                st = os.stat(path)
+                self.manifest["local"][os.path.abspath(path)] = [st.st_size, st.st_mtime_ns, remote[rel]["sha256"]]
+                local[rel] = dict(remote[rel])
+        # files identical on both sides are the new sync base
+        self.manifest["synced"][pair_key] = {rel: entry["sha256"] for rel, entry in local.items()
+                                             if rel in remote and remote[rel]["sha256"] == entry["sha256"]}
+        with self.lock:
+            self._save()
+        print(f"[sync]: {local_dir} <-> {remote_dir}: {len(to_upload)} up, {len(to_download)} down, "
+              f"{len(local)} local / {len(remote)} remote files, {time.time() - t0:.2f}s")
+        return {"uploaded": to_upload, "downloaded": to_download}
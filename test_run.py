@@ -9,17 +9,18 @@ import sys
 import signal
 import threading
 import re
-from multiprocessing import Process
-import copy 
+import base64
 
 from speech_quality_ana import *
 from pesq_score import PesqScore
+from compress_transfer import CompressedTransfer
+from ssh_client import SSHClient, KEEPALIVE_SEC, CONNECT_TIMEOUT_SEC
+from audio_module import AudioModule
+from device_caps import DeviceCaps, cras_node_id
+from wav_io import HEADER_PROBE_BYTES, RAW_SIDECAR_SUFFIX, parse_audio_header, wav_info, wav_capture_command
 
 cras_output_devices = []
 cras_input_devices = []
-tmp_rate = 0
-tmp_chns = 0
-tmp_fmt = ""
 
 # system init and setup
 def ssh_connect(args):
@@ -31,7 +32,9 @@ def ssh_connect(args):
         password = args.password
         ssh = paramiko.SSHClient()
         ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(hostname, port, username, password)
+        ssh.connect(hostname, port, username, password, timeout=CONNECT_TIMEOUT_SEC)
+        # keep NAT/Wi-Fi sessions open during long recordings
+        ssh.get_transport().set_keepalive(KEEPALIVE_SEC)
         print(f"成功连接到 {hostname}")
         return ssh
     except Exception as e:
@@ -173,6 +176,8 @@ def reset_alsa_client(args):
 def execute_remote_command(args, fatal=True):
     """执行远程命令"""
     ssh = args.ssh
+    if getattr(args, "device_caps", None) is not None:
+        args.device_caps.observe(args.command)
     try:
         stdin, stdout, stderr = ssh.exec_command(args.command)
         stdout_text = stdout.read().decode().strip()
@@ -219,6 +224,19 @@ def execute_local_command(command, args, fatal=True):
             print("fatal error, exit")
             sys.exit(2)
         return e.stderr
+def download_remote_file(args, remote_file_path, local_path):
+    """下载远程文件, 按 args.compress 在设备端压缩传输, 失败时回退到 scp"""
+    compress = getattr(args, "compress", "none")
+    if compress != "none":
+        # negotiated codecs are memoized in args, the ssh handle is reconnected often
+        engine = CompressedTransfer(args.ssh.get_transport(), codecs=getattr(args, "remote_codecs", None))
+        codec = engine.download(remote_file_path, local_path, compress)
+        args.remote_codecs = engine.codecs
+        if codec:
+            return
+    command = f"sshpass -p {args.password} scp -r {args.username}@" + \
+              f"{args.hostname}:{remote_file_path} {local_path}"
+    execute_local_command(command, args)
 def execute_scp_command(args):
     # If path has a "*" in it, it needs to be quoted to prevent shell expansion
     if args.download:
@@ -227,16 +245,11 @@ def execute_scp_command(args):
             stdout = execute_remote_command(args)
             for file in stdout.split("\n"):
                 if file:
-                    command = f"sshpass -p {args.password} scp -r " + \
-                              f"{args.username}@{args.hostname}:{file}" + \
-                              f" {args.local_path}"
-                    execute_local_command(command, args)
+                    download_remote_file(args, file, args.local_path)
             print(
                 f"Download: \n[remote]: {args.remote_path}\n-->\n[local]: {args.local_path}")
         else:
-            command = f"sshpass -p {args.password} scp -r {args.username}@" + \
-                      f"{args.hostname}:{args.remote_path} {args.local_path}"
-            execute_local_command(command, args)
+            download_remote_file(args, args.remote_path, args.local_path)
             print(
                 f"Download: \n[remote]: {args.remote_path}\n-->\n[local]: {args.local_path}")
 
@@ -263,16 +276,21 @@ def execute_scp_command(args):
             execute_local_command(command, args)
             print(
                 f"Upload: \n[local]: {args.local_path}\n-->\n[remote]: {args.remote_path}")
-def parse_wav_file(args, file_path):
-    args.command = f"sox --i -T {file_path}"
-    stdout = execute_remote_command(args)
-    channels = int(re.search(r"Channels\s+:\s+(\d+)", stdout).group(1))
-    rate = int(re.search(r"Sample Rate\s+:\s+(\d+)", stdout).group(1))
-    duration = re.search(r"Duration\s+:\s+([\d:.]+)", stdout).group(1)
-    fmt = re.search(r"Precision\s+:\s+(\d+)", stdout).group(1)
-    hh, mm, ss = map(float, duration.split(':'))
-    duration_sec = hh * 3600 + mm * 60 + ss
-    return [channels, rate, duration_sec, fmt]
+def parse_wav_file(args, file_path, local_file=None):
+    """
+    [channels, rate, duration_sec, bits] of a WAV file, parsed from local_file (a copy of the
+    remote file) or from the first bytes of the remote file, without sox on the device.
+    """
+    if local_file is not None and os.path.isfile(local_file):
+        info = wav_info(local_file)
+    else:
+        args.command = f"stat -c %s {file_path}; head -c {HEADER_PROBE_BYTES} {file_path} 2>/dev/null | base64; " \
+                       f"echo '@@sidecar'; cat {file_path}{RAW_SIDECAR_SUFFIX} 2>/dev/null"
+        stdout = execute_remote_command(args)
+        size, _, header = stdout.partition("\n")
+        header, _, sidecar = header.partition("@@sidecar")
+        info = parse_audio_header(base64.b64decode("".join(header.split())), int(size), sidecar.strip() or None)
+    return [info["channels"], info["sample_rate"], info["duration"], str(info["bits_per_sample"])]
 
 #audio operation functions
 def exec_play_audio(args):
@@ -282,6 +300,7 @@ def exec_play_audio(args):
     play_file_path = args.play_file
     remote_file_path = ""
     remote_store_path = "/root/plays/"
+    local_play_file_path = None
     # check remote file exist
     args.command = f"ls {play_file_path}"
     stdout = execute_remote_command(args)
@@ -306,7 +325,7 @@ def exec_play_audio(args):
         pass
 
     # get audio file duration
-    [args.pcm_chns, args.pcm_rate, duration_sec, pcm_fmt] = parse_wav_file(args, play_file_path)
+    [args.pcm_chns, args.pcm_rate, duration_sec, pcm_fmt] = parse_wav_file(args, play_file_path, local_play_file_path)
     args.pcm_fmt = f"S{pcm_fmt}_LE" 
     print("Playing " + play_file_path + " duration: " +
           str(duration_sec) + "s", "channels: ", args.pcm_chns , "rate: ", args.pcm_rate, "format: ", args.pcm_fmt)
@@ -358,35 +377,25 @@ def exec_record_audio(args):
         cras_card = get_remote_cras_card_parameter(args, "mic", "card_id")
         if args.volume == "0":
             args.volume = get_sys_mic_gain(args)
-        args.command = f"cras_test_client --select_input {cras_card} --capture_file {remote_file_path} " \
+        args.command = f"cras_test_client --select_input {cras_card} " \
                        f"--duration_seconds {duration} --rate {rate} --num_channels {chns} --capture_gain {args.volume}"
+        if file_type == "wav":
+            # S16_LE PCM streamed behind a WAV header written on the device, no sox pass
+            args.command = wav_capture_command(f"{args.command} --capture_file /dev/fd/3 3>&1 1>&2",
+                                               remote_file_path, int(rate), int(chns))
+        else:
+            args.command += f" --capture_file {remote_file_path}"
     else:
         alsa_card = args.alsa_card
+        # arecord writes the final WAV (or raw) file itself
         args.command = f"arecord -D {alsa_card} -f {fmt} " \
-                       f"-r {rate} -c {chns} -t wav -d {duration} > {remote_file_path}"
-        rate = tmp_rate if tmp_rate != 0 else rate
-        chns = tmp_chns if tmp_chns != 0 else chns
-        fmt = tmp_fmt if tmp_fmt != "" else fmt
+                       f"-r {rate} -c {chns} -t {file_type} -d {duration} {remote_file_path}"
     # record audio
     print(duration + "s Recording...")
     execute_remote_command(args)
     print("Recording Done!")
-    # convert pcm to wav
-    #TODO(shawn): auto format convert
-    if args.engine == "cras" and file_type == "wav":
-        args.command = f"sox -t raw -r {rate} -e signed -b 16 -c {chns} {remote_file_path} /tmp/{local_file_name}"
-        execute_remote_command(args)
-        args.command = f"mv /tmp/{local_file_name} {remote_file_path}"
-        execute_remote_command(args)
-    if args.engine == "alsa" and file_type == "wav":
-        args.command = f"sox -t raw -r {rate} -e signed -b 16 -c {chns} {remote_file_path} /tmp/{local_file_name}"
-        execute_remote_command(args)
-        args.command = f"mv /tmp/{local_file_name} {remote_file_path}"
-        execute_remote_command(args)
     # download record file to local
-    command = f"sshpass -p {args.password} rsync -avz {args.username}@{args.hostname}:{remote_file_path} {args.local_path}"
-    print({"command": command})
-    execute_local_command(command, args)
+    download_remote_file(args, remote_file_path, args.local_path)
     # if cras engine, download src file too
     # if args.engine == "cras":
     #     src_file_path = "/dev/shm/record_16k_src.wav"
@@ -396,6 +405,24 @@ def exec_record_audio(args):
     #     execute_local_command(command, args)
     args.record_file = ""
 
+def get_device_caps(args):
+    """
+    Audio capability registry of the remote device, probed once per run and memoized in args.
+    """
+    if getattr(args, "device_caps", None) is None:
+        def run(command):
+            args.command = command
+            return execute_remote_command(args, fatal=False)
+        args.device_caps = DeviceCaps(run)
+    return args.device_caps
+def device_card_name(card_name, dev_type):
+    """
+    Driver card name of a user facing card name: "bot"/"vibe" are the mic array and its speaker codec.
+    """
+    #TODO(shawn): change vibe bot mic and speaker name to bot in driver
+    if ("bot" in card_name.lower()) or ("vibe" in card_name.lower()):
+        return "vibemicarray" if dev_type == "micphone" else "rockchipad82178"
+    return card_name
 def get_remote_alsa_card_info(args, type, print_flag=True):
     dev_type = "micphone" if type.find(f"mic") >= 0 else "speaker"
     dev_cmd = "aplay" if dev_type == "speaker" else "arecord"
@@ -414,22 +441,16 @@ def get_remote_alsa_card_info(args, type, print_flag=True):
         else:
             return stdout
     else:
-        #TODO(shawn): change vibe bot mic and speaker name to bot in driver
-        card_name = args.card_name
-        if ("bot" in card_name.lower()) or ("vibe" in card_name.lower()):
-            card_name = "vibemicarray" if dev_type == "micphone" else "rockchipad82178"
-        args.command = f"{dev_cmd} -l | grep -i {card_name}"
-        stdout = execute_remote_command(args)
-        if(stdout == ""):
+        card_name = device_card_name(args.card_name, dev_type)
+        direction = "playback" if dev_type == "speaker" else "capture"
+        card = get_device_caps(args).find_alsa_card(card_name, direction)
+        if card is None:
             print(f"No {dev_type} found with name {args.card_name}")
             return None       
         # get card and device number
-        card_num = re.search(r"card\s+(\d+):", stdout)
-        dev_num = re.search(r"device\s+(\d+):", stdout)
-        args.alsa_card = f"hw:{card_num.group(1)},{dev_num.group(1)}"
+        args.alsa_card = card["hw"]
     
-        args.command = f"{dev_cmd} -D {args.alsa_card} --dump-hw-params /dev/zero"
-        stdout = execute_remote_command(args)
+        stdout = get_device_caps(args).hw_dump(args.alsa_card, direction)
         if print_flag:
             if stdout == "":
                 print(f"No {dev_type} devices found")
@@ -473,10 +494,10 @@ def get_remote_alsa_card_parameter(args, type, param):
         print("param not supported")
         return None
 def get_remote_cras_card_info(args, print_flag=True):
-    args.command = f"cras_test_client"
+    # --cras_info given on the command line replaces the device dump
     if(args.cras_info != ""):
         return args.cras_info
-    stdout = execute_remote_command(args)
+    stdout = get_device_caps(args).cras_dump()
     if stdout == "":
         print(f"No cras devices found")
         return None
@@ -485,37 +506,20 @@ def get_remote_cras_card_info(args, print_flag=True):
         print(stdout)
         return None
     else:
-        args.cras_info = stdout
         return stdout
 def get_remote_cras_card_parameter(args, type, param):
     info = get_remote_cras_card_info(args, False)
     dev_type = "micphone" if type.find(f"mic") >= 0 else "speaker"
     direction = "Input" if type == "mic" else "Output"
-    card_name = args.card_name
-    if (card_name.find("bot") >= 0) or (card_name.find("vibe") >= 0):
-        card_name = "vibemicarray" if dev_type=="micphone" else "rockchipad82178"
+    card_name = device_card_name(args.card_name, dev_type)
     if not info:
         print(f"No info found for the card {card_name}, please check the card name")
         return None
     if param == "card_id":
-        device_pattern =  re.compile(r"\s+(\d+)[^\n]*" + re.escape(card_name) + r"[^\n]*")
-        cras_card_node = ""
-        if(direction == "Output"):
-            output_section = info.split("Output Devices:")[1].split("Output Nodes:")[0]
-            node_id = re.findall(device_pattern, output_section)
-            if not node_id:
-                print(f"No {dev_type} found with name {args.card_name}")
-                return None
-            else:
-                cras_card_node = node_id[0] + ":0"   
-        else:
-            input_section = info.split("Input Devices:")[1].split("Input Nodes:")[0]
-            node_id = re.findall(device_pattern, input_section)
-            if not node_id:
-                print(f"No {dev_type} found with name {args.card_name}")
-                return None
-            else:
-                cras_card_node = node_id[0] + ":0"
+        cras_card_node = cras_node_id(info, card_name, direction)
+        if not cras_card_node:
+            print(f"No {dev_type} found with name {args.card_name}")
+            return None
         args.cras_card = cras_card_node 
         return cras_card_node
     else:
@@ -685,8 +689,7 @@ def doa_analysis(args):
     thread_record.join()
     thread_play.join()
     # download log file
-    command = f"sshpass -p {args.password} scp {args.username}@{args.hostname}:/var/log/messages /tmp/messages"
-    execute_local_command(command, args)
+    download_remote_file(args, "/var/log/messages", "/tmp/messages")
     # parse doa info and save to file
     doa_angle_file = f"./doa/{args.doa_analysis}.txt"
     command = f"cat /tmp/messages | grep '\[SSL\]' | awk '{{print $6}}' > {doa_angle_file}"
@@ -695,8 +698,7 @@ def doa_analysis(args):
     print(execute_local_command(command, args))
     # download doa audio file
     doa_auido_file = f"./doa/{args.doa_analysis}_src.wav"
-    command = f"sshpass -p {args.password} scp {args.username}@{args.hostname}:/dev/shm/record_48k_src.wav {doa_auido_file}"
-    execute_local_command(command, args)
+    download_remote_file(args, "/dev/shm/record_48k_src.wav", doa_auido_file)
     args.doa_analysis = ""
 
 def audio_quality_record_analysis(args):
@@ -704,49 +706,33 @@ def audio_quality_record_analysis(args):
     ref_audio_path = args.ref_audio 
     ref_base_name = os.path.basename(ref_audio_path).split(".")[0] 
     args.engine = "cras"
-    [args.pcm_chns, args.pcm_rate, args.duration, fmt] = parse_wav_file(args, ref_audio_path)
-
-    # copy args to avoid modifying the original
-    record_args = copy.copy(args)
-    play_args = copy.copy(args)
-    wait_time_s = 2
-    record_args.duration = f"{(int)(args.duration) + wait_time_s + 1}"  
-    record_args.record_file = f"{args.local_path}/{ref_base_name}_{args.card_name}.wav"
-    play_args.play_file = ref_audio_path
-    play_args.card_name = args.ref_speaker
-    play_args.volume = 100
-
-    # remove ssh from args, which can't be pickled. Since Process uses pickle to serialize the arguments
-    if hasattr(record_args, "ssh"):
-        del record_args.ssh
-    if hasattr(play_args, "ssh"):
-        del play_args.ssh
-    
-    # Create separate processes for recording and playback
-    record_proc = Process(target=exec_record_audio, args=(record_args,))
-    play_proc = Process(target=exec_play_audio, args=(play_args,))
-
-    record_proc.start()
-    # wait for cras_test_client to available again
-    time.sleep(wait_time_s)  
-    play_proc.start()
-
-    # Wait for the processes to finish or timeout
-    record_proc.join(timeout=15)
-    play_proc.join(timeout=15)
-
-    if record_proc.is_alive():
-        record_proc.terminate()
-        print("Recording process terminated due to timeout.")
-
-    if play_proc.is_alive():
-        play_proc.terminate()
-        print("Playback process terminated due to timeout.")
+    [args.pcm_chns, args.pcm_rate, args.duration, fmt] = parse_wav_file(args, ref_audio_path, ref_audio_path)
+    record_file = f"{args.local_path}/{ref_base_name}_{args.card_name}.wav"
 
+    # play and record are started by one device command on one connection, the session
+    # returns where the reference starts in the recording instead of sleeping and padding
+    ssh_client = SSHClient(hostname=args.hostname, username=args.username, password=args.password, port=args.port)
+    if not ssh_client.connect():
+        print("SSH connection failed")
+        return
+    audio_module = AudioModule()
+    audio_module.set_ssh_connect(ssh_client)
+    mic = device_card_name(args.card_name, "micphone")
+    speaker = device_card_name(args.ref_speaker, "speaker")
+    # same levels as a separate record/play: mic gain from --volume or the system, full speaker volume
+    capture_gain = get_sys_mic_gain(args) if args.volume == "0" else args.volume
+    audio_module.paras_settings(rate=args.pcm_rate, channels=args.pcm_chns, audio_format="S16_LE",
+                                engine=args.engine, device=f"hw:{mic},0")
+    offset = audio_module.play_and_record(ref_audio_path, record_file, f"hw:{speaker},0",
+                                          chirp=args.sync_chirp, capture_gain=capture_gain or None, volume=100)
+    ssh_client.close()
+    if offset is None:
+        print("Audio recording and playback failed.")
+        return
     print("Audio recording and playback completed.")
     
     pesq = PesqScore()
-    pesq.pesq_calc(ref_audio_path, [record_args.record_file])
+    pesq.pesq_calc(ref_audio_path, [record_file], offset_hint=offset)
 
 
 def create_signal_handler(args):
@@ -799,6 +785,7 @@ def main():
     parser.add_argument("-C", "--command", required=False, default="", help="Execute remote command")
     parser.add_argument("-D", "--download", action="store_true", help="Downlaod files")
     parser.add_argument("-U", "--upload", action="store_true", help="Upload files")
+    parser.add_argument("--compress", choices=["auto", "flac", "zstd", "gzip", "none"], default="none", help="Compress downloads on the device side (auto negotiates the codec), default none")
     parser.add_argument("-P", "--play_file", default="", help="Upload file to remote /root/plays(if neccessary) and remote plays audio file")
     parser.add_argument("-R", "--record_file", default="", help="Record audio file into /root/records/ and download to local file path")
     parser.add_argument("-s", "--set", choices=["speaker", "mic"], help="Set audio input output volume")
@@ -820,6 +807,7 @@ def main():
     parser.add_argument("--ref_audio", default=config["QUALITY"]["ref_audio"], help="Reference audio file for audio quality analysis")
     parser.add_argument("--ref_mic", default=config["QUALITY"]["ref_mic"], help="Reference mic file for audio quality analysis")
     parser.add_argument("--ref_speaker", default=config["QUALITY"]["ref_speaker"], help="Reference speaker file for audio quality analysis")
+    parser.add_argument("--sync_chirp", action="store_true", help="Play a sync chirp ahead of the reference to measure the exact capture offset")
     args = parser.parse_args()
 
     # signal handler
@@ -0,0 +1,157 @@
+import os
+import signal
+import subprocess
+
+from ssh_client import SSHClient
+
+
+class LoopbackChannel:
+    """
+    Stand-in for a paramiko exec channel that runs the command in a local shell,
+    so the device side of the engines runs for real against the local filesystem.
+    """
+    def __init__(self):
+        self.proc = None
+
+    def exec_command(self, command):
+        # own process group, so close() also ends the children holding the pipes
+        self.proc = subprocess.Popen(["sh", "-c", command], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE, start_new_session=True)
+
+    def recv(self, nbytes):
+        return self.proc.stdout.read1(nbytes)
+
+    def sendall(self, data):
+        self.proc.stdin.write(data)
+        self.proc.stdin.flush()
+
+    def shutdown_write(self):
+        self.proc.stdin.close()
+
+    def makefile(self, mode='rb'):
+        return self.proc.stdout
+
+    def makefile_stderr(self, mode='rb'):
+        return self.proc.stderr
+
+    def recv_exit_status(self):
+        return self.proc.wait()
+
+    def close(self):
+        if self.proc is None:
+            return
+        if self.proc.poll() is None:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        self.proc.wait()
+        for pipe in (self.proc.stdin, self.proc.stdout, self.proc.stderr):
+            try:
+                pipe.close()
+            except (OSError, ValueError):
+                pass
+
+
+class LoopbackTransport:
+    def __init__(self):
+        self.sessions = []
+
+    def open_session(self):
+        channel = LoopbackChannel()
+        self.sessions.append(channel)
+        return channel
+
+
+class LoopbackClient:
+    def __init__(self, transport):
+        self.transport = transport
+
+    def get_transport(self):
+        return self.transport
+
+
+class LoopbackSSHClient:
+    """
+    SSHClient stand-in whose "device" is the local host: commands run in a local shell
+    and exec channels are LoopbackChannel. stat_many and the folder transfers are SSHClient's own.
+    """
+    stat_many = SSHClient.stat_many
+    _upload_file = SSHClient._upload_file
+    _download_file = SSHClient._download_file
+    _get_sync_engine = SSHClient._get_sync_engine
+    _get_compressed_transfer = SSHClient._get_compressed_transfer
+
+    def __init__(self, hostname="loopback"):
+        self.hostname = hostname
+        self.transport = LoopbackTransport()
+        self.client = LoopbackClient(self.transport)
+        self.scp_client = None
+        self.sync_engine = None
+        self.compressed_transfer = None
+        self.remote_digests = {}
+        self.commands = []
+
+    def run_command(self, command, timeout=None, **kwargs):
+        self.commands.append(command)
+        result = subprocess.run(["sh", "-c", command], capture_output=True, timeout=timeout)
+        return result.stdout.decode("utf-8", "replace"), result.stderr.decode("utf-8", "replace"), result.returncode
+
+    def execute_command(self, command):
+        output, error, _ = self.run_command(command)
+        return output, error
+
+
+class LoopbackSftpFile:
+    def __init__(self, sftp, path, mode):
+        self.sftp = sftp
+        self.file = open(path, mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+
+    def seek(self, offset):
+        if offset in self.sftp.fail_offsets:
+            raise ConnectionResetError("connection dropped")
+        self.sftp.offsets.append(offset)
+        self.file.seek(offset)
+
+    def readv(self, chunks):
+        for offset, length in chunks:
+            self.seek(offset)
+            yield self.file.read(length)
+
+    def set_pipelined(self, pipelined=True):
+        pass
+
+    def write(self, data):
+        self.file.write(data)
+
+    def truncate(self, size):
+        self.file.truncate(size)
+
+
+class LoopbackSftp:
+    """
+    Stand-in for paramiko.SFTPClient on the local filesystem. Seeking to one of
+    fail_offsets raises, as a dropped connection would in the middle of a transfer,
+    and the offsets of the ranges moved are recorded.
+    """
+    def __init__(self, fail_offsets=(), offsets=None):
+        self.fail_offsets = set(fail_offsets)
+        self.offsets = [] if offsets is None else offsets
+
+    def open(self, path, mode='r'):
+        return LoopbackSftpFile(self, path, mode)
+
+    def utime(self, path, times):
+        os.utime(path, times)
+
+    def posix_rename(self, old_path, new_path):
+        os.replace(old_path, new_path)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def close(self):
+        pass
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from align_engine import AlignEngine, _legacy_offset
+
+SAMPLE_RATE = 16000
+
+
+def speech_like(rng, n):
+    # low-passed noise, so the decimated coarse search has something to lock on
+    b, a = signal.butter(4, 0.1)
+    return signal.lfilter(b, a, rng.normal(size=n)).astype(np.float32)
+
+
+def make_pair(delay, seed=0, ref_sec=1.5, tail_sec=0.5):
+    rng = np.random.default_rng(seed)
+    ref = speech_like(rng, int(ref_sec * SAMPLE_RATE))
+    if delay >= 0:
+        deg = np.concatenate([np.zeros(delay, dtype=np.float32), 0.5 * ref])
+    else:
+        deg = 0.5 * ref[-delay:]
+    deg = np.concatenate([deg, np.zeros(int(tail_sec * SAMPLE_RATE), dtype=np.float32)])
+    deg += 0.01 * rng.normal(size=len(deg)).astype(np.float32)
+    return ref, deg
+
+
+@pytest.mark.parametrize("decimate", [1, 8])
+@pytest.mark.parametrize("delay", [0, 1234, 20000, -300])
+def test_bounded_search_matches_full_correlation(decimate, delay):
+    ref, deg = make_pair(delay)
+    full = _legacy_offset(ref, deg)
+    assert full == delay
+    engine = AlignEngine(decimate)
+    assert engine.find_offset(deg, ref_signal=ref) == full
+    tor = SAMPLE_RATE // 2
+    assert engine.find_offset(deg, delay - tor, delay + tor) == full
+
+
+@pytest.mark.parametrize("decimate", [1, 8])
+def test_window_limits_the_result(decimate):
+    ref, deg = make_pair(20000)
+    engine = AlignEngine(decimate)
+    engine.set_reference(ref)
+    lag = engine.find_offset(deg, 0, 10000)
+    assert 0 <= lag <= 10000
+    with pytest.raises(ValueError):
+        engine.find_offset(deg, 10, 5)
+
+
+@pytest.mark.parametrize("decimate", [1, 8])
+def test_precompute_fills_the_spectra_find_offset_uses(decimate):
+    ref, deg = make_pair(1234)
+    engine = AlignEngine(decimate)
+    spectra = {}
+    engine.set_reference(ref, spectra)
+    engine.precompute(len(deg), -100, 5000)
+    keys = set(spectra)
+    assert len(keys) == 1
+    # a second engine sharing the precomputed spectra computes no FFT of the reference
+    worker = AlignEngine(decimate)
+    worker.set_reference(ref, dict(spectra))
+    assert worker.find_offset(deg, -100, 5000) == 1234
+    assert set(worker._spectra) == keys
+
+
+def test_spectra_cache_is_bounded():
+    ref, deg = make_pair(1234)
+    engine = AlignEngine(max_spectra=2)
+    engine.set_reference(ref)
+    for max_lag in (2000, 20000, 40000):
+        engine.find_offset(deg, 0, max_lag)
+    assert len(engine._spectra) == 2
+    sizes = [nfft for _, nfft in engine._spectra]
+    # the least recently used size was dropped first
+    engine.find_offset(deg, 0, 20000)
+    assert [nfft for _, nfft in engine._spectra] == [sizes[1], sizes[0]]
@@ -0,0 +1,68 @@
+import json
+
+from analysis_cache import AnalysisCache
+
+
+def test_key_follows_file_content(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    path = tmp_path / "rec.wav"
+    path.write_bytes(b'first')
+    key = cache.make_key("doa", str(path), rate=16000)
+    assert cache.make_key("doa", str(path), rate=16000) == key
+    assert cache.make_key("doa", str(path), rate=48000) != key
+    path.write_bytes(b'second take')
+    assert cache.make_key("doa", str(path), rate=16000) != key
+
+
+def test_json_round_trip(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    assert cache.get_json("k" * 64) is None
+    cache.put_json("k" * 64, {"records": [1, 2]})
+    assert AnalysisCache(str(tmp_path / "cache")).get_json("k" * 64) == {"records": [1, 2]}
+
+
+def test_eviction_keeps_recent_entries(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache"), max_bytes=250)
+    for i in range(4):
+        cache.put_json(f"{i}" * 64, "x" * 100)
+    assert cache.total_size() <= 250
+    assert cache.get_json("3" * 64) == "x" * 100
+    assert cache.get_json("0" * 64) is None
+
+
+def test_restore_artifacts(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    outputs = [tmp_path / "out" / "doa.csv", tmp_path / "out" / "doa.png"]
+    outputs[0].parent.mkdir()
+    outputs[0].write_text("block,start_sec")
+    outputs[1].write_bytes(b'\x89PNG')
+    cache.put_artifacts("a" * 64, [str(p) for p in outputs])
+    restored = [tmp_path / "elsewhere" / "doa.csv", tmp_path / "elsewhere" / "doa.png"]
+    assert cache.restore_artifacts("a" * 64, [str(p) for p in restored])
+    assert restored[0].read_text() == "block,start_sec"
+    assert restored[1].read_bytes() == b'\x89PNG'
+    # one artifact more than cached is a miss, nothing is copied
+    assert not cache.restore_artifacts("a" * 64, [str(tmp_path / "x.csv"), str(tmp_path / "x.png"),
+                                                   str(tmp_path / "x.json")])
+    assert not (tmp_path / "x.csv").exists()
+
+
+def test_shared_manifest_keeps_other_writers_entries(tmp_path):
+    first = AnalysisCache(str(tmp_path / "cache"))
+    second = AnalysisCache(str(tmp_path / "cache"))
+    first.put_json("a" * 64, 1)
+    second.put_json("b" * 64, 2)
+    first.put_json("c" * 64, 3)
+    with open(tmp_path / "cache" / "manifest.json", encoding="utf-8") as f:
+        entries = json.load(f)["entries"]
+    assert set(entries) == {"a" * 64, "b" * 64, "c" * 64}
+    assert first.get_json("b" * 64) == 2
+
+
+def test_clear_drops_other_writers_entries(tmp_path):
+    first = AnalysisCache(str(tmp_path / "cache"))
+    second = AnalysisCache(str(tmp_path / "cache"))
+    second.put_json("b" * 64, 2)
+    first.put_json("c" * 64, 3)
+    second.clear()
+    assert AnalysisCache(str(tmp_path / "cache")).manifest["entries"] == {}
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from audio_module import AudioModule
+
+RATE = 16000
+
+
+@pytest.mark.parametrize("file_format, subtype, sample_fmt, bits", [
+    ("FLAC", "PCM_24", "S32_LE", 24),
+    ("OGG", "VORBIS", "S16_LE", 0),
+])
+def test_get_wav_info_reads_compressed_files(tmp_path, file_format, subtype, sample_fmt, bits):
+    path = tmp_path / f"tone.{file_format.lower()}"
+    data = 0.5 * np.sin(np.arange(2 * RATE) * 2 * np.pi * 440 / RATE)
+    sf.write(str(path), np.stack([data, data], axis=1), RATE, subtype=subtype, format=file_format)
+    info = AudioModule().get_wav_info(str(path))
+    assert info == {"channels": 2, "sample_rate": RATE, "num_frames": 2 * RATE, "duration": 2,
+                    "sample_fmt": sample_fmt, "bits_per_sample": bits, "container": file_format}
+
+
+def test_get_wav_info_rejects_other_files(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("not audio")
+    assert AudioModule().get_wav_info(str(path)) is None
@@ -0,0 +1,138 @@
+import os
+import shlex
+import time
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from audio_module import AudioModule
+from capture_stream import CaptureStream, RingBuffer
+from loopback import LoopbackSSHClient
+
+RATE = 16000
+
+
+def test_ring_buffer_keeps_the_latest_frames():
+    ring = RingBuffer(10, 1)
+    ring.write(np.arange(7, dtype=np.float32)[:, None])
+    ring.write(np.arange(7, 13, dtype=np.float32)[:, None])
+    assert ring.total == 13
+    start, frames = ring.read(0)
+    # the oldest frames were overwritten, reads start at the oldest one held
+    assert start == 3
+    np.testing.assert_array_equal(frames[:, 0], np.arange(3, 13))
+    np.testing.assert_array_equal(ring.latest(4)[:, 0], np.arange(9, 13))
+    np.testing.assert_array_equal(ring.read(5, 8)[1][:, 0], [5, 6, 7])
+    ring.write(np.arange(100, 125, dtype=np.float32)[:, None])
+    assert ring.total == 38
+    np.testing.assert_array_equal(ring.latest(10)[:, 0], np.arange(115, 125))
+
+
+def raw_capture(audio_format, channels=2, frames=5000, seed=0):
+    """
+    (raw bytes as the device writes them, expected float32 block, expected int32 WAV samples)
+    """
+    rng = np.random.default_rng(seed)
+    if audio_format == "FLOAT_LE":
+        values = rng.uniform(-1, 1, (frames, channels)).astype('<f4')
+        return values.tobytes(), values, None
+    if audio_format == "S16_LE":
+        values = rng.integers(-2 ** 15, 2 ** 15, (frames, channels)).astype('<i2')
+        return values.tobytes(), values / 2.0 ** 15, values.astype(np.int32) << 16
+    if audio_format == "S32_LE":
+        values = rng.integers(-2 ** 31, 2 ** 31, (frames, channels)).astype('<i4')
+        return values.tobytes(), values / 2.0 ** 31, values
+    values = rng.integers(-2 ** 23, 2 ** 23, (frames, channels)).astype('<i4')
+    if audio_format == "S24_3LE":
+        raw = values.view(np.uint8).reshape(frames, channels, 4)[..., :3].tobytes()
+    else:
+        raw = values.tobytes()
+    return raw, values / 2.0 ** 23, values << 8
+
+
+@pytest.mark.parametrize("audio_format", ["S16_LE", "S24_3LE", "S24_LE", "S32_LE", "FLOAT_LE"])
+def test_decode_round_trip(tmp_path, audio_format):
+    raw, expected, wav_samples = raw_capture(audio_format)
+    raw_path = tmp_path / "capture.raw"
+    raw_path.write_bytes(raw)
+    output_file = tmp_path / "rec.wav"
+    blocks = []
+    # odd sized writes, frames arrive split across reads
+    command = f"dd if={shlex.quote(str(raw_path))} bs=7 2>/dev/null"
+    stream = CaptureStream(LoopbackSSHClient(), command, RATE, 2, audio_format, output_file=str(output_file),
+                           on_block=lambda start, block: blocks.append((start, len(block))))
+    assert stream.start().wait(10)
+    assert stream.frames == len(expected)
+    np.testing.assert_allclose(stream.ring.latest(len(expected)), expected, rtol=1e-6, atol=1e-9)
+    assert [start for start, _ in blocks] == list(np.cumsum([0] + [n for _, n in blocks])[:-1])
+    if wav_samples is None:
+        samples, rate = sf.read(str(output_file), dtype="float32")
+        np.testing.assert_array_equal(samples, expected)
+    else:
+        samples, rate = sf.read(str(output_file), dtype="int32")
+        np.testing.assert_array_equal(samples, wav_samples)
+    assert rate == RATE
+
+
+def test_failed_command_is_reported():
+    stream = CaptureStream(LoopbackSSHClient(), "echo no device >&2; exit 2", RATE, 1)
+    assert not stream.start().wait(10)
+    assert stream.exit_status == 2
+    assert stream.stderr == "no device"
+
+
+def test_stop_keeps_received_frames(tmp_path):
+    raw, expected, _ = raw_capture("S16_LE", channels=1)
+    raw_path = tmp_path / "capture.raw"
+    raw_path.write_bytes(raw)
+    stream = CaptureStream(LoopbackSSHClient(), f"cat {shlex.quote(str(raw_path))}; sleep 30", RATE, 1)
+    stream.start()
+    deadline = time.time() + 10
+    while stream.frames < len(expected) and time.time() < deadline:
+        time.sleep(0.01)
+    stream.stop()
+    assert stream.wait(10)
+    np.testing.assert_allclose(stream.ring.latest(len(expected)), expected)
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        CaptureStream(LoopbackSSHClient(), "true", RATE, 1, "MU_LAW")
+
+
+@pytest.fixture
+def cras_module(tmp_path, monkeypatch):
+    """
+    AudioModule on the loopback device, capturing one second of silence.
+    """
+    module = AudioModule()
+    module.ssh_client = LoopbackSSHClient()
+    module.ssh_client.file_exists = os.path.isfile
+    module.remote_rec_dir = str(tmp_path / "remote") + "/"
+    os.makedirs(module.remote_rec_dir)
+    module.engine, module.rate, module.channels, module.audio_format = "cras", RATE, 1, "S16_LE"
+    monkeypatch.setattr(module, "capture_command", lambda frames=None, gain=None: f"head -c {RATE * 2} /dev/zero")
+    return module
+
+
+def test_record_audio_streams_only_when_asked(cras_module, tmp_path):
+    output_file = tmp_path / "local" / "rec.wav"
+    assert cras_module.stream_capture is False
+    assert cras_module.record_audio(str(output_file)) is True
+    assert not cras_module.record_streamed and not output_file.exists()
+    assert sf.info(cras_module.remote_rec_dir + "rec.wav").frames == RATE
+    assert cras_module.record_audio(str(output_file), stream=True) is True
+    assert cras_module.record_streamed
+    assert sf.info(str(output_file)).frames == RATE
+
+
+@pytest.mark.parametrize("file_type, stream_starts", [("wav", False), ("raw", True)])
+def test_record_audio_falls_back_to_the_device(cras_module, tmp_path, monkeypatch, file_type, stream_starts):
+    if not stream_starts:
+        monkeypatch.setattr(cras_module, "start_capture_stream", lambda *args: None)
+    cras_module.file_type = file_type
+    output_file = tmp_path / f"rec.{file_type}"
+    assert cras_module.record_audio(str(output_file), stream=True) is True
+    assert not cras_module.record_streamed and not output_file.exists()
+    assert os.path.getsize(cras_module.remote_rec_dir + output_file.name) >= RATE * 2
@@ -0,0 +1,84 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from compress_transfer import REMOTE_COMMANDS, CompressedTransfer, local_codecs
+from loopback import LoopbackTransport
+
+
+@pytest.fixture
+def recording(tmp_path):
+    rng = np.random.default_rng(0)
+    samples = (rng.normal(0, 3000, (16000, 2))).astype(np.int16)
+    path = tmp_path / "remote" / "rec.wav"
+    path.parent.mkdir()
+    sf.write(str(path), samples, 16000, subtype="PCM_16")
+    return path, samples
+
+
+def available(codec):
+    return codec in local_codecs() and shutil.which(codec) is not None
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_generic_codecs_are_byte_exact(tmp_path, recording, codec):
+    if not available(codec):
+        pytest.skip(f"{codec} is not installed")
+    path, _ = recording
+    engine = CompressedTransfer(LoopbackTransport(), codecs=[codec])
+    local_path = tmp_path / "local" / "rec.wav"
+    assert engine.download(str(path), str(local_path), compress=codec, mtime=1234) == codec
+    assert local_path.read_bytes() == path.read_bytes()
+    assert os.path.getmtime(local_path) == 1234
+    assert not os.path.exists(str(local_path) + ".part")
+
+
+@pytest.mark.skipif(not available("flac"), reason="flac is not installed")
+def test_flac_is_sample_exact(tmp_path, recording):
+    path, samples = recording
+    engine = CompressedTransfer(LoopbackTransport(), codecs=["flac", "gzip"])
+    local_dir = tmp_path / "local"
+    local_dir.mkdir()
+    assert engine.download(str(path), str(local_dir)) == "flac"
+    decoded, rate = sf.read(str(local_dir / "rec.wav"), dtype="int16")
+    assert rate == 16000
+    np.testing.assert_array_equal(decoded, samples)
+
+
+def test_failed_codec_falls_back_to_the_next(tmp_path, recording, monkeypatch):
+    path, _ = recording
+    monkeypatch.setitem(REMOTE_COMMANDS, "zstd", "echo broken >&2; exit 1")
+    engine = CompressedTransfer(LoopbackTransport(), codecs=["zstd", "gzip"])
+    local_path = tmp_path / "rec.wav"
+    assert engine.download(str(path), str(local_path)) == "gzip"
+    assert local_path.read_bytes() == path.read_bytes()
+
+
+def test_truncated_stream_is_discarded(tmp_path, recording, monkeypatch):
+    path, _ = recording
+    monkeypatch.setitem(REMOTE_COMMANDS, "gzip", "gzip -c -1 < {path} | head -c 1000")
+    engine = CompressedTransfer(LoopbackTransport(), codecs=["gzip"])
+    local_path = tmp_path / "rec.wav"
+    assert engine.download(str(path), str(local_path)) is None
+    assert not local_path.exists()
+    assert not os.path.exists(str(local_path) + ".part")
+
+
+def test_folder_is_left_to_the_caller(tmp_path):
+    engine = CompressedTransfer(LoopbackTransport(), codecs=["gzip"])
+    assert engine.download(str(tmp_path), str(tmp_path / "copy")) is None
+    assert not os.path.exists(str(tmp_path / "copy") + ".part")
+
+
+def test_codec_negotiation():
+    engine = CompressedTransfer(LoopbackTransport())
+    codecs = engine.remote_codecs()
+    assert "gzip" in codecs
+    assert codecs == [c for c in local_codecs() if c in codecs]
+    assert "flac" not in engine.candidates("/root/records/log.txt")
+    assert engine.candidates("/root/records/rec.wav", "gzip")[0] == "gzip"
+    with pytest.raises(ValueError):
+        engine.candidates("/root/records/rec.wav", "lzma")
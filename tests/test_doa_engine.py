@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from doa_engine import (INVALID_ANGLE, DoaPlotTrace, _legacy_analyze, analyze_doa_angles, decode_ssl_angles,
+                        segment_doa_blocks, summarize_doa_stream, synth_ssl_channel, unwrap_doa_trace)
+
+SAMPLE_RATE = 16000
+
+
+def chunked(values, size):
+    return (values[i:i + size] for i in range(0, len(values), size))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_segmentation_matches_legacy(seed):
+    ssl = synth_ssl_channel(8, SAMPLE_RATE, seed=seed)
+    legacy = _legacy_analyze(ssl, SAMPLE_RATE)
+    stats = analyze_doa_angles(decode_ssl_angles(ssl), SAMPLE_RATE)
+    assert len(stats) == len(legacy) > 0
+    for old, new in zip(legacy, stats):
+        assert new['duration'] == old['duration']
+        assert new['average'] == pytest.approx(old['average'], abs=1e-3)
+        assert new['std'] == pytest.approx(old['std'], abs=1e-3)
+        assert new['pole_diff'] == pytest.approx(old['pole_diff'], abs=1e-3)
+
+
+@pytest.mark.parametrize("tail_valid", [False, True])
+def test_tail_block_needs_invalid_last_sample(tail_valid):
+    ssl = np.full(200, 1.0, dtype=np.float32)
+    ssl[10:60] = 0.1
+    ssl[100:199] = 0.2
+    if tail_valid:
+        ssl[199] = 0.2
+    legacy = _legacy_analyze(ssl, SAMPLE_RATE, block_divide_thresh=20, block_min_size=10)
+    blocks = segment_doa_blocks(decode_ssl_angles(ssl), block_divide_thresh=20, block_min_size=10)
+    assert [len(idx) / SAMPLE_RATE for idx in blocks] == [s['duration'] for s in legacy]
+    assert len(blocks) == (1 if tail_valid else 2)
+
+
+def test_decode_marks_full_scale_invalid():
+    angles = decode_ssl_angles(np.array([0.0, 0.475, -0.475, 0.96, -1.0], dtype=np.float32))
+    np.testing.assert_allclose(angles, [0.0, 90.0, 270.0, INVALID_ANGLE, INVALID_ANGLE], atol=1e-4)
+
+
+def test_stream_summary_is_chunk_size_invariant():
+    angles = decode_ssl_angles(synth_ssl_channel(8, SAMPLE_RATE, seed=3))
+    blocks = segment_doa_blocks(angles.copy())
+    whole = summarize_doa_stream([angles], SAMPLE_RATE)
+    assert [r['samples'] for r in whole] == [len(idx) for idx in blocks]
+    for chunk_size in (1000, 4097, SAMPLE_RATE):
+        records = summarize_doa_stream(chunked(angles, chunk_size), SAMPLE_RATE)
+        assert len(records) == len(whole)
+        for old, new in zip(whole, records):
+            assert new['samples'] == old['samples']
+            assert new['start_sec'] == old['start_sec']
+            assert new['circ_mean'] == pytest.approx(old['circ_mean'], abs=1e-6)
+            assert new['average'] == pytest.approx(old['average'], abs=1e-6)
+            assert new['pole_diff'] == pytest.approx(old['pole_diff'], abs=1e-6)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("chunk_size", [997, 4096, SAMPLE_RATE * 10])
+def test_stream_summary_matches_legacy(seed, chunk_size):
+    ssl = synth_ssl_channel(8, SAMPLE_RATE, seed=seed)
+    legacy = _legacy_analyze(ssl, SAMPLE_RATE)
+    records = summarize_doa_stream(chunked(decode_ssl_angles(ssl), chunk_size), SAMPLE_RATE)
+    assert len(records) == len(legacy) > 0
+    for old, new in zip(legacy, records):
+        assert new['duration'] == old['duration']
+        assert new['average'] == pytest.approx(old['average'], abs=1e-3)
+        assert new['std'] == pytest.approx(old['std'], abs=1e-3)
+        assert new['pole_diff'] == pytest.approx(old['pole_diff'], abs=1e-3)
+
+
+def test_stream_summary_unwraps_blocks_crossing_the_pole():
+    # one block jittering around 0/360 degrees
+    ssl = np.full(4000, 1.0, dtype=np.float32)
+    jitter = np.random.default_rng(6).normal(0, 0.02, 3000).astype(np.float32)
+    ssl[500:3500] = jitter
+    legacy = _legacy_analyze(ssl, SAMPLE_RATE)
+    records = summarize_doa_stream(chunked(decode_ssl_angles(ssl), 700), SAMPLE_RATE)
+    assert len(records) == len(legacy) == 1
+    assert records[0]['average'] == pytest.approx(legacy[0]['average'], abs=1e-3)
+    assert records[0]['std'] == pytest.approx(legacy[0]['std'], abs=1e-3)
+    assert records[0]['pole_diff'] == pytest.approx(legacy[0]['pole_diff'], abs=1e-3)
+    assert legacy[0]['pole_diff'] < 180
+
+
+def test_stream_writes_records(tmp_path):
+    angles = decode_ssl_angles(synth_ssl_channel(4, SAMPLE_RATE, seed=4))
+    output_path = tmp_path / "doa.csv"
+    records = summarize_doa_stream(chunked(angles, 3000), SAMPLE_RATE, output_path=str(output_path))
+    lines = output_path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == len(records) + 1
+
+
+@pytest.mark.parametrize("max_points", [10 ** 6, 5000])
+def test_plot_trace_matches_unwrapped_trace(max_points):
+    angles = decode_ssl_angles(synth_ssl_channel(8, SAMPLE_RATE, seed=5))
+    trace = DoaPlotTrace(len(angles), max_points=max_points)
+    summarize_doa_stream(chunked(angles, 3001), SAMPLE_RATE, plot_trace=trace)
+    expected = unwrap_doa_trace(angles.copy())[::trace.step]
+    np.testing.assert_array_equal(trace.index, np.arange(0, len(angles), trace.step))
+    np.testing.assert_array_equal(trace.angles, expected)
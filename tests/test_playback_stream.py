@@ -0,0 +1,117 @@
+import os
+import shlex
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from audio_module import AudioModule
+from loopback import LoopbackSSHClient
+from playback_stream import PcmSource, PlaybackStream
+
+RATE = 48000
+
+
+def play(tmp_path, source, max_frames=None):
+    """
+    Stream source into a loopback "player" writing stdin to a file, returns the bytes it received.
+    """
+    received = tmp_path / "received.raw"
+    stream = PlaybackStream(LoopbackSSHClient(), f"cat > {shlex.quote(str(received))}", source, max_frames)
+    assert stream.start().wait(10)
+    return received.read_bytes(), stream
+
+
+@pytest.mark.parametrize("dtype, audio_format", [("int16", "S16_LE"), ("int32", "S32_LE"), ("float32", "FLOAT_LE")])
+def test_array_round_trip(tmp_path, dtype, audio_format):
+    data = (np.random.default_rng(0).uniform(-0.5, 0.5, (10000, 2)) * (1 if dtype == "float32" else 20000))
+    data = data.astype(dtype)
+    source = PcmSource.from_array(data, RATE, chunk_frames=999)
+    assert (source.rate, source.channels, source.audio_format, source.frames) == (RATE, 2, audio_format, 10000)
+    received, stream = play(tmp_path, source)
+    np.testing.assert_array_equal(np.frombuffer(received, dtype=np.dtype(dtype).newbyteorder('<')).reshape(-1, 2),
+                                  data)
+    assert stream.frames == 10000
+
+
+def test_max_frames_stops_on_a_frame(tmp_path):
+    data = np.arange(20000, dtype=np.int16).reshape(-1, 2)
+    received, stream = play(tmp_path, PcmSource.from_array(data, RATE, chunk_frames=4096), max_frames=5001)
+    assert stream.frames == 5001
+    np.testing.assert_array_equal(np.frombuffer(received, dtype='<i2').reshape(-1, 2), data[:5001])
+
+
+@pytest.mark.parametrize("subtype, dtype", [("PCM_16", "<i2"), ("PCM_24", "<i4"), ("FLOAT", "<f4")])
+def test_file_round_trip(tmp_path, subtype, dtype):
+    samples = np.random.default_rng(1).uniform(-0.5, 0.5, (7000, 2)).astype(np.float32)
+    path = tmp_path / "play.wav"
+    sf.write(str(path), samples, RATE, subtype=subtype)
+    expected, _ = sf.read(str(path), dtype=np.dtype(dtype).newbyteorder('=').name, always_2d=True)
+    received, _ = play(tmp_path, PcmSource.from_file(str(path), chunk_frames=1000))
+    np.testing.assert_array_equal(np.frombuffer(received, dtype=dtype).reshape(-1, 2), expected)
+
+
+def test_failed_player_is_reported():
+    source = PcmSource.from_array(np.zeros(100, dtype=np.int16), RATE)
+    stream = PlaybackStream(LoopbackSSHClient(), "cat > /dev/null; echo busy >&2; exit 1", source)
+    assert not stream.start().wait(10)
+    assert (stream.exit_status, stream.stderr) == (1, "busy")
+
+
+@pytest.fixture
+def playlist(tmp_path):
+    paths, parts = [], []
+    for i, frames in enumerate((3000, 1234)):
+        samples = (np.arange(frames * 2, dtype=np.int16) + 1000 * i).reshape(-1, 2)
+        path = tmp_path / f"part{i}.wav"
+        sf.write(str(path), samples, RATE, subtype="PCM_16")
+        paths.append(str(path))
+        parts.append(samples)
+    return paths, np.concatenate(parts)
+
+
+def test_playlist_plays_back_to_back(tmp_path, playlist):
+    paths, expected = playlist
+    source = PcmSource.from_playlist(paths, chunk_frames=1000)
+    assert source.frames == len(expected)
+    received, _ = play(tmp_path, source)
+    np.testing.assert_array_equal(np.frombuffer(received, dtype='<i2').reshape(-1, 2), expected)
+
+
+def test_looped_playlist_stops_at_max_frames(tmp_path, playlist):
+    paths, expected = playlist
+    source = PcmSource.from_playlist(paths, loop=True, chunk_frames=1000)
+    assert source.frames is None
+    received, _ = play(tmp_path, source, max_frames=2 * len(expected) + 10)
+    np.testing.assert_array_equal(np.frombuffer(received, dtype='<i2').reshape(-1, 2),
+                                  np.concatenate([expected, expected, expected[:10]]))
+
+
+def test_playlist_needs_one_format(tmp_path, playlist):
+    paths, _ = playlist
+    other = tmp_path / "other.wav"
+    sf.write(str(other), np.zeros((100, 2), dtype=np.int16), 16000)
+    with pytest.raises(ValueError):
+        PcmSource.from_playlist(paths + [str(other)])
+    with pytest.raises(ValueError):
+        PcmSource.from_playlist([])
+
+
+def test_play_source_keeps_the_module_settings(tmp_path, monkeypatch):
+    # stand-in cras_test_client on the loopback "device", logging its arguments and the PCM it gets
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    player = bin_dir / "cras_test_client"
+    player.write_text(f"#!/bin/sh\necho \"$@\" > {tmp_path}/args\ncat > {tmp_path}/received.raw\n")
+    player.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    module = AudioModule()
+    module.ssh_client = LoopbackSSHClient()
+    module.engine = "cras"
+    monkeypatch.setattr(module, "get_cras_node", lambda device, direction="Output": "7:0")
+    settings = (module.rate, module.channels, module.audio_format)
+    data = np.arange(3000, dtype=np.int32).reshape(-1, 1)
+    assert module.play_source(PcmSource.from_array(data, 16000))
+    assert (module.rate, module.channels, module.audio_format) == settings
+    assert "--format S32_LE --rate 16000 --num_channels 1" in (tmp_path / "args").read_text()
+    np.testing.assert_array_equal(np.frombuffer((tmp_path / "received.raw").read_bytes(), dtype='<i4'), data[:, 0])
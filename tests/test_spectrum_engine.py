@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from scipy.io import wavfile
+from scipy import signal
+
+from spectrum_engine import StreamingWelch, resolution_to_nperseg, welch_file
+
+SAMPLE_RATE = 16000
+NPERSEG = 1024
+HOP = 512
+
+
+def chunked(data, size):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def noise(seconds=3.3, channels=2, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    tone = np.sin(2 * np.pi * 1000 * t)[:, None]
+    # a DC offset the constant detrend has to remove
+    return (rng.normal(0, 0.1, (len(t), channels)) + tone + 0.2).astype(np.float32)
+
+
+def assert_close_psd(psd, ref_psd):
+    err = np.max(np.abs(psd - ref_psd) / np.maximum(ref_psd, 1e-20))
+    assert err < 1e-4
+
+
+# chunk sizes below, above and not dividing the segment length and the hop
+@pytest.mark.parametrize("chunk_frames", [None, 1, 333, HOP, 4097])
+def test_matches_scipy_welch(chunk_frames):
+    data = noise()
+    welch = StreamingWelch(SAMPLE_RATE, 2, NPERSEG)
+    for block in chunked(data, chunk_frames or len(data)):
+        welch.feed(block)
+    freqs, psd = welch.finish()
+    ref_freqs, ref_psd = signal.welch(data, fs=SAMPLE_RATE, nperseg=NPERSEG, noverlap=NPERSEG - HOP, axis=0)
+    np.testing.assert_allclose(freqs, ref_freqs)
+    assert welch.n_segments == (len(data) - NPERSEG) // HOP + 1
+    assert_close_psd(psd, ref_psd.T)
+
+
+def test_too_short_stream_is_empty():
+    welch = StreamingWelch(SAMPLE_RATE, 1, NPERSEG)
+    welch.feed(np.ones(NPERSEG - 1))
+    _, psd = welch.finish()
+    assert welch.n_segments == 0
+    assert not psd.any()
+
+
+@pytest.mark.parametrize("chunk_frames", [1000, 1 << 18])
+def test_welch_file(tmp_path, chunk_frames):
+    data = (noise(channels=3) * 8000).astype(np.int16)
+    path = tmp_path / "rec.wav"
+    wavfile.write(str(path), SAMPLE_RATE, data)
+    welch = welch_file(str(path), resolution_hz=SAMPLE_RATE / NPERSEG, channels=[2, 0], chunk_frames=chunk_frames)
+    assert welch.nperseg == resolution_to_nperseg(SAMPLE_RATE, SAMPLE_RATE / NPERSEG) == NPERSEG
+    _, psd = welch.finish()
+    _, ref_psd = signal.welch(data[:, [2, 0]] / 32768.0, fs=SAMPLE_RATE, nperseg=NPERSEG, axis=0)
+    assert_close_psd(psd, ref_psd.T)
+
+
+@pytest.mark.parametrize("chunk_frames", [777, 1 << 18])
+def test_spectrogram_columns(chunk_frames):
+    data = noise(seconds=4.0, channels=1)
+    per_column = 8
+    welch = StreamingWelch(SAMPLE_RATE, 1, NPERSEG, spectrogram_sec=per_column * HOP / SAMPLE_RATE)
+    for block in chunked(data, chunk_frames):
+        welch.feed(block)
+    welch.finish()
+    times, freqs, sxx = welch.spectrogram()
+    ref_freqs, ref_times, ref_sxx = signal.spectrogram(data[:, 0], fs=SAMPLE_RATE, window='hann', nperseg=NPERSEG,
+                                                       noverlap=NPERSEG - HOP)
+    n_columns = -(-len(ref_times) // per_column)
+    assert len(ref_times) % per_column  # the last column is partial
+    assert sxx.shape == (1, len(ref_freqs), n_columns)
+    assert len(times) == n_columns
+    for col in range(n_columns):
+        segments = slice(col * per_column, (col + 1) * per_column)
+        # each column, the partial last one too, averages its segments and is centered on the samples they cover
+        assert_close_psd(sxx[0, :, col], ref_sxx[:, segments].mean(axis=1))
+        assert times[col] == pytest.approx(ref_times[segments].mean())
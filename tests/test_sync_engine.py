@@ -0,0 +1,91 @@
+import os
+import shutil
+
+import pytest
+
+from loopback import LoopbackSSHClient
+from sync_engine import SyncEngine
+
+
+def entry(sha256, mtime=100):
+    return {"size": 1, "mtime": mtime, "sha256": sha256}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return SyncEngine(LoopbackSSHClient(), cache_dir=str(tmp_path / "cache"))
+
+
+def test_diff_identical_files_are_skipped(engine):
+    assert engine.diff({"a": entry("x")}, {"a": entry("x", mtime=5)}, {}) == ([], [])
+
+
+def test_diff_one_side_changed(engine):
+    synced = {"up": "old", "down": "old"}
+    local = {"up": entry("new", mtime=1), "down": entry("old", mtime=900)}
+    remote = {"up": entry("old", mtime=900), "down": entry("new", mtime=1)}
+    # the changed side wins whatever the mtimes say
+    assert engine.diff(local, remote, synced) == (["up"], ["down"])
+
+
+@pytest.mark.parametrize("synced", [{"a": "old"}, {}])
+def test_diff_both_changed_or_never_synced_newer_wins(engine, synced):
+    assert engine.diff({"a": entry("l", mtime=200)}, {"a": entry("r", mtime=100)}, synced) == (["a"], [])
+    assert engine.diff({"a": entry("l", mtime=100)}, {"a": entry("r", mtime=200)}, synced) == ([], ["a"])
+    # same mtime, the local file is kept
+    assert engine.diff({"a": entry("l")}, {"a": entry("r")}, synced) == (["a"], [])
+
+
+def test_diff_files_on_one_side_only(engine):
+    assert engine.diff({"l": entry("x")}, {"r": entry("y")}, {}) == (["l"], ["r"])
+
+
+def test_diff_upload_and_download_modes(engine):
+    local = {"same": entry("s"), "both": entry("l"), "local": entry("x")}
+    remote = {"same": entry("s"), "both": entry("r", mtime=999), "remote": entry("y")}
+    synced = {"both": "r"}
+    # one-way modes copy every differing file of the source side, whichever changed
+    assert engine.diff(local, remote, synced, mode="upload") == (["both", "local"], [])
+    assert engine.diff(local, remote, synced, mode="download") == ([], ["both", "remote"])
+    assert engine.diff(local, remote, synced) == (["both", "local"], ["remote"])
+
+
+def write(path, text, mtime=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_sync_round_trip(engine, tmp_path):
+    local_dir, remote_dir = tmp_path / "local", tmp_path / "remote"
+    write(local_dir / "a.wav", "local a")
+    write(local_dir / "sub" / "b.wav", "local b")
+    write(remote_dir / "c.wav", "remote c")
+    result = engine.sync(str(local_dir), str(remote_dir))
+    assert (result["uploaded"], result["downloaded"]) == (["a.wav", "sub/b.wav"], ["c.wav"])
+    assert (remote_dir / "sub" / "b.wav").read_text() == "local b"
+    assert (local_dir / "c.wav").read_text() == "remote c"
+    assert engine.sync(str(local_dir), str(remote_dir)) == {"uploaded": [], "downloaded": []}
+    # a later re-recording of the same length is found by its hash
+    write(remote_dir / "c.wav", "REMOTE C", mtime=os.stat(remote_dir / "c.wav").st_mtime + 5)
+    assert engine.sync(str(local_dir), str(remote_dir), mode="download")["downloaded"] == ["c.wav"]
+    assert (local_dir / "c.wav").read_text() == "REMOTE C"
+
+
+@pytest.mark.parametrize("compress", [None, "gzip"])
+def test_ssh_client_folder_transfers_sync_by_content(engine, tmp_path, compress):
+    if compress and shutil.which(compress) is None:
+        pytest.skip(f"{compress} is not installed")
+    client = engine.ssh_client
+    client.sync_engine = engine
+    local_dir, remote_dir = tmp_path / "local", tmp_path / "remote"
+    write(local_dir / "a.wav", "local a")
+    write(local_dir / "sub" / "b.wav", "local b")
+    client._upload_file(str(local_dir), str(remote_dir))
+    assert (remote_dir / "sub" / "b.wav").read_text() == "local b"
+    # a later re-recording of the same length, which a size comparison would miss
+    write(remote_dir / "a.wav", "REMOTE A", mtime=os.stat(remote_dir / "a.wav").st_mtime + 5)
+    client._download_file(str(remote_dir) + "/", str(local_dir), compress)
+    assert (local_dir / "a.wav").read_text() == "REMOTE A"
+    assert engine.sync(str(local_dir), str(remote_dir)) == {"uploaded": [], "downloaded": []}
@@ -0,0 +1,87 @@
+import os
+
+import paramiko
+import pytest
+
+from loopback import LoopbackSSHClient, LoopbackSftp
+from transfer_engine import TransferEngine
+
+CHUNK = 64 * 1024
+
+
+class Sftp:
+    """
+    Every SFTP channel opened by the engine, failing at fail_offsets until disarmed.
+    """
+    def __init__(self):
+        self.fail_offsets = set()
+        self.offsets = []
+
+    def __call__(self, transport):
+        return LoopbackSftp(self.fail_offsets, self.offsets)
+
+
+@pytest.fixture
+def sftp(monkeypatch):
+    channels = Sftp()
+    monkeypatch.setattr(paramiko.SFTPClient, "from_transport", staticmethod(channels))
+    return channels
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "src" / "big.bin"
+    path.parent.mkdir()
+    path.write_bytes(os.urandom(3 * CHUNK + 1000))
+    return path
+
+
+def make_engine(tmp_path):
+    return TransferEngine(LoopbackSSHClient(), streams=1, chunk_bytes=CHUNK, cache_dir=str(tmp_path / "cache"))
+
+
+def test_download_resumes_missing_ranges(tmp_path, sftp, source):
+    engine = make_engine(tmp_path)
+    local_path = tmp_path / "dst" / "big.bin"
+    sftp.fail_offsets.add(2 * CHUNK)
+    assert not engine.download(str(source), str(local_path))
+    assert os.path.exists(str(local_path) + ".part")
+    assert os.path.exists(str(local_path) + ".part.json")
+    sftp.fail_offsets.clear()
+    sftp.offsets.clear()
+    assert engine.download(str(source), str(local_path))
+    # only the ranges missing after the drop are fetched again
+    assert sorted(sftp.offsets) == [2 * CHUNK, 3 * CHUNK]
+    assert local_path.read_bytes() == source.read_bytes()
+    assert int(os.path.getmtime(local_path)) == int(os.path.getmtime(source))
+    assert not os.path.exists(str(local_path) + ".part.json")
+
+
+def test_download_restarts_when_the_source_changed(tmp_path, sftp, source):
+    engine = make_engine(tmp_path)
+    local_path = tmp_path / "dst" / "big.bin"
+    sftp.fail_offsets.add(2 * CHUNK)
+    assert not engine.download(str(source), str(local_path))
+    source.write_bytes(os.urandom(3 * CHUNK + 1000))
+    os.utime(source, (os.path.getmtime(source) + 10,) * 2)
+    sftp.fail_offsets.clear()
+    sftp.offsets.clear()
+    assert engine.download(str(source), str(local_path))
+    assert sorted(sftp.offsets) == [0, CHUNK, 2 * CHUNK, 3 * CHUNK]
+    assert local_path.read_bytes() == source.read_bytes()
+
+
+def test_upload_resumes_missing_ranges(tmp_path, sftp, source):
+    engine = make_engine(tmp_path)
+    remote_path = tmp_path / "remote" / "big.bin"
+    remote_path.parent.mkdir()
+    sftp.fail_offsets.add(CHUNK)
+    assert not engine.upload(str(source), str(remote_path))
+    assert not remote_path.exists()
+    sftp.fail_offsets.clear()
+    sftp.offsets.clear()
+    assert engine.upload(str(source), str(remote_path))
+    assert sorted(sftp.offsets) == [CHUNK, 2 * CHUNK, 3 * CHUNK]
+    assert remote_path.read_bytes() == source.read_bytes()
+    assert not os.path.exists(str(remote_path) + ".part")
+    assert os.listdir(tmp_path / "cache" / "transfers") == []
@@ -0,0 +1,280 @@
+import os
+import shlex
+import shutil
+import struct
+import subprocess
+
+import numpy as np
+import pytest
+
+from wav_io import (WAVE_FORMAT_EXTENSIBLE, WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, WavReader, parse_audio_header,
+                    parse_wav_header, read_channel, resample, wav_capture_command, wav_header, wav_info)
+
+SIZE_UNSET = 0xFFFFFFFF  # 32-bit size field of RF64 files and unfinished captures
+
+
+def fmt_chunk(format_tag, channels, rate, bits, width, extensible=False):
+    block_align = channels * width
+    fields = (channels, rate, rate * block_align, block_align, bits)
+    if not extensible:
+        return b'fmt ' + struct.pack('<IHHIIHH', 16, format_tag, *fields)
+    # cbSize, valid bits, channel mask, then the sub-format GUID led by the real format tag
+    guid = struct.pack('<H', format_tag) + b'\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+    return b'fmt ' + struct.pack('<IHHIIHHHHI', 40, WAVE_FORMAT_EXTENSIBLE, *fields, 22, bits, 0) + guid
+
+
+def wav_bytes(data, channels, rate, bits, width=None, format_tag=WAVE_FORMAT_PCM, extensible=False, rf64=False,
+              extra=b'', data_size=None):
+    width = width or bits // 8
+    data_size = len(data) if data_size is None else data_size
+    chunks = fmt_chunk(format_tag, channels, rate, bits, width, extensible) + extra
+    if rf64:
+        ds64 = b'ds64' + struct.pack('<IQQQI', 28, 0, data_size, data_size // (channels * width), 0)
+        body = b'WAVE' + ds64 + chunks + b'data' + struct.pack('<I', SIZE_UNSET) + data
+        return b'RF64' + struct.pack('<I', SIZE_UNSET) + body
+    body = b'WAVE' + chunks + b'data' + struct.pack('<I', data_size) + data
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def s24_bytes(samples):
+    return b''.join(int(s).to_bytes(4, 'little', signed=True)[:3] for s in samples)
+
+
+@pytest.fixture
+def stereo_s16(tmp_path):
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-32768, 32767, size=(48000, 2), dtype=np.int16)
+    path = tmp_path / "stereo.wav"
+    path.write_bytes(wav_bytes(samples.tobytes(), 2, 48000, 16))
+    return str(path), samples
+
+
+def test_channel_views(stereo_s16):
+    path, samples = stereo_s16
+    with WavReader(path) as reader:
+        assert (reader.channels, reader.sample_rate, reader.n_frames) == (2, 48000, 48000)
+        np.testing.assert_array_equal(reader.channel(1), samples[:, 1])
+        np.testing.assert_allclose(reader.channel_float(0), samples[:, 0] / 32768.0)
+
+
+def test_read_channel_resamples(stereo_s16):
+    path, samples = stereo_s16
+    samples_read, rate = read_channel(path, 1, target_rate=16000)
+    assert rate == 16000
+    np.testing.assert_allclose(samples_read, resample(samples[:, 1] / 32768.0, 48000, 16000), atol=1e-6)
+
+
+def test_ranges_and_mix(stereo_s16):
+    path, samples = stereo_s16
+    with WavReader(path) as reader:
+        np.testing.assert_allclose(reader.channel_float(0, 100, 200), samples[100:200, 0] / 32768.0)
+        np.testing.assert_array_equal(reader.channel_float(1, normalize=False), samples[:, 1])
+        np.testing.assert_allclose(reader.mix_float(chunk_frames=1000), samples.mean(axis=1) / 32768.0, atol=1e-6)
+        starts = [start for start, _ in reader.iter_chunks(10000)]
+    assert starts == list(range(0, 48000, 10000))
+
+
+def test_s24_samples_are_sign_extended(tmp_path):
+    samples = np.array([0, 1, -1, 8388607, -8388608, 123456, -654321, 42], dtype=np.int32)
+    path = tmp_path / "s24.wav"
+    path.write_bytes(wav_bytes(s24_bytes(samples), 2, 16000, 24))
+    with WavReader(str(path)) as reader:
+        assert reader.n_frames == 4
+        np.testing.assert_array_equal(reader.channel(0), samples[0::2])
+        np.testing.assert_array_equal(reader.frames_float(normalize=False), samples.reshape(-1, 2))
+
+
+@pytest.mark.parametrize("width", [3, 4])
+def test_s24_layouts_decode_to_the_same_samples(tmp_path, width):
+    samples = np.array([0, 1, -1, 8388607, -8388608, 123456, -654321, 42], dtype=np.int32)
+    if width == 3:
+        data = s24_bytes(samples)
+    else:
+        # 24 valid bits in the upper bytes of a 4-byte container
+        data = (samples.astype('<i4') << 8).tobytes()
+    path = tmp_path / "s24.wav"
+    path.write_bytes(wav_bytes(data, 2, 16000, 24, width=width, extensible=width == 4))
+    with WavReader(str(path)) as reader:
+        assert (reader.sample_width, reader.n_frames) == (width, 4)
+        assert wav_info(str(path))["sample_fmt"] == ("S24_3LE" if width == 3 else "S24_LE")
+        np.testing.assert_array_equal(reader.channel(1), samples[1::2])
+        np.testing.assert_array_equal(reader.frames_float(normalize=False), samples.reshape(-1, 2))
+        np.testing.assert_allclose(reader.channel_float(0), samples[0::2] / 8388608.0)
+
+
+def test_u8_samples_are_centered(tmp_path):
+    data = np.array([128, 0, 255, 192, 64, 128], dtype=np.uint8)
+    path = tmp_path / "u8.wav"
+    path.write_bytes(wav_bytes(data.tobytes(), 2, 8000, 8))
+    with WavReader(str(path)) as reader:
+        assert reader.n_frames == 3
+        np.testing.assert_array_equal(reader.channel(0), [0, 127, -64])
+        np.testing.assert_array_equal(reader.frames_float(), np.array([[0, -128], [127, 64], [-64, 0]]) / 128.0)
+
+
+def test_float_samples_are_not_scaled(tmp_path):
+    samples = np.array([0.5, -0.25, 1.0, -1.0], dtype=np.float32)
+    path = tmp_path / "float.wav"
+    path.write_bytes(wav_bytes(samples.tobytes(), 1, 16000, 32, format_tag=WAVE_FORMAT_IEEE_FLOAT))
+    samples_read, rate = read_channel(str(path), 0)
+    assert rate == 16000
+    np.testing.assert_array_equal(samples_read, samples)
+
+
+def test_parse_riff_header():
+    info = parse_wav_header(wav_bytes(bytes(4 * 100), 2, 48000, 16))
+    assert info["container"] == "RIFF"
+    assert (info["channels"], info["sample_rate"], info["sample_fmt"]) == (2, 48000, "S16_LE")
+    assert (info["data_offset"], info["data_size"], info["num_frames"]) == (44, 400, 100)
+
+
+def test_parse_skips_metadata_chunks():
+    extra = b'LIST' + struct.pack('<I', 5) + b'INFOx\x00' + b'JUNK' + struct.pack('<I', 8) + bytes(8)
+    info = parse_wav_header(wav_bytes(bytes(200), 1, 16000, 16, extra=extra))
+    assert info["data_offset"] == 44 + len(extra)
+    assert info["num_frames"] == 100
+
+
+def test_parse_rf64_header():
+    data_size = 5 * 2 ** 32  # beyond the 32-bit size fields
+    header = wav_bytes(b'', 2, 48000, 32, format_tag=WAVE_FORMAT_IEEE_FLOAT, rf64=True, data_size=data_size)
+    info = parse_wav_header(header, file_size=len(header) + data_size)
+    assert info["container"] == "RF64"
+    assert info["data_size"] == data_size
+    assert info["num_frames"] == data_size // 8
+    assert info["sample_fmt"] == "FLOAT_LE"
+
+
+@pytest.mark.parametrize("format_tag, bits, width, sample_fmt", [
+    (WAVE_FORMAT_PCM, 16, 2, "S16_LE"),
+    (WAVE_FORMAT_PCM, 24, 3, "S24_3LE"),
+    (WAVE_FORMAT_PCM, 24, 4, "S24_LE"),
+    (WAVE_FORMAT_PCM, 32, 4, "S32_LE"),
+    (WAVE_FORMAT_IEEE_FLOAT, 32, 4, "FLOAT_LE"),
+])
+def test_parse_extensible_header(format_tag, bits, width, sample_fmt):
+    info = parse_wav_header(wav_bytes(bytes(6 * width * 10), 6, 48000, bits, width, format_tag, extensible=True))
+    assert info["format_tag"] == format_tag
+    assert info["sample_fmt"] == sample_fmt
+    assert info["num_frames"] == 10
+
+
+def test_extensible_s24_file(tmp_path):
+    samples = np.array([-8388608, 8388607, -2, 2, 300000, -300000], dtype=np.int32)
+    path = tmp_path / "ext24.wav"
+    path.write_bytes(wav_bytes(s24_bytes(samples), 3, 48000, 24, extensible=True))
+    assert wav_info(str(path))["sample_fmt"] == "S24_3LE"
+    with WavReader(str(path)) as reader:
+        np.testing.assert_array_equal(reader.channel(2), samples[2::3])
+
+
+@pytest.mark.parametrize("data_size", [0, SIZE_UNSET, 10 ** 6])
+def test_unset_or_truncated_data_size_uses_file_size(data_size):
+    header = wav_bytes(b'', 1, 16000, 16, data_size=data_size)
+    info = parse_wav_header(header, file_size=len(header) + 3200)
+    assert info["data_size"] == 3200
+    assert info["num_frames"] == 1600
+
+
+def test_raw_sidecar(tmp_path):
+    samples = np.arange(-300, 300, dtype=np.int16)
+    path = tmp_path / "capture.pcm"
+    path.write_bytes(samples.tobytes())
+    (tmp_path / "capture.pcm.json").write_text('{"rate": 16000, "channels": 2, "format": "s16_le"}')
+    info = wav_info(str(path))
+    assert info["container"] == "raw"
+    assert (info["channels"], info["num_frames"], info["data_offset"]) == (2, 300, 0)
+    with WavReader(str(path)) as reader:
+        np.testing.assert_array_equal(reader.channel(1), samples[1::2])
+
+
+def test_edited_sidecar_is_parsed_again(tmp_path):
+    path = tmp_path / "capture.pcm"
+    path.write_bytes(bytes(4 * 600))
+    sidecar = tmp_path / "capture.pcm.json"
+    sidecar.write_text('{"rate": 16000, "channels": 2}')
+    assert wav_info(str(path))["num_frames"] == 600
+    # the samples are untouched, only the description changes
+    sidecar.write_text('{"rate": 48000, "channels": 4}')
+    st = os.stat(sidecar)
+    os.utime(sidecar, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    info = wav_info(str(path))
+    assert (info["sample_rate"], info["channels"], info["num_frames"]) == (48000, 4, 300)
+
+
+@pytest.mark.parametrize("header, sidecar", [
+    (b'OggS' + bytes(60), None),
+    (b'RIFF' + bytes(4) + b'AVI ' + bytes(52), None),
+    (b'RIFF', None),
+    (bytes(64), {"rate": 16000, "channels": 1, "format": "MU_LAW"}),
+])
+def test_rejects_unknown_files(header, sidecar):
+    with pytest.raises(ValueError):
+        parse_audio_header(header, len(header), sidecar)
+
+
+def test_wav_info_reports_path(tmp_path):
+    path = tmp_path / "clip.mp3"
+    path.write_bytes(b'ID3' + bytes(100))
+    with pytest.raises(ValueError, match="clip.mp3"):
+        wav_info(str(path))
+
+
+@pytest.mark.parametrize("audio_format, width", [("S16_LE", 2), ("S24_3LE", 3), ("S32_LE", 4), ("FLOAT_LE", 4)])
+def test_wav_header_round_trip(audio_format, width):
+    header = wav_header(44100, 2, audio_format, data_size=8 * width)
+    assert len(header) == 44
+    info = parse_wav_header(header)
+    assert (info["channels"], info["sample_rate"], info["sample_fmt"]) == (2, 44100, audio_format)
+    assert (info["data_offset"], info["data_size"], info["num_frames"]) == (44, 8 * width, 4)
+    assert struct.unpack('<I', header[4:8])[0] == 36 + 8 * width
+
+
+def test_unfinished_capture_header_uses_file_size():
+    header = wav_header(16000, 1)
+    assert struct.unpack('<I', header[4:8])[0] == SIZE_UNSET
+    assert parse_wav_header(header, file_size=44 + 640)["num_frames"] == 320
+
+
+@pytest.mark.skipif(not all(shutil.which(tool) for tool in ("sh", "base64", "stat", "dd")),
+                    reason="needs a POSIX shell with base64, stat and dd")
+@pytest.mark.parametrize("status", [0, 3])
+def test_capture_command_writes_a_complete_wav(tmp_path, status):
+    samples = np.arange(-1000, 1000, dtype=np.int16) * 7
+    raw = tmp_path / "capture.raw"
+    raw.write_bytes(samples.tobytes())
+    path = tmp_path / "out dir" / "rec.wav"
+    path.parent.mkdir()
+    capture = f"cat {shlex.quote(str(raw))}; exit {status}"
+    result = subprocess.run(["sh", "-c", wav_capture_command(capture, str(path), 16000, 2)])
+    assert result.returncode == status
+    header = path.read_bytes()[:44]
+    # sizes are patched, not left unset for the reader to guess
+    assert struct.unpack('<I', header[4:8])[0] == 36 + samples.nbytes
+    assert struct.unpack('<I', header[40:44])[0] == samples.nbytes
+    assert not (tmp_path / "out dir" / "rec.wav.status").exists()
+    with WavReader(str(path)) as reader:
+        assert (reader.channels, reader.sample_rate, reader.n_frames) == (2, 16000, len(samples) // 2)
+        np.testing.assert_array_equal(reader.channel(0), samples[0::2])
+        np.testing.assert_array_equal(reader.channel(1), samples[1::2])
+
+
+def test_views_survive_close(stereo_s16):
+    path, samples = stereo_s16
+    reader = WavReader(path)
+    view = reader.channel(0)
+    reader.close()
+    np.testing.assert_array_equal(view, samples[:, 0])
+
+
+@pytest.mark.parametrize("rate", [48000, 44100, 22050, 16000, 8000])
+@pytest.mark.parametrize("chunk_frames", [4800, 100000])
+def test_iter_channel_matches_resample(stereo_s16, tmp_path, rate, chunk_frames):
+    _, samples = stereo_s16
+    path = tmp_path / f"{rate}.wav"
+    path.write_bytes(wav_bytes(samples.tobytes(), 2, rate, 16))
+    with WavReader(str(path)) as reader:
+        expected = resample(reader.channel_float(1), rate, 16000)
+        chunks = list(reader.iter_channel(1, chunk_frames, target_rate=16000))
+    assert all(chunk.dtype == np.float32 for chunk in chunks)
+    np.testing.assert_array_equal(np.concatenate(chunks), expected)
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import queue
+import hashlib
+import threading
+import paramiko
+
+CHUNK_BYTES = 8 * 1024 * 1024         # range size fetched/sent per request batch
+DEFAULT_STREAMS = 4                   # concurrent SFTP channels
+LARGE_FILE_BYTES = 64 * 1024 * 1024   # files from this size go through the engine instead of SCP
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class TransferEngine:
+    """
+    Parallel ranged file transfer over several SFTP channels of one SSH transport.
+    A file is split into CHUNK_BYTES ranges that worker threads move concurrently into
+    a preallocated .part file. Finished ranges are recorded in a JSON sidecar, so a
+    transfer interrupted by a dropped connection resumes from the missing ranges on
+    the next call. The result is verified against the sha256 of the source.
+    """
+    def __init__(self, ssh_client, streams=DEFAULT_STREAMS, chunk_bytes=CHUNK_BYTES, cache_dir="./cache/"):
+        self.ssh_client = ssh_client
+        self.streams = max(1, streams)
+        self.chunk_bytes = chunk_bytes
+        self.state_dir = os.path.join(cache_dir, "transfers")
+
+    def _chunks(self, size):
+        return [(i, off, min(self.chunk_bytes, size - off)) for i, off in enumerate(range(0, size, self.chunk_bytes))]
+
+    @staticmethod
+    def _load_state(path, expect):
+        """
+        Finished chunk indices from a sidecar, if it describes the same transfer.
+        """
+        try:
+            with open(path, 'r', encoding="utf-8") as f:
+                state = json.load(f)
+            if all(state.get(k) == v for k, v in expect.items()):
+                return set(state.get("done", []))
+        except (FileNotFoundError, ValueError):
+            pass
+        return set()
+
+    @staticmethod
+    def _save_state(path, expect, done):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding="utf-8") as f:
+            json.dump(dict(expect, done=sorted(done)), f)
+        os.replace(tmp_path, path)
+
+    def _run_workers(self, chunks, work, on_done):
+        """
+        Run work(sftp, chunk) over the chunks with one SFTP channel per worker.
+        Returns the first error raised by a worker, or None.
+        """
+        jobs = queue.Queue()
+        for chunk in chunks:
+            jobs.put(chunk)
+        errors = []
+
+        def worker():
+            sftp = None
+            try:
+                sftp = paramiko.SFTPClient.from_transport(self.ssh_client.client.get_transport())
+                while not errors:
+                    try:
+                        chunk = jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    work(sftp, chunk)
+                    on_done(chunk)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                if sftp is not None:
+                    sftp.close()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(self.streams, len(chunks)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return errors[0] if errors else None
+
+    def download(self, remote_path, local_path, remote_stat=None, verify=True):
+        """
+        Download remote_path to local_path, resuming a previous partial download.
+        remote_stat: stat_many() entry of remote_path, fetched if not given.
+        """
+        t0 = time.time()
+        if remote_stat is None or (verify and remote_stat.get("sha256") is None):
+            remote_stat = self.ssh_client.stat_many([remote_path], with_hash=verify)[remote_path]
+        if not remote_stat["is_file"]:
+            print(f"[ERR]: Remote file {remote_path} does not exist.")
+            return False
+        size = remote_stat["size"]
+        part_path = local_path + ".part"
+        state_path = part_path + ".json"
+        expect = {"remote": remote_path, "size": size, "mtime": remote_stat["mtime"], "chunk": self.chunk_bytes}
+        done = self._load_state(state_path, expect) if os.path.exists(part_path) else set()
+        if not done:
+            os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+        else:
+            print(f"[INFO]: Resuming download of {remote_path}, {len(done)} chunk(s) already done.")
+        chunks = [c for c in self._chunks(size) if c[0] not in done]
+        lock = threading.Lock()
+
+        def work(sftp, chunk):
+            _, off, length = chunk
+            with sftp.open(remote_path, 'rb') as rf, open(part_path, 'r+b') as lf:
+                lf.seek(off)
+                # readv pipelines the read requests of the whole range
+                for data in rf.readv([(off, length)]):
+                    lf.write(data)
+
+        def on_done(chunk):
+            with lock:
+                done.add(chunk[0])
+                self._save_state(state_path, expect, done)
+
+        error = self._run_workers(chunks, work, on_done)
+        if error is not None:
+            print(f"[ERR]: Download of {remote_path} interrupted, {len(done)} chunk(s) kept for resume: {error}")
+            return False
+        if verify and file_sha256(part_path) != remote_stat["sha256"]:
+            print(f"[ERR]: Hash mismatch after downloading {remote_path}, discarding partial file.")
+            os.remove(part_path)
+            os.remove(state_path)
+            return False
+        os.replace(part_path, local_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        os.utime(local_path, (remote_stat["mtime"], remote_stat["mtime"]))
+        elapsed = time.time() - t0
+        print(f"[INFO]: Downloaded {remote_path} ({size / 1e6:.1f} MB) in {elapsed:.1f}s, "
+              f"{size / 1e6 / max(elapsed, 1e-6):.1f} MB/s over {self.streams} streams")
+        return True
+
+    def upload(self, local_path, remote_path, verify=True):
+        """
+        Upload local_path to remote_path, resuming a previous partial upload.
+        """
+        t0 = time.time()
+        st = os.stat(local_path)
+        size = st.st_size
+        part_path = remote_path + ".part"
+        os.makedirs(self.state_dir, exist_ok=True)
+        key = hashlib.sha1(f"{self.ssh_client.hostname}:{remote_path}".encode("utf-8")).hexdigest()
+        state_path = os.path.join(self.state_dir, f"{key}.json")
+        expect = {"local": os.path.abspath(local_path), "size": size, "mtime_ns": st.st_mtime_ns,
+                  "chunk": self.chunk_bytes}
+        done = self._load_state(state_path, expect)
+        part_stat = self.ssh_client.stat_many([part_path])[part_path]
+        if not part_stat["is_file"] or part_stat["size"] != size:
+            done = set()
+        sftp = paramiko.SFTPClient.from_transport(self.ssh_client.client.get_transport())
+        try:
+            if not done:
+                with sftp.open(part_path, 'wb') as f:
+                    f.truncate(size)
+            else:
+                print(f"[INFO]: Resuming upload of {local_path}, {len(done)} chunk(s) already done.")
+            chunks = [c for c in self._chunks(size) if c[0] not in done]
+            lock = threading.Lock()
+
+            def work(worker_sftp, chunk):
+                _, off, length = chunk
+                # closing the remote file waits for every pipelined write of the range
+                with worker_sftp.open(part_path, 'r+b') as rf, open(local_path, 'rb') as lf:
+                    rf.set_pipelined(True)
+                    rf.seek(off)
+                    lf.seek(off)
+                    remaining = length
+                    while remaining > 0:
+                        data = lf.read(min(remaining, 1024 * 1024))
+                        if not data:
+                            raise EOFError(f"{local_path} changed during upload")
+                        rf.write(data)
+                        remaining -= len(data)
+
+            def on_done(chunk):
+                with lock:
+                    done.add(chunk[0])
+                    self._save_state(state_path, expect, done)
+
+            error = self._run_workers(chunks, work, on_done)
+            if error is not None:
+                print(f"[ERR]: Upload of {local_path} interrupted, {len(done)} chunk(s) kept for resume: {error}")
+                return False
+            if verify:
+                remote_hash = self.ssh_client.stat_many([part_path], with_hash=True)[part_path]["sha256"]
+                if remote_hash != file_sha256(local_path):
+                    print(f"[ERR]: Hash mismatch after uploading {local_path}, discarding partial file.")
+                    sftp.remove(part_path)
+                    os.remove(state_path)
+                    return False
+            sftp.utime(part_path, (int(st.st_atime), int(st.st_mtime)))
+            sftp.posix_rename(part_path, remote_path)
+        finally:
+            sftp.close()
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        elapsed = time.time() - t0
+        print(f"[INFO]: Uploaded {local_path} ({size / 1e6:.1f} MB) in {elapsed:.1f}s, "
+              f"{size / 1e6 / max(elapsed, 1e-6):.1f} MB/s over {self.streams} streams")
+        return True
+
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+    from ssh_client import SSHClient
+    parser = argparse.ArgumentParser(description='Benchmark parallel SFTP transfers against SCP')
+    parser.add_argument("--host", type=str, default="192.168.50.140", help="Remote host")
+    parser.add_argument("-u", "--user", type=str, default="root", help="SSH user name")
+    parser.add_argument("-p", "--password", type=str, default="test0000", help="SSH password")
+    parser.add_argument("-s", "--size-mb", type=int, default=256, help="Test file size in MB")
+    parser.add_argument("-n", "--streams", type=int, nargs='+', default=[1, 4], help="SFTP stream counts to test")
+    parser.add_argument("-r", "--remote-dir", type=str, default="/tmp", help="Remote scratch directory")
+    args = parser.parse_args()
+
+    ssh_client = SSHClient(hostname=args.host, username=args.user, password=args.password)
+    if ssh_client.connect():
+        fd, local_src = tempfile.mkstemp(suffix=".bin")
+        os.close(fd)
+        with open(local_src, 'wb') as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+        local_dst = local_src + ".back"
+        remote_path = f"{args.remote_dir}/transfer_bench.bin"
+        size_mb = args.size_mb * 1024 * 1024 / 1e6
+        try:
+            t0 = time.time()
+            ssh_client.scp_client.put(local_src, remote_path)
+            t_put = time.time() - t0
+            t0 = time.time()
+            ssh_client.scp_client.get(remote_path, local_dst)
+            t_get = time.time() - t0
+            print(f"[BENCH]: scp: upload {size_mb / t_put:.1f} MB/s, download {size_mb / t_get:.1f} MB/s")
+            for streams in args.streams:
+                engine = TransferEngine(ssh_client, streams=streams)
+                t0 = time.time()
+                engine.upload(local_src, remote_path, verify=False)
+                t_put = time.time() - t0
+                t0 = time.time()
+                engine.download(remote_path, local_dst, verify=False)
+                t_get = time.time() - t0
+                print(f"[BENCH]: sftp x{streams}: upload {size_mb / t_put:.1f} MB/s, download {size_mb / t_get:.1f} MB/s")
+        finally:
+            ssh_client.execute_command(f"rm -f {remote_path}")
+            for path in (local_src, local_dst):
+                if os.path.exists(path):
+                    os.remove(path)
+        ssh_client.close()
@@ -1170,8 +1170,8 @@ class RemoteHostApp:
         print("[INFO]: Starting audio recording...") 
         record_path = self.rec_path_combobox.get()
         ret = self.audio_module.record_audio(record_path)
-        # download the recorded file to local
-        if ret is True:
+        # download the recorded file to local, a streamed recording is already there
+        if ret is True and not self.audio_module.record_streamed:
             print(f"[INFO]: Downloading recorded audio file to local dir: {record_path}")
             remote_rec_path = self.audio_module.remote_rec_dir + os.path.basename(record_path)
             try:
@@ -1234,9 +1234,14 @@ class RemoteHostApp:
 
         threading.Thread(target=do_record).start() 
 
-    def audio_player(self) -> bool:
+    def audio_player(self, duration_sec=None) -> bool:
+        """
+        Play the selected file, or the ';' separated playlist, for duration_sec (looped to
+        fill it) through one remote player; None plays it once.
+        """
         print("[INFO]: Play recording...") 
-        audio_file = self.play_path_combobox.get()
+        audio_files = [f.strip() for f in self.play_path_combobox.get().split(";") if f.strip()]
+        audio_file = audio_files[0]
         if self.audio_module is None:
             messagebox.showerror(self.get_text("Error"), self.get_text("Audio module not initialized"))
             return False
@@ -1257,12 +1262,13 @@ class RemoteHostApp:
             print("[INFO]: Loopback device selected, playback will be looped.") 
             ret = self.audio_module.loopback_file_mode_start(audio_file)
         else:
-             ret = self.audio_module.play_audio(audio_file)
+             ret = self.audio_module.play_playlist(audio_files, duration_sec)
         return ret
         
     def audio_player_thread(self):
         play_audio_path = self.play_path_combobox.get()
-        wav_info = self.audio_module.get_wav_info(play_audio_path)
+        # all files of a playlist share the format of the first one
+        wav_info = self.audio_module.get_wav_info(play_audio_path.split(";")[0].strip())
         if wav_info is None:
             messagebox.showerror(self.get_text("Error"), self.get_text("Audio module not initialized or file type error"))
             return
@@ -1275,16 +1281,24 @@ class RemoteHostApp:
         expect_duration = 3600 if expect_duration < 0 else expect_duration   # Default to 1 hour if invalid
         
         # print(f"[INFO]: WAV Info: {wav_info}")
-        file_dur_sec_float = float(wav_info['duration'])
-        file_dur_sec = int(file_dur_sec_float) + 1 # Add 1 second buffer to avoid rounding issues
-        total_sec = max(file_dur_sec, expect_duration)
-        self.audio_module.play_dur_sec = total_sec  # Set the playback duration for the module
+        # the whole playlist plays at least once, and is looped to fill a longer expected duration
+        file_dur_sec = wav_info['num_frames'] / wav_info['sample_rate']
+        for audio_file in [f.strip() for f in play_audio_path.split(";") if f.strip()][1:]:
+            info = self.audio_module.get_wav_info(audio_file)
+            if info is None:
+                messagebox.showerror(self.get_text("Error"), self.get_text("Audio module not initialized or file type error"))
+                return
+            file_dur_sec += info['num_frames'] / info['sample_rate']
+        # the stream is cut at the exact frame, the player does not need a duration,
+        # and the progress bar runs for the same time
+        total_sec = play_sec = max(file_dur_sec, expect_duration)
+        self.audio_module.play_dur_sec = 0
         sample_rate = self.audio_module.rate = int(wav_info['sample_rate'])
         channels = self.audio_module.channels = int(wav_info['channels'])
         sample_fmt = self.audio_module.audio_format = wav_info['sample_fmt']
         self.file_type = 'wav'  # Set file type from WAV info
         print(f"[INFO]: Audio file: {play_audio_path}, Sample Rate: {sample_rate}, Channels: {channels}, Sample Format: {sample_fmt}", 
-              f"Duration: {total_sec} sec")
+              f"Duration: {total_sec:.2f} sec")
         self.play_progress_running = True
         device = self.play_device_var.get()
 
@@ -1315,12 +1329,8 @@ class RemoteHostApp:
                     time.sleep(1)
                 self.audio_module.loopback_file_mode_stop()
             else:
-                while self.play_progress_running and  self.audio_module.play_dur_sec > 0:
-                    ret = self.audio_player()
-                    self.audio_module.play_dur_sec -= file_dur_sec 
-                    if not ret:
-                        print("[ERR]: Playback failed") 
-                        break
+                # one long-lived player fed with the looped stream, no gap between passes
+                ret = self.audio_player(play_sec)
             self.play_progress_running = False 
             self.play_progress.stop()
 
@@ -1625,7 +1635,7 @@ class RemoteHostApp:
             if not result:
                 print("[INFO]: Sync operation cancelled by user")
                 return False
-            self.ssh_client.sync_files(remote_dirs, local_dirs, mode)
+            self.ssh_client.sync_files(local_dirs, remote_dirs, mode)
 
         else:  # merge
             print("[sync]: Merging local → remote → local...")
@@ -0,0 +1,423 @@
+import os
+import json
+import shlex
+import base64
+import struct
+import hashlib
+from functools import lru_cache
+from math import gcd
+import numpy as np
+from scipy import signal
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+SIZE_UNSET = 0xFFFFFFFF              # 32-bit size field of RF64 files and unfinished captures
+HEADER_PROBE_BYTES = 64 * 1024       # enough to reach the data chunk behind LIST/bext/JUNK chunks
+RAW_SIDECAR_SUFFIX = ".json"         # raw PCM "x.pcm" is described by "x.pcm.json"
+
+# ALSA sample format of raw PCM -> (format tag, bits per sample, bytes per sample)
+RAW_FORMATS = {
+    "U8": (WAVE_FORMAT_PCM, 8, 1),
+    "S16_LE": (WAVE_FORMAT_PCM, 16, 2),
+    "S24_3LE": (WAVE_FORMAT_PCM, 24, 3),
+    "S32_LE": (WAVE_FORMAT_PCM, 32, 4),
+    "FLOAT_LE": (WAVE_FORMAT_IEEE_FLOAT, 32, 4),
+    "FLOAT64_LE": (WAVE_FORMAT_IEEE_FLOAT, 64, 8),
+}
+
+
+def sample_format_name(format_tag, bits_per_sample, sample_width):
+    """
+    ALSA name of a sample format (S16_LE, S24_3LE, S32_LE, FLOAT_LE...), as aplay/arecord take it.
+    """
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        return "FLOAT_LE" if bits_per_sample == 32 else "FLOAT64_LE"
+    if bits_per_sample == 8:
+        return "U8"
+    if bits_per_sample == 24:
+        return "S24_3LE" if sample_width == 3 else "S24_LE"
+    return f"S{bits_per_sample}_LE"
+
+
+def _header_info(container, format_tag, channels, sample_rate, bits_per_sample, block_align, data_offset,
+                 data_size, file_size):
+    if channels == 0 or block_align == 0:
+        raise ValueError("no fmt chunk")
+    # streamed captures leave the data size unset (0 or 0xFFFFFFFF), trust the file size
+    if file_size is not None and (data_size == 0 or data_size > file_size - data_offset):
+        data_size = max(0, file_size - data_offset)
+    num_frames = data_size // block_align
+    return {
+        "container": container,
+        "format_tag": format_tag,
+        "channels": channels,
+        "sample_rate": sample_rate,
+        "bits_per_sample": bits_per_sample,
+        "block_align": block_align,
+        "data_offset": data_offset,
+        "data_size": data_size,
+        "num_frames": num_frames,
+        "duration": num_frames / sample_rate if sample_rate else 0.0,
+        "sample_fmt": sample_format_name(format_tag, bits_per_sample, block_align // channels),
+    }
+
+
+def parse_wav_header(header, file_size=None):
+    """
+    Parse a RIFF/WAVE or RF64 header from the first bytes of a file (HEADER_PROBE_BYTES is
+    enough), WAVE_FORMAT_EXTENSIBLE is resolved to its sub-format.
+    file_size: full size of the file, used when the data size is unset or truncated.
+    Returns the format and layout as a dict (channels, sample_rate, sample_fmt, data_offset...).
+    """
+    if len(header) < 12:
+        raise ValueError("file too short for a WAV header")
+    riff, _, wave_id = struct.unpack('<4sI4s', header[:12])
+    if riff not in (b'RIFF', b'RF64', b'BW64') or wave_id != b'WAVE':
+        raise ValueError("not a RIFF/WAVE file")
+    format_tag = channels = sample_rate = block_align = bits_per_sample = 0
+    ds64_data_size = None
+    pos = 12
+    while pos + 8 <= len(header):
+        chunk_id, chunk_size = struct.unpack('<4sI', header[pos:pos + 8])
+        pos += 8
+        if chunk_id == b'ds64':
+            # RF64: 64-bit RIFF and data sizes replace the 0xFFFFFFFF 32-bit ones
+            _, ds64_data_size = struct.unpack('<QQ', header[pos:pos + 16])
+        elif chunk_id == b'fmt ':
+            fmt = header[pos:pos + chunk_size]
+            format_tag, channels, sample_rate, _, block_align, bits_per_sample = struct.unpack('<HHIIHH', fmt[:16])
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                # first two bytes of the sub-format GUID hold the real format tag
+                format_tag = struct.unpack('<H', fmt[24:26])[0]
+        elif chunk_id == b'data':
+            data_size = chunk_size
+            if chunk_size == SIZE_UNSET and ds64_data_size is not None:
+                data_size = ds64_data_size
+            return _header_info(riff.decode().strip(), format_tag, channels, sample_rate, bits_per_sample,
+                                block_align, pos, data_size, file_size)
+        pos += chunk_size + (chunk_size % 2)
+    raise ValueError("no data chunk in the header")
+
+
+def parse_raw_sidecar(desc, file_size):
+    """
+    Layout of a raw PCM file from its sidecar description {"rate", "channels", "format"}
+    (ALSA format name, S16_LE by default, optional "offset" of the first sample).
+    """
+    audio_format = str(desc.get("format", "S16_LE")).upper()
+    if audio_format not in RAW_FORMATS:
+        raise ValueError(f"unsupported raw format {audio_format}")
+    format_tag, bits, width = RAW_FORMATS[audio_format]
+    channels = int(desc["channels"])
+    return _header_info("raw", format_tag, channels, int(desc.get("rate", desc.get("sample_rate", 0))), bits,
+                        width * channels, int(desc.get("offset", 0)), 0, file_size)
+
+
+def parse_audio_header(header, file_size=None, sidecar=None):
+    """
+    parse_wav_header, or parse_raw_sidecar for a headerless file described by sidecar
+    (the JSON text or dict of "<file>.json").
+    """
+    if header[:4] in (b'RIFF', b'RF64', b'BW64') or not sidecar:
+        return parse_wav_header(header, file_size)
+    if isinstance(sidecar, (str, bytes)):
+        sidecar = json.loads(sidecar)
+    return parse_raw_sidecar(sidecar, file_size)
+
+
+def wav_header(rate, channels, audio_format="S16_LE", data_size=SIZE_UNSET):
+    """
+    Canonical 44-byte WAV header for raw PCM of an ALSA format (RAW_FORMATS). The default
+    unset data size is what a capture still running leaves, readers take the file size.
+    """
+    format_tag, bits, width = RAW_FORMATS[audio_format.upper()]
+    riff_size = SIZE_UNSET if data_size >= SIZE_UNSET - 36 else data_size + 36
+    return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', riff_size, b'WAVE', b'fmt ', 16, format_tag, channels,
+                       rate, rate * channels * width, channels * width, bits, b'data', min(data_size, SIZE_UNSET))
+
+
+def wav_capture_command(capture_command, path, rate, channels, audio_format="S16_LE"):
+    """
+    Device shell command recording the raw PCM that capture_command writes to stdout
+    straight into a WAV file: the header is written first, the samples appended behind it
+    and the RIFF/data sizes patched in place (dd) once the capture ends, so the recording
+    is written once, with no conversion pass. Returns the exit status of the capture.
+    """
+    header = base64.b64encode(wav_header(rate, channels, audio_format)).decode()
+    le32 = ("le32() { printf \"$(printf '\\\\%03o\\\\%03o\\\\%03o\\\\%03o' $(($1 & 255)) $(($1 >> 8 & 255)) "
+            "$(($1 >> 16 & 255)) $(($1 >> 24 & 255)))\"; }")
+    return (
+        f"f={shlex.quote(path)}; echo {header} | base64 -d > \"$f\" || exit 1; "
+        # piped: some tools reopen /dev/fd/N, which would truncate a regular file
+        f"{{ ({capture_command}); echo $? >\"$f.status\"; }} | cat >> \"$f\"; "
+        f"s=$(cat \"$f.status\"); rm -f \"$f.status\"; n=$(($(stat -c %s \"$f\") - 44)); "
+        f"if [ $n -lt {SIZE_UNSET - 36} ]; then {le32}; "
+        f"le32 $((n + 36)) | dd of=\"$f\" bs=1 seek=4 count=4 conv=notrunc 2>/dev/null; "
+        f"le32 $n | dd of=\"$f\" bs=1 seek=40 count=4 conv=notrunc 2>/dev/null; fi; exit $s"
+    )
+
+
+@lru_cache(maxsize=1024)
+def _cached_info(path, size, mtime_ns, sidecar_mtime_ns):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_PROBE_BYTES)
+    sidecar = None
+    if os.path.isfile(path + RAW_SIDECAR_SUFFIX):
+        with open(path + RAW_SIDECAR_SUFFIX, 'r', encoding="utf-8") as f:
+            sidecar = f.read()
+    try:
+        if sidecar is None and len(header) == HEADER_PROBE_BYTES and b'data' not in header:
+            # metadata chunks larger than the probe before the samples
+            with open(path, 'rb') as f:
+                header = f.read(min(size, 64 * HEADER_PROBE_BYTES))
+        return parse_audio_header(header, size, sidecar)
+    except (ValueError, KeyError, struct.error) as e:
+        raise ValueError(f"{path}: {e}") from None
+
+
+def wav_info(path):
+    """
+    Header information of a WAV (RIFF, RF64, EXTENSIBLE) or a raw PCM file with a JSON
+    sidecar ({"rate", "channels", "format"}), parsed in process and memoized by
+    (path, size, mtime, sidecar mtime). Raises ValueError for other files.
+    """
+    st = os.stat(path)
+    try:
+        sidecar_mtime_ns = os.stat(path + RAW_SIDECAR_SUFFIX).st_mtime_ns
+    except FileNotFoundError:
+        sidecar_mtime_ns = None
+    return dict(_cached_info(os.path.abspath(path), st.st_size, st.st_mtime_ns, sidecar_mtime_ns))
+
+
+@lru_cache(maxsize=256)
+def _cached_sha256(path, size, mtime_ns):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_digest(path):
+    """
+    sha256 of a file's content, memoized by (path, size, mtime).
+    """
+    st = os.stat(path)
+    return _cached_sha256(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+class WavReader:
+    """
+    Memory-mapped reader for PCM WAV files (U8/S16/S24/S32/float, any channel count),
+    RF64 files and raw PCM files with a sidecar (see wav_info).
+    Only the RIFF header is parsed on open; sample data is mapped from the data chunk,
+    and channels are returned as strided views without copying the other channels.
+    Conversion to float only happens on the frames that are asked for.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.channels = 0
+        self.sample_rate = 0
+        self.bits_per_sample = 0
+        self.format_tag = 0
+        self.data_offset = 0
+        self.data_size = 0
+        self._parse_header()
+        self.n_frames = self.data_size // self.block_align
+        self.duration = self.n_frames / self.sample_rate if self.sample_rate else 0.0
+        # bytes per sample, 24-bit samples come packed (3) or in a 4-byte container
+        self.sample_width = self.block_align // self.channels
+        self.dtype = self._numpy_dtype()
+        if self.n_frames == 0:
+            # empty files cannot be mapped
+            shape = (0, self.channels, 3) if self.sample_width == 3 else (0, self.channels)
+            self.data = np.zeros(shape, dtype=np.uint8 if self.sample_width == 3 else self.dtype)
+        elif self.sample_width == 3:
+            # 24-bit samples have no numpy dtype, map the raw bytes of each sample
+            self.data = np.memmap(path, dtype=np.uint8, mode='r', offset=self.data_offset,
+                                  shape=(self.n_frames, self.channels, 3))
+        else:
+            self.data = np.memmap(path, dtype=self.dtype, mode='r', offset=self.data_offset,
+                                  shape=(self.n_frames, self.channels))
+        # integer value of full scale once decoded, float samples are already in [-1, 1]
+        self.full_scale = 1.0 if self.dtype.kind == 'f' else float(1 << (self.bits_per_sample - 1))
+
+    def _parse_header(self):
+        info = wav_info(self.path)
+        self.format_tag = info["format_tag"]
+        self.channels = info["channels"]
+        self.sample_rate = info["sample_rate"]
+        self.block_align = info["block_align"]
+        self.bits_per_sample = info["bits_per_sample"]
+        self.data_offset = info["data_offset"]
+        self.data_size = info["data_size"]
+
+    def _numpy_dtype(self):
+        layout = (self.format_tag, self.bits_per_sample, self.sample_width)
+        if layout == (WAVE_FORMAT_PCM, 8, 1):
+            # unsigned, decoded to int16 around 0
+            return np.dtype('u1')
+        if layout == (WAVE_FORMAT_PCM, 16, 2):
+            return np.dtype('<i2')
+        if layout in ((WAVE_FORMAT_PCM, 24, 3), (WAVE_FORMAT_PCM, 24, 4), (WAVE_FORMAT_PCM, 32, 4)):
+            # 24-bit samples are decoded to int32
+            return np.dtype('<i4')
+        if layout == (WAVE_FORMAT_IEEE_FLOAT, 32, 4):
+            return np.dtype('<f4')
+        if layout == (WAVE_FORMAT_IEEE_FLOAT, 64, 8):
+            return np.dtype('<f8')
+        raise ValueError(f"Unsupported WAV format tag {self.format_tag} with {self.bits_per_sample} bits "
+                         f"in {self.sample_width} bytes")
+
+    def _check_channel(self, idx):
+        if idx < 0 or idx >= self.channels:
+            raise IndexError(f"Channel {idx} out of range, file has {self.channels} channels")
+
+    def _decode_s24(self, raw):
+        """
+        Sign-extend packed little-endian 24-bit samples (..., 3) to int32.
+        """
+        padded = np.zeros(raw.shape[:-1] + (4,), dtype=np.uint8)
+        padded[..., 1:] = raw
+        return padded.view('<i4')[..., 0] >> 8
+
+    def _decode(self, raw):
+        """
+        Mapped samples (..., channels) to their signed integer or float values.
+        """
+        if self.sample_width == 3:
+            return self._decode_s24(raw)
+        if self.bits_per_sample == 24:
+            # 24 valid bits in the upper bytes of the 4-byte container
+            return raw >> 8
+        if self.bits_per_sample == 8:
+            return raw.astype(np.int16) - 128
+        return raw
+
+    def channel(self, idx, start=0, stop=None):
+        """
+        Samples of one channel in the file's integer/float scale.
+        Zero-copy strided view, except for 8/24-bit files where only this range is decoded.
+        """
+        self._check_channel(idx)
+        return self._decode(self.data[start:stop, idx])
+
+    def channel_float(self, idx, start=0, stop=None, normalize=True):
+        """
+        One channel converted to float32, only this channel and range are copied.
+        normalize: scale to [-1, 1), otherwise keep the integer sample values.
+        """
+        view = self.channel(idx, start, stop)
+        samples = view.astype(np.float32)
+        if normalize and self.full_scale != 1.0:
+            samples *= np.float32(1.0 / self.full_scale)
+        return samples
+
+    def frames_float(self, start=0, stop=None, channels=None, normalize=True):
+        """
+        Frames [start, stop) of the selected channels as a float32 (n, len(channels)) array.
+        """
+        channels = list(range(self.channels)) if channels is None else list(channels)
+        for idx in channels:
+            self._check_channel(idx)
+        block = self._decode(self.data[start:stop, channels]).astype(np.float32)
+        if normalize and self.full_scale != 1.0:
+            block *= np.float32(1.0 / self.full_scale)
+        return block
+
+    def iter_chunks(self, chunk_frames, channels=None, normalize=True):
+        """
+        Yield (start_frame, float32 (n, len(channels)) block) over the whole file,
+        so memory use is bounded by chunk_frames whatever the file length.
+        """
+        chunk_frames = max(1, int(chunk_frames))
+        for start in range(0, self.n_frames, chunk_frames):
+            yield start, self.frames_float(start, start + chunk_frames, channels, normalize)
+
+    def iter_channel(self, idx, chunk_frames, target_rate=None, normalize=True):
+        """
+        Yield one channel as float32 chunks resampled to target_rate, the same samples as
+        resample(channel_float(idx)) with memory bounded by chunk_frames.
+        """
+        if not target_rate or target_rate == self.sample_rate:
+            for start in range(0, self.n_frames, max(1, int(chunk_frames))):
+                yield self.channel_float(idx, start, start + chunk_frames, normalize)
+            return
+        g = gcd(self.sample_rate, target_rate)
+        up, down = target_rate // g, self.sample_rate // g
+        # chunks and their filter context start on multiples of down, so every chunk maps
+        # to whole output samples; the context covers the resample_poly filter half length
+        chunk_frames = max(down, int(chunk_frames) // down * down)
+        pad = -(-(10 * max(up, down) // up + 1) // down) * down
+        for start in range(0, self.n_frames, chunk_frames):
+            stop = min(start + chunk_frames, self.n_frames)
+            lo = max(start - pad, 0)
+            segment = self.channel_float(idx, lo, min(stop + pad, self.n_frames), normalize)
+            out = signal.resample_poly(segment, up, down)
+            first = (start - lo) * up // down
+            yield out[first:first + -(-stop * up // down) - start * up // down].astype(np.float32)
+
+    def mix_float(self, channels=None, normalize=True, chunk_frames=1 << 20):
+        """
+        Average of the selected channels as one float32 signal, computed chunk by chunk.
+        """
+        if self.channels == 1 and channels is None:
+            return self.channel_float(0, normalize=normalize)
+        mono = np.empty(self.n_frames, dtype=np.float32)
+        for start, block in self.iter_chunks(chunk_frames, channels, normalize):
+            mono[start:start + len(block)] = block.mean(axis=1)
+        return mono
+
+    def close(self):
+        """
+        Drop the mapping. Views returned by channel() stay valid, the file is unmapped
+        once the last of them is garbage collected.
+        """
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def resample(signal_data, orig_rate, target_rate):
+    """
+    Polyphase resampling, returns the input untouched if the rates match.
+    """
+    if orig_rate == target_rate:
+        return signal_data
+    g = gcd(orig_rate, target_rate)
+    return signal.resample_poly(signal_data, target_rate // g, orig_rate // g).astype(np.float32)
+
+
+def read_channel(path, idx, target_rate=None, normalize=True):
+    """
+    Read one channel of a WAV file as float32, resampled to target_rate if given.
+    normalize: scale to [-1, 1), otherwise keep the integer sample values.
+    Returns (samples, sample_rate).
+    """
+    with WavReader(path) as reader:
+        samples = reader.channel_float(idx, normalize=normalize)
+        rate = reader.sample_rate
+    if target_rate and target_rate != rate:
+        samples = resample(samples, rate, target_rate)
+        rate = target_rate
+    return samples, rate
+
+
+def read_mono(path, target_rate=None, channels=None, normalize=True):
+    """
+    Read the average of the selected channels (all by default) as float32,
+    resampled to target_rate if given. Returns (samples, sample_rate).
+    """
+    with WavReader(path) as reader:
+        samples = reader.mix_float(channels, normalize=normalize)
+        rate = reader.sample_rate
+    if target_rate and target_rate != rate:
+        samples = resample(samples, rate, target_rate)
+        rate = target_rate
+    return samples, rate